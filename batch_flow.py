@@ -0,0 +1,120 @@
+"""Fluxo máximo em lote para muitos pares (origem, destino).
+
+A rede é congelada uma vez por versão num ``BaseGraph`` (colunas tipadas já
+serializadas) e os pares são divididos em blocos resolvidos num
+``ProcessPoolExecutor``. Cada processo monta o grafo residual uma única vez
+por versão e, entre um par e outro, só zera o fluxo e as rotas bloqueadas.
+"""
+import os
+import pickle
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from flow_engine import ResidualGraph, max_flow
+
+# Blocos por processo: mais blocos equilibram melhor a carga e deixam os
+# resultados saírem antes, menos blocos reduzem o custo de comunicação.
+CHUNKS_PER_WORKER = 4
+# Abaixo disso (pares x arestas) não compensa sair do processo
+INLINE_WORK = 50_000
+WORKERS = os.cpu_count() or 1
+
+_executor = None
+_base = None
+_grafos = {}
+
+
+class BaseGraph:
+    """Fotografia imutável da rede numa versão, pronta para enviar aos processos."""
+
+    def __init__(self, versao, vertex_ids, arestas):
+        self.versao = versao
+        self.num_edges = len(arestas)
+        self.blob = pickle.dumps((
+            array('q', vertex_ids),
+            array('q', [a.origem_id for a in arestas]),
+            array('q', [a.destino_id for a in arestas]),
+            array('q', [a.capacidade for a in arestas]),
+        ), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def base_graph(store):
+    """``BaseGraph`` da versão atual do store, reaproveitado enquanto ela não muda."""
+    global _base
+    if _base is None or _base.versao != store.versao:
+        _base = BaseGraph(store.versao, list(store.vertices), store.list_arestas())
+    return _base
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=WORKERS)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def _grafo(versao, blob, grafos):
+    cached = grafos.get(versao)
+    if cached is None:
+        grafos.clear()
+        vertex_ids, origens, destinos, capacidades = pickle.loads(blob)
+        index = {vid: i for i, vid in enumerate(vertex_ids)}
+        edges = []
+        rotas = defaultdict(list)
+        for i, (u, v, c) in enumerate(zip(origens, destinos, capacidades)):
+            edges.append((index.setdefault(u, len(index)), index.setdefault(v, len(index)), c))
+            rotas[f"{u}-{v}"].append(i)
+        cached = grafos[versao] = (ResidualGraph(len(index), edges), index, rotas)
+    return cached
+
+
+def solve_chunk(versao, blob, pares, solver=None, grafos=_grafos):
+    """Resolve ``pares`` de ``(i, origem, destino, bloqueadas)`` sobre a rede da versão.
+
+    Roda dentro dos processos do pool, reaproveitando o grafo montado em
+    ``grafos``; devolve ``(i, fluxo)`` para cada par.
+    """
+    graph, index, rotas = _grafo(versao, blob, grafos)
+    resultados = []
+    for i, origem, destino, bloqueadas in pares:
+        s, t = index.get(origem), index.get(destino)
+        if s is None or t is None or s == t:
+            resultados.append((i, 0))
+            continue
+        arcs = [graph.edge_arc[e] for key in bloqueadas for e in rotas.get(key, ())]
+        salvas = [graph.cap[a] for a in arcs]
+        for a in arcs:
+            graph.cap[a] = 0
+        graph.reset()
+        resultados.append((i, max_flow(graph, s, t, solver)))
+        for a, c in zip(arcs, salvas):
+            graph.cap[a] = c
+    return resultados
+
+
+async def solve_batch(calculos, base, pares, solver=None):
+    """Distribui os pares pelo pool e entrega os resultados bloco a bloco, na ordem em que terminam.
+
+    Os blocos passam por ``calculos`` (um ``compute.ComputeExecutor``), com a
+    mesma fila limitada e o mesmo tempo máximo dos outros cálculos.
+    """
+    if not pares:
+        return
+    if len(pares) * max(base.num_edges, 1) < INLINE_WORK:
+        # Em thread o grafo não pode ser compartilhado com outras requisições
+        yield await calculos.run(solve_chunk, base.versao, base.blob, pares, solver, {})
+        return
+
+    blocos = WORKERS * CHUNKS_PER_WORKER
+    tamanho = -(-len(pares) // blocos)
+    chamadas = [(base.versao, base.blob, pares[i:i + tamanho], solver) for i in range(0, len(pares), tamanho)]
+    async for resultados in calculos.map(solve_chunk, chamadas, process=True):
+        yield resultados
@@ -0,0 +1,422 @@
+"""Benchmark reprodutível dos solvers de fluxo e dos endpoints da API.
+
+Gera uma rede sintética (camadas depósito → hub → zona, grade ou aleatória),
+mede cada solver e cada endpoint no próprio processo e imprime um JSON com
+vazão, percentis de latência e pico de memória de cada medição. Com a mesma
+semente a rede é sempre a mesma, então JSONs de versões diferentes podem ser
+comparados com ``--baseline``.
+
+Exemplos::
+
+    python benchmark.py --topology layered --vertices 2000 --edges 10000 > atual.json
+    python benchmark.py --topology grid --vertices 2500 --only max_flow
+    python benchmark.py --baseline atual.json --max-regression 1.25
+
+As latências são medidas sem ``tracemalloc`` (que deixa o Python bem mais
+lento); o pico de memória vem de uma execução extra, instrumentada.
+Antes de cada chamada aos endpoints de fluxo uma aresta muda de capacidade,
+fora da medição, para que o resultado não saia do cache da versão.
+"""
+import argparse
+import gc
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import orjson
+
+from flow_engine import SOLVERS, IncrementalMaxFlow, MinCostFlow, MultiCommodityFlow, ResidualGraph, INF, max_flow
+
+TOPOLOGIES = ("layered", "grid", "random")
+CAPACITY_DISTRIBUTIONS = ("uniform", "lognormal", "bimodal", "constant")
+PERCENTIS = (50, 90, 99)
+# Zonas com demanda própria no benchmark de multicommodity (cada uma é uma commodity)
+MAX_COMMODITIES = 50
+
+
+class SyntheticNetwork:
+    """Rede gerada: linhas no formato de ``bulk_io`` mais as fontes e os sumidouros."""
+
+    def __init__(self, topology, vertices, arestas):
+        self.topology = topology
+        self.vertices = vertices
+        self.arestas = arestas
+        self.sources = [v["vertice_id"] for v in vertices if v["type"] == "storage"]
+        self.sinks = [v["vertice_id"] for v in vertices if v["type"] == "delivery_zone"]
+
+    def edges(self):
+        return [(a["aresta_id"], a["origem_id"], a["destino_id"], a["capacidade"]) for a in self.arestas]
+
+    def ndjson(self):
+        return b"\n".join(orjson.dumps(row) for row in self.vertices + self.arestas) + b"\n"
+
+    def describe(self):
+        return {
+            "topology": self.topology,
+            "vertices": len(self.vertices),
+            "arestas": len(self.arestas),
+            "depositos": len(self.sources),
+            "zonas": len(self.sinks),
+            "capacidade_total": sum(a["capacidade"] for a in self.arestas),
+        }
+
+
+def capacity_sampler(distribution, rng, cap_max=1000):
+    """Sorteador de capacidades inteiras em ``[1, cap_max]``."""
+    if distribution == "uniform":
+        return lambda: rng.randint(1, cap_max)
+    if distribution == "lognormal":
+        # Mediana em ~cap_max/20, cauda longa até cap_max
+        mu = math.log(max(cap_max / 20, 1))
+        return lambda: max(1, min(cap_max, int(rng.lognormvariate(mu, 1.0))))
+    if distribution == "bimodal":
+        # Muitas rotas locais pequenas e algumas troncais grandes
+        return lambda: rng.randint(cap_max // 2, cap_max) if rng.random() < 0.1 else rng.randint(1, max(cap_max // 20, 1))
+    if distribution == "constant":
+        return lambda: cap_max
+    raise ValueError(f"distribuição de capacidade desconhecida: {distribution}")
+
+
+def _vertices(tipos):
+    return [
+        {"vertice_id": i, "name": f"{tipo} {i}", "type": tipo}
+        for i, tipo in enumerate(tipos)
+    ]
+
+
+def _arestas(pares, capacidade, rng):
+    prioridades = (1, 2, 3)
+    return [
+        {
+            "aresta_id": i,
+            "origem_id": u,
+            "destino_id": v,
+            "capacidade": capacidade(),
+            "uso": 0,
+            "priority": rng.choice(prioridades),
+        }
+        for i, (u, v) in enumerate(pares, start=1)
+    ]
+
+
+def layered(n_vertices, n_edges, capacidade, rng):
+    """Depósitos (5%) → hubs (25%) → zonas de entrega (o resto).
+
+    Todo hub recebe de algum depósito e toda zona de algum hub; as arestas
+    restantes se dividem entre depósito→hub, hub→hub e hub→zona.
+    """
+    n_vertices = max(n_vertices, 3)
+    depositos = max(1, round(n_vertices * 0.05))
+    hubs = max(1, round(n_vertices * 0.25))
+    zonas = max(1, n_vertices - depositos - hubs)
+    tipos = ["storage"] * depositos + ["hub"] * hubs + ["delivery_zone"] * zonas
+    D = range(depositos)
+    H = range(depositos, depositos + hubs)
+    Z = range(depositos + hubs, len(tipos))
+
+    pares = [(rng.choice(D), h) for h in H] + [(rng.choice(H), z) for z in Z]
+    for _ in range(max(0, n_edges - len(pares))):
+        r = rng.random()
+        if r < 0.2:
+            pares.append((rng.choice(D), rng.choice(H)))
+        elif r < 0.4 and hubs > 1:
+            u, v = rng.sample(H, 2)
+            pares.append((u, v))
+        else:
+            pares.append((rng.choice(H), rng.choice(Z)))
+    return SyntheticNetwork("layered", _vertices(tipos), _arestas(pares, capacidade, rng))
+
+
+def grid(n_vertices, n_edges, capacidade, rng):
+    """Grade quadrada com ~``n_vertices`` vértices e arestas nos dois sentidos.
+
+    A primeira coluna são depósitos e a última zonas de entrega; ``n_edges``
+    é ignorado (fica em ~4V).
+    """
+    lado = max(2, round(math.sqrt(n_vertices)))
+    tipos = [
+        "storage" if c == 0 else "delivery_zone" if c == lado - 1 else "hub"
+        for r in range(lado) for c in range(lado)
+    ]
+    pares = []
+    for r in range(lado):
+        for c in range(lado):
+            u = r * lado + c
+            if c + 1 < lado:
+                pares += [(u, u + 1), (u + 1, u)]
+            if r + 1 < lado:
+                pares += [(u, u + lado), (u + lado, u)]
+    return SyntheticNetwork("grid", _vertices(tipos), _arestas(pares, capacidade, rng))
+
+
+def random_graph(n_vertices, n_edges, capacidade, rng):
+    """Arestas sorteadas entre quaisquer dois vértices distintos.
+
+    Os primeiros 5% dos vértices são depósitos e os últimos 20% zonas.
+    """
+    n_vertices = max(n_vertices, 2)
+    depositos = max(1, n_vertices // 20)
+    zonas = max(1, n_vertices // 5)
+    tipos = [
+        "storage" if i < depositos else "delivery_zone" if i >= n_vertices - zonas else "hub"
+        for i in range(n_vertices)
+    ]
+    pares = []
+    for _ in range(n_edges):
+        u, v = rng.sample(range(n_vertices), 2)
+        pares.append((u, v))
+    return SyntheticNetwork("random", _vertices(tipos), _arestas(pares, capacidade, rng))
+
+
+GENERATORS = {"layered": layered, "grid": grid, "random": random_graph}
+
+
+def generate(topology="layered", n_vertices=1000, n_edges=5000, capacity="uniform", cap_max=1000, seed=0):
+    rng = random.Random(seed)
+    return GENERATORS[topology](n_vertices, n_edges, capacity_sampler(capacity, rng, cap_max), rng)
+
+
+# Medição
+
+def _percentil(ordenados, p):
+    # Posto mais próximo: sempre um valor que de fato foi medido
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def measure(fn, repeat=5, warmup=1, prepare=None):
+    """Latência, vazão e pico de memória de ``fn()``.
+
+    ``prepare()`` roda antes de cada chamada, fora da medição.
+    """
+    for _ in range(warmup):
+        if prepare:
+            prepare()
+        fn()
+
+    tempos = []
+    gc.collect()
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+
+    if prepare:
+        prepare()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ordenados = sorted(tempos)
+    total = sum(tempos)
+    resultado = {
+        "runs": repeat,
+        "mean_ms": round(1000 * total / repeat, 3),
+        "min_ms": round(1000 * ordenados[0], 3),
+        "max_ms": round(1000 * ordenados[-1], 3),
+        "throughput_per_s": round(repeat / total, 2) if total else None,
+        "peak_memory_bytes": pico,
+    }
+    for p in PERCENTIS:
+        resultado[f"p{p}_ms"] = round(1000 * _percentil(ordenados, p), 3)
+    return resultado
+
+
+# Solvers
+
+def _grafo_com_terminais(rede):
+    index = {v["vertice_id"]: i for i, v in enumerate(rede.vertices)}
+    n = len(index)
+    edges = [(index[u], index[v], cap) for _, u, v, cap in rede.edges()]
+    edges += [(n, index[s], INF) for s in rede.sources]
+    edges += [(index[t], n + 1, INF) for t in rede.sinks]
+    return n + 2, edges
+
+
+def solver_benchmarks(rede, rng):
+    """``(nome, fn, prepare)`` de cada medição feita direto sobre ``flow_engine``."""
+    n, edges = _grafo_com_terminais(rede)
+    graph = ResidualGraph(n, edges)
+    s, t = n - 2, n - 1
+    vertex_ids = [v["vertice_id"] for v in rede.vertices]
+    arestas = rede.edges()
+
+    yield "residual_graph/build", lambda: ResidualGraph(n, edges), None
+    for nome in SOLVERS:
+        yield f"max_flow/{nome}", lambda nome=nome: max_flow(graph, s, t, nome), graph.reset
+
+    tracker = IncrementalMaxFlow(vertex_ids, arestas, rede.sources, rede.sinks)
+    fluxo_maximo = tracker.value
+
+    def mudar_capacidade():
+        key, u, v, cap = rng.choice(arestas)
+        tracker.set_capacity(key, u, v, rng.randint(0, 2 * max(cap, 1)))
+
+    yield "incremental/set_capacity", mudar_capacidade, None
+    yield "incremental/flow_paths_page", lambda: tracker.flow_paths(0, 100), None
+
+    custos = [(key, u, v, cap, rng.randint(1, 30)) for key, u, v, cap in arestas]
+    # O custo mínimo só escolhe entre os fluxos máximos: o valor tem de ser o mesmo
+    valor = MinCostFlow(vertex_ids, custos, rede.sources, rede.sinks).value
+    if valor != fluxo_maximo:
+        raise RuntimeError(f"min_cost_flow: fluxo {valor}, mas o fluxo máximo é {fluxo_maximo}")
+    yield "min_cost_flow", lambda: MinCostFlow(vertex_ids, custos, rede.sources, rede.sinks), None
+
+    zonas = rede.sinks[:MAX_COMMODITIES]
+    demanda = max(1, sum(cap for *_, cap in arestas) // max(len(rede.sinks), 1) // 4)
+    commodities = [(z, demanda, rede.sources) for z in zonas]
+    yield "multicommodity", lambda: MultiCommodityFlow(vertex_ids, arestas, commodities), None
+
+
+# Endpoints
+
+def endpoint_benchmarks(rede, rng, client):
+    """``(nome, fn, prepare)`` de cada endpoint, chamado pelo ``TestClient``."""
+    import myapi
+
+    def ok(resposta):
+        if resposta.status_code >= 400:
+            raise RuntimeError(f"{resposta.request.method} {resposta.request.url.path}: {resposta.status_code} {resposta.text[:200]}")
+        return resposta
+
+    def importar():
+        ok(client.post("/network/reset"))
+        ok(client.post("/network/import", content=rede.ndjson(), headers={"content-type": "application/x-ndjson"}))
+
+    def mudar_capacidade():
+        a = rng.choice(rede.arestas)
+        ok(client.put(f"/arestas/{a['aresta_id']}", json={
+            "origem_id": a["origem_id"],
+            "destino_id": a["destino_id"],
+            "capacidade": rng.randint(1, 2 * a["capacidade"]),
+        }))
+
+    yield "POST /network/import", importar, None
+    importar()
+    ids = list(myapi.store.arestas)
+    origem, destino = rede.sources[0], rede.sinks[-1]
+    zonas = rede.sinks[:MAX_COMMODITIES]
+
+    def mudar_e_reler():
+        # Garante o fluxo mantido da rede antes de medir só a propagação da mudança
+        mudar_capacidade()
+        ok(client.post("/relatorio-automatico", json={}))
+
+    yield "PUT /arestas/{id}", mudar_capacidade, None
+    yield "POST /relatorio-automatico", lambda: ok(client.post("/relatorio-automatico", json={})), mudar_capacidade
+    yield "GET /fluxo_maximo", lambda: ok(client.get(
+        "/fluxo_maximo", params={"origem_id": origem, "destino_id": destino})), mudar_capacidade
+    yield "GET /network/current-state", lambda: ok(client.get("/network/current-state")), mudar_capacidade
+    yield "GET /arestas", lambda: ok(client.get(
+        "/arestas", params={"cursor": rng.choice(ids), "limit": 1000})), None
+    yield "POST /network/resilience", lambda: ok(client.post(
+        "/network/resilience", json={"limit": 10})), mudar_e_reler
+    yield "POST /network/multicommodity", lambda: ok(client.post("/network/multicommodity", json={
+        "demands": [{"zona_id": z, "demanda": 10} for z in zonas]})), mudar_capacidade
+
+
+def run(args):
+    rede = generate(args.topology, args.vertices, args.edges, args.capacity, args.cap_max, args.seed)
+    rng = random.Random(args.seed + 1)
+    resultados = {}
+
+    def rodar(benchmarks):
+        for nome, fn, prepare in benchmarks:
+            if args.only and not any(filtro in nome for filtro in args.only):
+                continue
+            print(f"{nome}...", file=sys.stderr)
+            resultados[nome] = measure(fn, args.repeat, args.warmup, prepare)
+
+    rodar(solver_benchmarks(rede, rng))
+    if not args.no_endpoints:
+        from fastapi.testclient import TestClient
+        import batch_flow
+        import myapi
+
+        try:
+            with TestClient(myapi.api) as client:
+                rodar(endpoint_benchmarks(rede, rng, client))
+        finally:
+            batch_flow.shutdown()
+
+    return {
+        "gerado_em": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {
+            "topology": args.topology,
+            "vertices": args.vertices,
+            "edges": args.edges,
+            "capacity": args.capacity,
+            "cap_max": args.cap_max,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+        },
+        "rede": rede.describe(),
+        "resultados": resultados,
+    }
+
+
+def compare(relatorio, baseline, max_regression=None):
+    """Anota em cada medição a razão p50 atual / p50 da baseline.
+
+    Com ``max_regression`` devolve os nomes que passaram do limite.
+    """
+    regressoes = []
+    anteriores = baseline.get("resultados", {})
+    for nome, atual in relatorio["resultados"].items():
+        anterior = anteriores.get(nome)
+        if not anterior or not anterior.get("p50_ms"):
+            continue
+        razao = round(atual["p50_ms"] / anterior["p50_ms"], 3)
+        atual["p50_vs_baseline"] = razao
+        if max_regression is not None and razao > max_regression:
+            regressoes.append(nome)
+    relatorio["regressoes"] = regressoes
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="layered")
+    parser.add_argument("--vertices", type=int, default=1000)
+    parser.add_argument("--edges", type=int, default=5000)
+    parser.add_argument("--capacity", choices=CAPACITY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--cap-max", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", action="append", help="Só medições cujo nome contém o texto (repetível)")
+    parser.add_argument("--no-endpoints", action="store_true", help="Mede só os solvers, sem carregar a API")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--max-regression", type=float, help="Falha se algum p50 passar desta razão sobre a baseline")
+    parser.add_argument("--output", help="Arquivo de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    relatorio = run(args)
+    regressoes = []
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            regressoes = compare(relatorio, orjson.loads(f.read()), args.max_regression)
+
+    saida = orjson.dumps(relatorio, option=orjson.OPT_INDENT_2)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(saida)
+    else:
+        sys.stdout.buffer.write(saida + b"\n")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
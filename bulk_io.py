@@ -0,0 +1,257 @@
+"""Importação e exportação da rede inteira em lote.
+
+Dois formatos são aceitos:
+
+* NDJSON: um objeto por linha. Linhas com ``origem_id`` são arestas, as demais
+  são vértices. Os ids podem ser omitidos e então são alocados pelo store,
+  só na hora de aplicar a carga; um id repetido no payload é um erro.
+* Binário colunar (``application/octet-stream``): cabeçalho ``DOPTNET1``,
+  contagens em ``uint32`` e cada campo como uma coluna contígua little-endian.
+  Tipos de vértice vão numa tabela de strings e os nomes num blob UTF-8 com
+  offsets, de modo que a leitura é só fatiar buffers.
+"""
+import struct
+import sys
+from array import array
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+BATCH_SIZE = 5000
+CHUNK_ROWS = 1000
+MAGIC = b"DOPTNET1"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+_HEADER = struct.Struct("<8sIII")
+_LEN = struct.Struct("<H")
+
+
+class BulkLoader:
+    """Acumula linhas e valida vértices e arestas em lotes de ``batch_size``.
+
+    Nada é inserido no store aqui: ``finish`` devolve os modelos validados para
+    que a carga seja aplicada numa única operação. Linhas sem id são validadas
+    com um id provisório; ``assign_ids`` aloca os definitivos e deve rodar com
+    a trava de escrita, logo antes de aplicar a carga.
+    """
+
+    def __init__(self, vertice_model, aresta_model, store, batch_size=BATCH_SIZE):
+        self.store = store
+        self.batch_size = batch_size
+        self._vertice_adapter = TypeAdapter(List[vertice_model])
+        self._aresta_adapter = TypeAdapter(List[aresta_model])
+        self._pendentes = {"vertice": [], "aresta": []}
+        # Ids explícitos já vistos e posições (em vertices/arestas) sem id
+        self._ids = {"vertice": set(), "aresta": set()}
+        self._sem_id = {"vertice": [], "aresta": []}
+        self._contagem = {"vertice": 0, "aresta": 0}
+        self.vertices = []
+        self.arestas = []
+        self._linha = 0
+
+    def add(self, row):
+        self._linha += 1
+        if not isinstance(row, dict):
+            raise ValueError(f"linha {self._linha}: esperado um objeto JSON")
+        kind = "aresta" if "origem_id" in row else "vertice"
+        id_field = f"{kind}_id"
+        item_id = row.get(id_field)
+        if item_id is None:
+            self._sem_id[kind].append(self._contagem[kind])
+            row = {**row, id_field: -1}
+        elif item_id in self._ids[kind]:
+            raise ValueError(f"linha {self._linha}: {id_field} {item_id} repetido no payload")
+        else:
+            self._ids[kind].add(item_id)
+        self._contagem[kind] += 1
+        pendentes = self._pendentes[kind]
+        pendentes.append((self._linha, row))
+        if len(pendentes) >= self.batch_size:
+            self._flush(kind)
+
+    def _flush(self, kind):
+        pendentes = self._pendentes[kind]
+        if not pendentes:
+            return
+        adapter = self._aresta_adapter if kind == "aresta" else self._vertice_adapter
+        destino = self.arestas if kind == "aresta" else self.vertices
+        try:
+            destino.extend(adapter.validate_python([row for _, row in pendentes]))
+        except ValidationError as e:
+            erro = e.errors()[0]
+            linha = pendentes[erro["loc"][0]][0]
+            campo = ".".join(str(p) for p in erro["loc"][1:])
+            raise ValueError(f"linha {linha}: {campo} {erro['msg']}")
+        pendentes.clear()
+
+    def finish(self):
+        self._flush("vertice")
+        self._flush("aresta")
+        return self.vertices, self.arestas
+
+    def assign_ids(self):
+        """Aloca no store os ids das linhas que vieram sem, pulando os explícitos do payload."""
+        for kind, modelos, allocate in (
+            ("vertice", self.vertices, self.store.next_vertice_id),
+            ("aresta", self.arestas, self.store.next_aresta_id),
+        ):
+            explicitos = self._ids[kind]
+            for posicao in self._sem_id[kind]:
+                item_id = allocate()
+                while item_id in explicitos:
+                    item_id = allocate()
+                setattr(modelos[posicao], f"{kind}_id", item_id)
+
+
+async def iter_ndjson(chunks):
+    """Decodifica NDJSON de um stream assíncrono de bytes, linha a linha."""
+    resto = b""
+    async for chunk in chunks:
+        resto += chunk
+        *linhas, resto = resto.split(b"\n")
+        for linha in linhas:
+            if linha.strip():
+                yield orjson.loads(linha)
+    if resto.strip():
+        yield orjson.loads(resto)
+
+
+def pack_column(typecode, values):
+    col = array(typecode, values)
+    if sys.byteorder != "little":
+        col.byteswap()
+    return col.tobytes()
+
+
+def unpack_column(typecode, data, offset, count):
+    col = array(typecode)
+    end = offset + col.itemsize * count
+    if end > len(data):
+        raise ValueError("payload binário truncado")
+    col.frombytes(memoryview(data)[offset:end])
+    if sys.byteorder != "little":
+        col.byteswap()
+    return col, end
+
+
+def iter_binary(vertices, arestas):
+    """Codifica a rede no formato colunar, coluna por coluna."""
+    tipos = {}
+    for v in vertices:
+        tipos.setdefault(v.type, len(tipos))
+    nomes = [v.name.encode("utf-8") for v in vertices]
+    offsets = [0]
+    for nome in nomes:
+        offsets.append(offsets[-1] + len(nome))
+
+    yield _HEADER.pack(MAGIC, len(vertices), len(arestas), len(tipos))
+    for tipo in tipos:
+        raw = tipo.encode("utf-8")
+        yield _LEN.pack(len(raw)) + raw
+    yield pack_column("q", [v.vertice_id for v in vertices])
+    yield pack_column("H", [tipos[v.type] for v in vertices])
+    yield pack_column("Q", offsets)
+    yield b"".join(nomes)
+    yield pack_column("q", [a.aresta_id for a in arestas])
+    yield pack_column("q", [a.origem_id for a in arestas])
+    yield pack_column("q", [a.destino_id for a in arestas])
+    yield pack_column("q", [a.capacidade for a in arestas])
+    yield pack_column("q", [a.uso or 0 for a in arestas])
+    yield pack_column("B", [int(a.priority) for a in arestas])
+
+
+def _texto(raw):
+    try:
+        return bytes(raw).decode("utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("payload binário com texto UTF-8 inválido")
+
+
+def read_binary(data):
+    """Decodifica o formato colunar em linhas (dicts) prontas para validação.
+
+    ``data`` pode ser qualquer buffer (bytes, memoryview ou um ``mmap``).
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("payload binário truncado")
+    magic, nv, na, nt = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("payload binário com cabeçalho inválido")
+    pos = _HEADER.size
+    tipos = []
+    for _ in range(nt):
+        if pos + _LEN.size > len(data):
+            raise ValueError("payload binário truncado")
+        (size,) = _LEN.unpack_from(data, pos)
+        pos += _LEN.size
+        if pos + size > len(data):
+            raise ValueError("payload binário truncado")
+        tipos.append(_texto(data[pos:pos + size]))
+        pos += size
+
+    ids, pos = unpack_column("q", data, pos, nv)
+    codigos, pos = unpack_column("H", data, pos, nv)
+    offsets, pos = unpack_column("Q", data, pos, nv + 1)
+    if pos + offsets[-1] > len(data):
+        raise ValueError("payload binário truncado")
+    blob = bytes(data[pos:pos + offsets[-1]])
+    pos += offsets[-1]
+    for i in range(nv):
+        if codigos[i] >= len(tipos):
+            raise ValueError(f"vértice {i}: código de tipo {codigos[i]} fora da tabela")
+        if not offsets[i] <= offsets[i + 1] <= offsets[-1]:
+            raise ValueError(f"vértice {i}: offsets de nome inválidos")
+        yield {
+            "vertice_id": ids[i],
+            "name": _texto(blob[offsets[i]:offsets[i + 1]]),
+            "type": tipos[codigos[i]],
+        }
+
+    colunas = []
+    for typecode in ("q", "q", "q", "q", "q", "B"):
+        col, pos = unpack_column(typecode, data, pos, na)
+        colunas.append(col)
+    ids, origens, destinos, capacidades, usos, prioridades = colunas
+    for i in range(na):
+        yield {
+            "aresta_id": ids[i],
+            "origem_id": origens[i],
+            "destino_id": destinos[i],
+            "capacidade": capacidades[i],
+            "uso": usos[i],
+            "priority": prioridades[i],
+        }
+
+
+def vertice_row(v):
+    return {"vertice_id": v.vertice_id, "name": v.name, "type": v.type}
+
+
+def aresta_row(a):
+    return {
+        "aresta_id": a.aresta_id,
+        "origem_id": a.origem_id,
+        "destino_id": a.destino_id,
+        "capacidade": a.capacidade,
+        "uso": a.uso,
+        "priority": int(a.priority),
+    }
+
+
+def iter_ndjson_export(vertices, arestas):
+    """Exporta a rede em NDJSON, em blocos de ``CHUNK_ROWS`` linhas."""
+    linhas = []
+    for v in vertices:
+        linhas.append(orjson.dumps(vertice_row(v)))
+        if len(linhas) >= CHUNK_ROWS:
+            yield b"\n".join(linhas) + b"\n"
+            linhas = []
+    for a in arestas:
+        linhas.append(orjson.dumps(aresta_row(a)))
+        if len(linhas) >= CHUNK_ROWS:
+            yield b"\n".join(linhas) + b"\n"
+            linhas = []
+    if linhas:
+        yield b"\n".join(linhas) + b"\n"
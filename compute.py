@@ -0,0 +1,189 @@
+"""Execução dos cálculos de fluxo fora do event loop.
+
+``ComputeExecutor`` limita quantos cálculos podem estar na fila ou rodando
+(acima disso a requisição é recusada na hora) e aplica um tempo máximo de
+espera por cálculo. Lotes divididos em blocos (``map``) disputam as mesmas
+vagas: ocupam no máximo uma por worker do pool e não passam na frente das
+requisições avulsas. Cálculos pequenos vão para threads; os grandes podem ir
+para o pool de processos de ``batch_flow``, trabalhando sobre uma cópia
+imutável da rede. ``RWLock`` dá aos solvers em thread uma visão consistente
+da rede enquanto as mutações esperam sua vez.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+import batch_flow
+import metrics
+
+WORKERS = int(os.environ.get("DELIVERY_COMPUTE_WORKERS", os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get("DELIVERY_COMPUTE_QUEUE", 4 * WORKERS))
+TIMEOUT = float(os.environ.get("DELIVERY_COMPUTE_TIMEOUT", "30"))
+
+
+class Saturated(Exception):
+    """Já há ``max_pending`` cálculos na fila ou em execução."""
+
+
+class ComputeTimeout(Exception):
+    """O cálculo não terminou dentro do tempo máximo da requisição."""
+
+
+class RWLock:
+    """Trava de leitura/escrita com preferência para quem escreve.
+
+    Vários leitores podem segurar a trava ao mesmo tempo; um escritor espera
+    os leitores atuais e, enquanto espera, novos leitores não entram.
+    """
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._leitores = 0
+        self._escrevendo = False
+        self._escritores_esperando = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._escrevendo or self._escritores_esperando:
+                self._cond.wait()
+            self._leitores += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._leitores -= 1
+                if not self._leitores:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._escritores_esperando += 1
+            while self._escrevendo or self._leitores:
+                self._cond.wait()
+            self._escritores_esperando -= 1
+            self._escrevendo = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._escrevendo = False
+                self._cond.notify_all()
+
+
+class ComputeExecutor:
+    """Fila limitada de cálculos com timeout por requisição."""
+
+    def __init__(self, max_workers=WORKERS, max_pending=MAX_PENDING, timeout=TIMEOUT):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._threads = ThreadPoolExecutor(max_workers, thread_name_prefix="fluxo")
+        self._lock = Lock()
+
+    def _reservar(self, vagas=1):
+        """Reserva até ``vagas`` vagas (ao menos uma) e diz quantas conseguiu."""
+        with self._lock:
+            livres = self.max_pending - self.pending
+            if livres <= 0:
+                self.rejected += 1
+                raise Saturated()
+            vagas = min(vagas, livres)
+            self.pending += vagas
+            return vagas
+
+    def _liberar(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    def _destino(self, fn, process):
+        pool = batch_flow.executor() if process else self._threads
+        perfil = metrics.perfil_atual.get()
+        if perfil is not None and not process:
+            fn = perfil.wrap(fn)
+        return pool, fn
+
+    async def run(self, fn, *args, process=False, timeout=None):
+        """Executa ``fn(*args)`` numa thread (ou num processo, com ``process``)."""
+        self._reservar()
+        pool, fn = self._destino(fn, process)
+        try:
+            tarefa = pool.submit(fn, *args)
+        except BaseException:
+            self._liberar(None)
+            raise
+        # A vaga só é liberada quando o cálculo termina de fato: uma thread
+        # que estourou o tempo continua ocupando o executor.
+        tarefa.add_done_callback(self._liberar)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(tarefa)), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            tarefa.cancel()
+            raise ComputeTimeout()
+
+    async def map(self, fn, chamadas, process=False, timeout=None):
+        """Executa ``fn(*args)`` para cada ``args`` de ``chamadas``, entregando os resultados na ordem em que terminam.
+
+        Reserva de uma vaga até uma por worker do pool (sem nenhuma livre,
+        ``Saturated`` antes de começar) e mantém um bloco rodando por vaga;
+        cada vaga é liberada quando o seu último bloco termina. O tempo
+        máximo vale para a espera de cada bloco.
+        """
+        restantes = list(chamadas)[::-1]
+        if not restantes:
+            return
+        workers = batch_flow.WORKERS if process else self.max_workers
+        vagas = self._reservar(min(len(restantes), workers))
+        pool, fn = self._destino(fn, process)
+        rodando = {}
+
+        def submeter():
+            nonlocal vagas
+            tarefa = pool.submit(fn, *restantes.pop())
+            vagas -= 1
+            rodando[asyncio.wrap_future(tarefa)] = tarefa
+
+        try:
+            while vagas:
+                submeter()
+            while rodando:
+                prontas, _ = await asyncio.wait(
+                    rodando, timeout=timeout or self.timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not prontas:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise ComputeTimeout()
+                for pronta in prontas:
+                    del rodando[pronta]
+                    if restantes:
+                        vagas += 1
+                        submeter()
+                    else:
+                        self._liberar(None)
+                    yield pronta.result()
+        finally:
+            for _ in range(vagas):
+                self._liberar(None)
+            # Como em ``run``: a vaga de um bloco que ainda roda só volta quando ele termina
+            for tarefa in rodando.values():
+                tarefa.cancel()
+                tarefa.add_done_callback(self._liberar)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,122 @@
+"""Respostas JSON rápidas para payloads grandes.
+
+Os dados internos da rede já foram validados na entrada, então aqui vão
+direto para bytes com orjson, sem passar de novo pelos modelos Pydantic nem
+pelo ``jsonable_encoder``. Respostas ligadas a uma versão da rede ganham um
+ETag (e 304 quando o cliente já tem aquela versão) e ficam num cache pequeno
+já codificadas. Como a versão recomeça do zero quando a rede não é
+persistida, o ETag leva também uma época: um token por partida do processo,
+ou o da persistência (snapshots ou estado compartilhado), que sobrevive a
+ela. Acima de ``COMPRESS_MIN_BYTES`` o corpo é comprimido com brotli (se o
+pacote estiver instalado) ou gzip, conforme o Accept-Encoding.
+"""
+import gzip
+import secrets
+from collections import OrderedDict
+from threading import Lock
+
+import orjson
+from fastapi import Response
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 64 * 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+MEDIA_TYPE = "application/json"
+
+
+def dumps(content):
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def etag(*partes):
+    # Fraco: a mesma versão vale para qualquer codificação do corpo
+    return 'W/"' + "-".join(str(p) for p in partes) + '"'
+
+
+def _encoding(request):
+    aceitos = {
+        parte.split(";")[0].strip()
+        for parte in request.headers.get("accept-encoding", "").split(",")
+    }
+    if brotli is not None and "br" in aceitos:
+        return "br"
+    if "gzip" in aceitos:
+        return "gzip"
+    return None
+
+
+def _codificar(content, encoding):
+    with metrics.phase("serialize"):
+        body = dumps(content)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    with metrics.phase("compress", encoding=encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+
+def _response(body, encoding, headers=None, status_code=200):
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type=MEDIA_TYPE, headers=headers)
+
+
+def json_response(request, content, status_code=200):
+    """``content`` codificado com orjson (e comprimido, se grande)."""
+    body, encoding = _codificar(content, _encoding(request))
+    return _response(body, encoding, status_code=status_code)
+
+
+class VersionedResponses:
+    """Corpos já codificados por ``(nome, versão, codificação)``, com ETag e 304."""
+
+    def __init__(self, maxsize=16, epoch=None):
+        self.maxsize = maxsize
+        self.epoch = epoch or secrets.token_hex(4)
+        self.hits = 0
+        self.not_modified = 0
+        self._corpos = OrderedDict()
+        self._lock = Lock()
+
+    def respond(self, request, nome, versao_atual, build):
+        """Responde ``nome`` na versão atual da rede.
+
+        ``build()`` só roda quando não há corpo em cache e devolve
+        ``(versao, conteudo)``, lidos de forma consistente.
+        """
+        tag = etag(nome, self.epoch, versao_atual)
+        if tag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers={"ETag": tag, "Vary": "Accept-Encoding"})
+
+        encoding = _encoding(request)
+        chave = (nome, versao_atual, encoding)
+        with self._lock:
+            cached = self._corpos.get(chave)
+            if cached is not None:
+                self._corpos.move_to_end(chave)
+                self.hits += 1
+        if cached is None:
+            versao, content = build()
+            cached = _codificar(content, encoding)
+            chave = (nome, versao, encoding)
+            tag = etag(nome, self.epoch, versao)
+            with self._lock:
+                self._corpos[chave] = cached
+                while len(self._corpos) > self.maxsize:
+                    self._corpos.popitem(last=False)
+        body, usado = cached
+        return _response(body, usado, headers={"ETag": tag})
+
+    def stats(self):
+        return {"hits": self.hits, "not_modified": self.not_modified, "entries": len(self._corpos)}
@@ -0,0 +1,1743 @@
+import copy
+import math
+import time
+from array import array
+from collections import OrderedDict
+from heapq import heappop, heappush
+from itertools import islice
+from threading import Lock
+
+import metrics
+
+INF = float('inf')
+
+
+def _zeros(size):
+    return array('q', [0]) * size
+
+
+class ResidualGraph:
+    """Grafo residual compacto em formato CSR.
+
+    Cada aresta (u, v, cap) vira um par de arcos: o arco de ida fica na faixa
+    de ``u`` e o de volta na faixa de ``v``, e ``rev`` liga um ao outro.
+    Tudo é guardado em arrays tipados, então a memória cresce com V + E.
+    """
+
+    def __init__(self, n, edges):
+        inicio = time.perf_counter()
+        edges = list(edges)
+        self.n = n
+        self.num_edges = len(edges)
+
+        # Capacidade "infinita" (super fonte/sumidouro) vira um teto finito;
+        # capacidades negativas não levam fluxo e não podem baixar o teto
+        finite = sum(cap for _, _, cap in edges if cap != INF and cap > 0)
+        self.inf_capacity = finite + 1
+
+        offsets = _zeros(n + 1)
+        for u, v, _ in edges:
+            offsets[u + 1] += 1
+            offsets[v + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+
+        m = 2 * len(edges)
+        head = _zeros(m)
+        rev = _zeros(m)
+        cap = _zeros(m)
+        edge_arc = _zeros(len(edges))
+        pos = array('q', offsets)
+
+        for i, (u, v, c) in enumerate(edges):
+            a = pos[u]
+            pos[u] += 1
+            b = pos[v]
+            pos[v] += 1
+            head[a] = v
+            head[b] = u
+            rev[a] = b
+            rev[b] = a
+            cap[a] = self.inf_capacity if c == INF else c
+            edge_arc[i] = a
+
+        self.offsets = offsets
+        self.head = head
+        self.rev = rev
+        self.cap = cap
+        self.flow = _zeros(m)
+        self.edge_arc = edge_arc
+        # Rodadas da última resolução (BFS, fases ou global relabels, conforme o solver)
+        self.rounds = 0
+        metrics.phase_done("graph_build", inicio)
+
+    def reset(self):
+        self.flow = _zeros(len(self.cap))
+        self.rounds = 0
+
+    def copy(self):
+        """Cópia com capacidades próprias e fluxo zerado.
+
+        A estrutura (offsets, head, rev, edge_arc) nunca é alterada no lugar,
+        então é compartilhada em vez de copiada.
+        """
+        clone = copy.copy(self)
+        clone.cap = array('q', self.cap)
+        clone.flow = _zeros(len(self.cap))
+        clone.rounds = 0
+        return clone
+
+    def residual(self, a):
+        return self.cap[a] - self.flow[a]
+
+    def edge_flow(self, i):
+        """Fluxo na i-ésima aresta, na ordem em que foram passadas."""
+        return self.flow[self.edge_arc[i]]
+
+
+def bfs_frontier(graph, root, target=-1, reverse=False, skip=-1):
+    """BFS por níveis no grafo residual, expandindo a fronteira inteira de uma vez.
+
+    É o caminho quente comum a todos os solvers. Devolve ``(level, parent)``:
+    a distância de cada vértice a ``root`` (-1 se inalcançável) e o arco usado
+    para alcançá-lo. Com ``reverse`` percorre os arcos residuais ao contrário
+    (distância *até* ``root``); ``skip`` nunca é visitado. A busca para ao fim
+    do nível em que ``target`` é alcançado.
+    """
+    offsets, head, rev, cap, flow = graph.offsets, graph.head, graph.rev, graph.cap, graph.flow
+    level = [-1] * graph.n
+    parent = [-1] * graph.n
+    level[root] = 0
+    if skip >= 0:
+        level[skip] = -2
+    frontier = [root]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        push = next_frontier.append
+        for u in frontier:
+            for a in range(offsets[u], offsets[u + 1]):
+                v = head[a]
+                if level[v] == -1:
+                    b = rev[a] if reverse else a
+                    if cap[b] > flow[b]:
+                        level[v] = depth
+                        parent[v] = a
+                        push(v)
+        if target >= 0 and level[target] >= 0:
+            break
+        frontier = next_frontier
+    if skip >= 0:
+        level[skip] = -1
+    return level, parent
+
+
+def _path_edges(graph, arcs):
+    head, rev = graph.head, graph.rev
+    return [(head[rev[a]], head[a]) for a in arcs]
+
+
+def _augment(graph, parent, s, t):
+    head, rev, cap, flow = graph.head, graph.rev, graph.cap, graph.flow
+    arcs = []
+    v = t
+    while v != s:
+        a = parent[v]
+        arcs.append(a)
+        v = head[rev[a]]
+    path_flow = min(cap[a] - flow[a] for a in arcs)
+    for a in arcs:
+        flow[a] += path_flow
+        flow[rev[a]] -= path_flow
+    return path_flow
+
+
+def edmonds_karp(graph, s, t):
+    if s == t:
+        return 0
+    max_flow = 0
+    while True:
+        level, parent = bfs_frontier(graph, s, t)
+        if level[t] < 0:
+            return max_flow
+        graph.rounds += 1
+        max_flow += _augment(graph, parent, s, t)
+
+
+def _blocking_flow(graph, s, t, level):
+    """Fluxo bloqueante no grafo de níveis, com DFS iterativa e ponteiro de arco."""
+    offsets, head, rev, cap, flow = graph.offsets, graph.head, graph.rev, graph.cap, graph.flow
+    current = array('q', offsets)
+    total = 0
+    path = []
+    u = s
+    while True:
+        if u == t:
+            path_flow = min(cap[a] - flow[a] for a in path)
+            for a in path:
+                flow[a] += path_flow
+                flow[rev[a]] -= path_flow
+            total += path_flow
+            # Recua até a cauda do primeiro arco saturado
+            k = 0
+            while cap[path[k]] - flow[path[k]] > 0:
+                k += 1
+            u = head[rev[path[k]]]
+            del path[k:]
+            continue
+
+        i = current[u]
+        end = offsets[u + 1]
+        next_level = level[u] + 1
+        while i < end and (cap[i] - flow[i] <= 0 or level[head[i]] != next_level):
+            i += 1
+        current[u] = i
+        if i < end:
+            path.append(i)
+            u = head[i]
+            continue
+
+        # Beco sem saída: tira o vértice do grafo de níveis e recua
+        level[u] = -1
+        if not path:
+            return total
+        a = path.pop()
+        u = head[rev[a]]
+        current[u] += 1
+
+
+def dinic(graph, s, t):
+    if s == t:
+        return 0
+    max_flow = 0
+    while True:
+        level, _ = bfs_frontier(graph, s)
+        if level[t] < 0:
+            return max_flow
+        graph.rounds += 1
+        max_flow += _blocking_flow(graph, s, t, level)
+
+
+def push_relabel(graph, s, t):
+    """Push-relabel pelo rótulo mais alto, com heurísticas de gap e global relabel.
+
+    Ao final o excesso que não chega em ``t`` é devolvido a ``s`` e o fluxo é
+    válido, então pode ser decomposto como o dos outros solvers.
+    """
+    if s == t:
+        return 0
+    n = graph.n
+    offsets, head, rev, cap, flow = graph.offsets, graph.head, graph.rev, graph.cap, graph.flow
+    top = 2 * n + 1
+    height = [0] * n
+    excess = [0] * n
+    current = list(offsets[:n])
+    count = [0] * (top + 1)
+    buckets = [[] for _ in range(top + 1)]
+    highest = 0
+
+    def global_relabel():
+        # Alturas exatas: distância até t e, para quem não alcança t, n + distância até s
+        nonlocal highest
+        graph.rounds += 1
+        for h in range(top + 1):
+            count[h] = 0
+            buckets[h] = []
+        to_sink, _ = bfs_frontier(graph, t, reverse=True, skip=s)
+        to_source, _ = bfs_frontier(graph, s, reverse=True)
+        for v in range(n):
+            if to_sink[v] >= 0:
+                height[v] = to_sink[v]
+            elif to_source[v] >= 0:
+                height[v] = n + to_source[v]
+            else:
+                height[v] = top
+        height[s] = n
+        highest = 0
+        for v in range(n):
+            count[height[v]] += 1
+            current[v] = offsets[v]
+            if excess[v] > 0 and v != s and v != t:
+                buckets[height[v]].append(v)
+                highest = max(highest, height[v])
+
+    for a in range(offsets[s], offsets[s + 1]):
+        r = cap[a] - flow[a]
+        if r > 0:
+            flow[a] += r
+            flow[rev[a]] -= r
+            excess[head[a]] += r
+            excess[s] -= r
+    global_relabel()
+
+    relabels = 0
+    while highest >= 0:
+        if not buckets[highest]:
+            highest -= 1
+            continue
+        u = buckets[highest].pop()
+        if height[u] != highest:
+            # Foi levantado por um gap depois de entrar no bucket
+            buckets[height[u]].append(u)
+            highest = max(highest, height[u])
+            continue
+
+        while excess[u] > 0:
+            hu = height[u]
+            i = current[u]
+            end = offsets[u + 1]
+            while i < end:
+                r = cap[i] - flow[i]
+                v = head[i]
+                if r > 0 and height[v] == hu - 1:
+                    d = min(excess[u], r)
+                    flow[i] += d
+                    flow[rev[i]] -= d
+                    if excess[v] == 0 and v != s and v != t:
+                        buckets[height[v]].append(v)
+                    excess[v] += d
+                    excess[u] -= d
+                    if excess[u] == 0:
+                        break
+                i += 1
+            current[u] = i
+            if excess[u] == 0:
+                break
+
+            new_height = top
+            for a in range(offsets[u], offsets[u + 1]):
+                if cap[a] - flow[a] > 0 and height[head[a]] + 1 < new_height:
+                    new_height = height[head[a]] + 1
+            count[hu] -= 1
+            if count[hu] == 0 and hu < n:
+                # Gap: quem está acima da altura que esvaziou não alcança mais t
+                for v in range(n):
+                    if hu < height[v] < n:
+                        count[height[v]] -= 1
+                        height[v] = n + 1
+                        count[n + 1] += 1
+                        current[v] = offsets[v]
+                new_height = max(new_height, n + 1)
+            height[u] = new_height
+            count[new_height] += 1
+            current[u] = offsets[u]
+            highest = max(highest, new_height)
+
+            relabels += 1
+            if relabels >= n:
+                relabels = 0
+                global_relabel()
+                break
+
+    return excess[t]
+
+
+SOLVERS = {
+    "edmonds_karp": edmonds_karp,
+    "dinic": dinic,
+    "push_relabel": push_relabel,
+}
+
+# Limites (em número de arcos) usados na escolha automática do solver
+SMALL_GRAPH_EDGES = 200
+LARGE_GRAPH_EDGES = 10_000
+
+
+def choose_solver(graph):
+    if graph.num_edges <= SMALL_GRAPH_EDGES:
+        return "edmonds_karp"
+    if graph.num_edges >= LARGE_GRAPH_EDGES:
+        return "push_relabel"
+    return "dinic"
+
+
+def max_flow(graph, s, t, solver=None):
+    """Resolve o fluxo máximo de ``s`` a ``t`` com o solver pedido (ou o escolhido
+    pelo tamanho do grafo). Os caminhos saem depois, de ``iter_flow_paths``."""
+    name = solver or choose_solver(graph)
+    if name not in SOLVERS:
+        raise ValueError(f"Solver desconhecido: {name}")
+    rodadas = graph.rounds
+    with metrics.phase("solve", solver=name):
+        valor = SOLVERS[name](graph, s, t)
+    metrics.solver_rounds(name, graph.rounds - rodadas)
+    return valor
+
+
+class _Dijkstra:
+    """Dijkstra sobre custos reduzidos, reaproveitado entre as rodadas do solver.
+
+    Distâncias e marcas de visita valem só para a rodada que as gravou (um
+    carimbo por vértice), então nada é realocado nem zerado a cada rodada; o
+    heap também é a mesma lista.
+    """
+
+    def __init__(self, n):
+        self.dist = [0] * n
+        self.seen = [0] * n
+        self.done = [0] * n
+        self.heap = []
+        self.round = 0
+
+    def run(self, graph, cost, potential, s, t):
+        """Distâncias reduzidas a partir de ``s``; para ao fixar ``t``. Diz se ``t`` foi alcançado."""
+        self.round += 1
+        r = self.round
+        dist, seen, done, heap = self.dist, self.seen, self.done, self.heap
+        offsets, head, cap, flow = graph.offsets, graph.head, graph.cap, graph.flow
+        heap.clear()
+        dist[s] = 0
+        seen[s] = r
+        heappush(heap, (0, s))
+        while heap:
+            d, u = heappop(heap)
+            if done[u] == r:
+                continue
+            done[u] = r
+            if u == t:
+                return True
+            pu = potential[u]
+            for a in range(offsets[u], offsets[u + 1]):
+                if cap[a] > flow[a]:
+                    v = head[a]
+                    if done[v] != r:
+                        nd = d + cost[a] + pu - potential[v]
+                        if seen[v] != r or nd < dist[v]:
+                            dist[v] = nd
+                            seen[v] = r
+                            heappush(heap, (nd, v))
+        return False
+
+
+def _admissible_blocking_flow(graph, cost, potential, s, t):
+    """Satura caminhos de ``s`` a ``t`` só com arcos de custo reduzido zero.
+
+    DFS iterativa com ponteiro de arco: vértices sem saída ficam mortos até o
+    fim da chamada e quem já está no caminho é pulado, então ciclos de custo
+    zero não prendem a busca. Cada arco é examinado O(1) vezes fora os avanços.
+    """
+    offsets, head, rev, cap, flow = graph.offsets, graph.head, graph.rev, graph.cap, graph.flow
+    current = array('q', offsets)
+    on_path = bytearray(graph.n)
+    dead = bytearray(graph.n)
+    on_path[s] = 1
+    total = 0
+    path = []
+    u = s
+    while True:
+        if u == t:
+            path_flow = min(cap[a] - flow[a] for a in path)
+            for a in path:
+                flow[a] += path_flow
+                flow[rev[a]] -= path_flow
+            total += path_flow
+            # Recua até a cauda do primeiro arco saturado
+            k = 0
+            while cap[path[k]] - flow[path[k]] > 0:
+                k += 1
+            for a in path[k:]:
+                on_path[head[a]] = 0
+            u = head[rev[path[k]]]
+            del path[k:]
+            continue
+
+        i = current[u]
+        end = offsets[u + 1]
+        pu = potential[u]
+        while i < end:
+            v = head[i]
+            if cost[i] + pu == potential[v] and cap[i] > flow[i] and not (dead[v] or on_path[v]):
+                break
+            i += 1
+        current[u] = i
+        if i < end:
+            path.append(i)
+            u = head[i]
+            on_path[u] = 1
+            continue
+
+        dead[u] = 1
+        on_path[u] = 0
+        if not path:
+            return total
+        a = path.pop()
+        u = head[rev[a]]
+        current[u] += 1
+
+
+def min_cost_max_flow(graph, cost, s, t, max_distance=None):
+    """Fluxo máximo de custo mínimo de ``s`` a ``t`` (primal-dual).
+
+    ``cost`` tem o custo de cada arco (o arco de volta com o sinal trocado) e
+    os custos das arestas devem ser não negativos. A cada rodada um Dijkstra
+    sobre custos reduzidos atualiza os potenciais e um fluxo bloqueante satura
+    de uma vez todos os caminhos de custo mínimo. Devolve ``(fluxo, custo)``.
+
+    Com ``max_distance`` para antes de usar caminhos de custo ``>= max_distance``:
+    o fluxo final maximiza ``max_distance * fluxo - custo``.
+    """
+    if s == t:
+        return 0, 0
+    n = graph.n
+    potential = [0] * n
+    dijkstra = _Dijkstra(n)
+    value = 0
+    while dijkstra.run(graph, cost, potential, s, t):
+        graph.rounds += 1
+        # Quem não foi fixado antes de t recebe a distância de t: os custos
+        # reduzidos continuam não negativos
+        dt = dijkstra.dist[t]
+        r = dijkstra.round
+        dist, done = dijkstra.dist, dijkstra.done
+        for v in range(n):
+            potential[v] += dist[v] if done[v] == r else dt
+        # Com potenciais iniciais zero, potential[t] é a distância real até t
+        if max_distance is not None and potential[t] >= max_distance:
+            break
+        # Vários fluxos bloqueantes por rodada: caminhos mínimos com mais arcos
+        # não cabem no primeiro grafo de níveis, mas têm o mesmo custo
+        value += _admissible_blocking_flow(graph, cost, potential, s, t)
+
+    total_cost = 0
+    for i in range(graph.num_edges):
+        a = graph.edge_arc[i]
+        total_cost += graph.flow[a] * cost[a]
+    return value, total_cost
+
+
+def _shortest_tree(graph, length, s, targets):
+    """Dijkstra a partir de ``s`` pelos arcos de ida (capacidade positiva).
+
+    Para quando todos os ``targets`` foram fixados; as distâncias deles são
+    exatas, as dos demais vértices só limites superiores.
+    """
+    offsets, head, cap = graph.offsets, graph.head, graph.cap
+    dist = [INF] * graph.n
+    parent = [-1] * graph.n
+    faltam = set(targets)
+    dist[s] = 0.0
+    heap = [(0.0, s)]
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if u in faltam:
+            faltam.discard(u)
+            if not faltam:
+                break
+        for a in range(offsets[u], offsets[u + 1]):
+            if cap[a] > 0:
+                v = head[a]
+                nd = d + length[a]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = a
+                    heappush(heap, (nd, v))
+    return dist, parent
+
+
+def concurrent_flow(graph, commodities, epsilon=0.2):
+    """Fluxo multi-commodity concorrente (Garg–Könemann), aproximado.
+
+    ``commodities`` traz ``(s, t, demanda)``; todas dividem as capacidades do
+    grafo. Busca o maior ``λ`` tal que ``λ`` vezes a demanda de cada uma possa
+    ser roteado ao mesmo tempo. Arcos de capacidade "infinita" (super fonte)
+    não restringem nada e têm comprimento zero.
+
+    Commodities com a mesma origem compartilham a árvore de caminhos mínimos:
+    um caminho da árvore só é recalculado quando ficou mais de ``1 + ε``
+    vezes mais longo do que quando a árvore foi montada (Fleischer), então o
+    número de Dijkstras cresce com o número de origens, não de commodities.
+    A árvore do início de cada fase também dá o limite dual, e a execução
+    para assim que o fluxo viável chega a ``1 - ε`` dele.
+
+    Devolve ``(λ, limite_superior, roteado, carga)``: ``λ`` é garantido (o
+    fluxo devolvido é viável), ``limite_superior`` vem do dual (nenhum fluxo
+    passa dele), ``roteado`` é o total por commodity e ``carga`` o fluxo
+    (fracionário) em cada arco.
+    """
+    cap, rev, offsets = graph.cap, graph.rev, graph.offsets
+    k = len(commodities)
+    if not k:
+        return 0.0, 0.0, [], [0.0] * len(cap)
+    grupos = {}
+    for j, (s, _, _) in enumerate(commodities):
+        grupos.setdefault(s, []).append(j)
+    destinos = {s: {commodities[j][1] for j in membros} for s, membros in grupos.items()}
+
+    # Limite superior barato para λ (o que sai da origem e chega ao destino).
+    # As demandas começam escaladas por ele e caem pela metade enquanto nem a
+    # primeira fase consegue ser completada.
+    def capacidade(v, entrando):
+        arcs = range(offsets[v], offsets[v + 1])
+        return sum(cap[rev[a]] if entrando else cap[a] for a in arcs)
+
+    escala = min(
+        min(capacidade(s, False), capacidade(t, True)) / demanda
+        for s, t, demanda in commodities
+    )
+    while escala > 0:
+        resultado = _garg_konemann(graph, commodities, grupos, destinos, epsilon, escala)
+        if resultado is not None:
+            return resultado
+        escala /= 2
+    return 0.0, 0.0, [0.0] * k, [0.0] * len(cap)
+
+
+def _garg_konemann(graph, commodities, grupos, destinos, epsilon, escala):
+    """Fases de Garg–Könemann com as demandas multiplicadas por ``escala``.
+
+    Devolve None se a primeira fase não termina (``escala`` alta demais).
+    """
+    head, rev, cap = graph.head, graph.rev, graph.cap
+    constrained = [
+        graph.edge_arc[i] for i in range(graph.num_edges)
+        if 0 < cap[graph.edge_arc[i]] < graph.inf_capacity
+    ]
+    m = max(len(constrained), 1)
+    delta = (m / (1 - epsilon)) ** (-1 / epsilon)
+    length = [0.0] * len(cap)
+    for a in constrained:
+        length[a] = delta / cap[a]
+    total_length = m * delta  # D(l) = soma de l_e * c_e
+    fases_por_rodada = math.ceil(2 / epsilon * math.log(m / (1 - epsilon), 1 + epsilon))
+
+    carga = [0.0] * len(cap)
+    roteado = [0.0] * len(commodities)
+    superior = INF
+    fases = rodada = 0
+    while True:
+        alfa = 0.0
+        arvores = {}
+        for s, membros in grupos.items():
+            dist, parent = arvores[s] = _shortest_tree(graph, length, s, destinos[s])
+            for j in membros:
+                if dist[commodities[j][1]] == INF:
+                    return 0.0, 0.0, [0.0] * len(commodities), [0.0] * len(cap)
+                alfa += commodities[j][2] * dist[commodities[j][1]]
+        if alfa > 0:
+            superior = min(superior, total_length / alfa)
+        if fases:
+            congestionamento = max(1.0, max((carga[a] / cap[a] for a in constrained), default=0.0))
+            lam = min(r / d for r, (_, _, d) in zip(roteado, commodities)) / congestionamento
+            if total_length >= 1 or lam >= (1 - epsilon) * superior:
+                break
+
+        for s, membros in grupos.items():
+            dist, parent = arvores[s]
+            for j in membros:
+                t = commodities[j][1]
+                restante = commodities[j][2] * escala
+                while restante > 0:
+                    if total_length >= 1:
+                        if not fases:
+                            return None
+                        break
+                    path = []
+                    v = t
+                    while v != s:
+                        a = parent[v]
+                        path.append(a)
+                        v = head[rev[a]]
+                    if sum(length[a] for a in path) > (1 + epsilon) * dist[t]:
+                        dist, parent = _shortest_tree(graph, length, s, destinos[s])
+                        continue
+                    c = min(restante, min(cap[a] for a in path))
+                    restante -= c
+                    roteado[j] += c
+                    for a in path:
+                        carga[a] += c
+                        if length[a]:
+                            total_length += epsilon * c * length[a]
+                            length[a] *= 1 + epsilon * c / cap[a]
+        fases += 1
+        rodada += 1
+        if rodada >= fases_por_rodada:
+            # Uma rodada inteira sem esgotar os comprimentos: o ótimo é pelo
+            # menos o dobro da escala atual
+            escala *= 2
+            rodada = 0
+
+    # Escala pelo congestionamento real: o fluxo devolvido cabe nas capacidades
+    carga = [c / congestionamento for c in carga]
+    roteado = [r / congestionamento for r in roteado]
+    return lam, max(superior, lam), roteado, carga
+
+
+def min_cut(graph, s):
+    """Corte mínimo s-t a partir do grafo residual de um fluxo máximo.
+
+    Uma única BFS residual a partir de ``s`` marca o lado da fonte; as arestas
+    (de capacidade positiva) que saem dele para o outro lado estão saturadas e
+    formam o corte. Devolve ``(alcancavel, arestas)``, com os índices das
+    arestas do corte na ordem em que foram passadas ao grafo.
+    """
+    level, _ = bfs_frontier(graph, s)
+    head, rev, cap, edge_arc = graph.head, graph.rev, graph.cap, graph.edge_arc
+    cut = []
+    for i in range(graph.num_edges):
+        a = edge_arc[i]
+        if cap[a] > 0 and level[head[rev[a]]] >= 0 and level[head[a]] < 0:
+            cut.append(i)
+    return [lvl >= 0 for lvl in level], cut
+
+
+class FlowNetwork:
+    """Rede de entrega pronta para o solver.
+
+    Traduz ids de vértices (de qualquer tipo) para índices contíguos e monta o
+    ``ResidualGraph`` de cada consulta, ligando uma super fonte/sumidouro quando
+    há mais de um depósito ou zona de entrega. Todos os endpoints de fluxo
+    passam por aqui, então os resultados são consistentes entre eles.
+    """
+
+    def __init__(self, vertex_ids, edges):
+        self.index = {}
+        for vid in vertex_ids:
+            self.index.setdefault(vid, len(self.index))
+        # Arestas podem citar vértices fora da lista (ex.: vértice removido)
+        self.edges = [
+            (self.index.setdefault(u, len(self.index)),
+             self.index.setdefault(v, len(self.index)),
+             cap)
+            for u, v, cap in edges
+        ]
+
+    def max_flow(self, sources, sinks, solver=None):
+        """Fluxo máximo dos ``sources`` para os ``sinks`` (ids de vértices)."""
+        sources = [self.index[v] for v in sources if v in self.index]
+        sinks = [self.index[v] for v in sinks if v in self.index]
+        if not sources or not sinks:
+            return 0
+
+        n = len(self.index)
+        if len(sources) == 1 and len(sinks) == 1:
+            graph = ResidualGraph(n, self.edges)
+            return max_flow(graph, sources[0], sinks[0], solver)
+
+        super_source = n
+        super_sink = n + 1
+        edges = list(self.edges)
+        edges += [(super_source, s, INF) for s in sources]
+        edges += [(t, super_sink, INF) for t in sinks]
+        graph = ResidualGraph(n + 2, edges)
+        return max_flow(graph, super_source, super_sink, solver)
+
+
+class MultiCommodityFlow:
+    """Demanda própria por zona de entrega, todas disputando as mesmas rotas.
+
+    ``edges`` traz ``(chave, u, v, capacidade)`` e ``commodities`` traz
+    ``(destino, demanda, origens)``. Commodities com o mesmo conjunto de
+    origens ganham uma única super fonte, o que mantém o número de árvores de
+    caminhos mínimos pequeno. ``ratio`` é a fração de todas as demandas que
+    pode ser atendida ao mesmo tempo (>= 1: todas cabem), ``upper_bound`` o
+    limite dual e ``routed`` o total roteado por commodity.
+    """
+
+    def __init__(self, vertex_ids, edges, commodities, epsilon=0.2):
+        index = {}
+        for vid in vertex_ids:
+            index.setdefault(vid, len(index))
+        self.keys = []
+        edge_list = []
+        for key, u, v, cap in edges:
+            self.keys.append(key)
+            edge_list.append((index.setdefault(u, len(index)), index.setdefault(v, len(index)), cap))
+
+        super_sources = {}
+        termos = []
+        inatendivel = False
+        self.routed = [0.0] * len(commodities)
+        for j, (destino, demanda, origens) in enumerate(commodities):
+            origens = tuple(sorted(index[o] for o in set(origens) if o in index))
+            t = index.get(destino)
+            if t is None or not origens:
+                inatendivel = True
+                continue
+            if t in origens:
+                # A zona é a própria origem: nada passa pela rede
+                self.routed[j] = demanda
+                continue
+            s = super_sources.setdefault(origens, len(index) + len(super_sources))
+            termos.append((j, s, t, demanda))
+        for origens, s in super_sources.items():
+            edge_list += [(s, o, INF) for o in origens]
+
+        self.graph = ResidualGraph(len(index) + len(super_sources), edge_list)
+        self._load = [0.0] * len(self.graph.cap)
+        if inatendivel or not termos:
+            # Zona desconhecida ou sem origem não pode ser atendida; sem nada a
+            # rotear pela rede, todas as demandas já estão atendidas
+            self.ratio = self.upper_bound = 0.0 if inatendivel else INF
+            return
+        with metrics.phase("solve", solver="multicommodity"):
+            self.ratio, self.upper_bound, routed, self._load = concurrent_flow(
+                self.graph, [(s, t, demanda) for _, s, t, demanda in termos], epsilon
+            )
+        for (j, _, _, _), r in zip(termos, routed):
+            self.routed[j] = r
+
+    def edge_flows(self):
+        """Fluxo (fracionário) de cada aresta, pela chave."""
+        edge_arc, load = self.graph.edge_arc, self._load
+        return {key: load[edge_arc[i]] for i, key in enumerate(self.keys)}
+
+
+def iter_flow_paths(graph, s, t):
+    """Decompõe o fluxo final em caminhos de ``s`` a ``t``, sem rodar o solver de novo.
+
+    Gera ``(quantidade, arcos)`` sob demanda, então cortar a sequência corta o
+    trabalho. Cada vértice guarda um ponteiro para o próximo arco com fluxo
+    restante, de modo que cada arco é examinado uma única vez no total; o
+    custo é O(V + E) mais o tamanho dos caminhos gerados. Ciclos de fluxo
+    encontrados no caminho são cancelados (não contribuem para o valor).
+    """
+    offsets, head = graph.offsets, graph.head
+    remaining = array('q', graph.flow)
+    current = array('q', offsets)
+    while True:
+        arcs = []
+        position = {s: 0}
+        u = s
+        while u != t:
+            i = current[u]
+            end = offsets[u + 1]
+            while i < end and remaining[i] <= 0:
+                i += 1
+            current[u] = i
+            if i == end:
+                # Só a fonte fica sem saída quando o fluxo é válido
+                return
+            v = head[i]
+            k = position.get(v)
+            if k is not None:
+                cycle = arcs[k:]
+                cycle.append(i)
+                amount = min(remaining[a] for a in cycle)
+                for a in cycle:
+                    remaining[a] -= amount
+                for a in arcs[k:]:
+                    del position[head[a]]
+                del arcs[k:]
+                u = v
+                continue
+            arcs.append(i)
+            position[v] = len(arcs)
+            u = v
+        amount = min(remaining[a] for a in arcs)
+        for a in arcs:
+            remaining[a] -= amount
+        yield amount, arcs
+
+
+def _terminal_graph(n, edges, sources, sinks):
+    """CSR das arestas ``{chave: (u, v, cap)}`` com super fonte ``n`` e super sumidouro ``n + 1``.
+
+    Devolve ``(grafo, posições)``; as arestas de terminal têm as chaves
+    ``("fonte", s)`` e ``("sumidouro", t)``.
+    """
+    keys = list(edges)
+    edge_list = list(edges.values())
+    for s in sources:
+        keys.append(("fonte", s))
+        edge_list.append((n, s, INF))
+    for t in sinks:
+        keys.append(("sumidouro", t))
+        edge_list.append((t, n + 1, INF))
+    return ResidualGraph(n + 2, edge_list), {key: i for i, key in enumerate(keys)}
+
+
+class CompiledNetwork:
+    """A rede de uma versão já traduzida para o solver.
+
+    Guarda o índice dos vértices, as arestas por chave (em índices) e, por
+    conjunto de terminais, um CSR modelo com a super fonte/sumidouro já
+    ligados. Nada disso muda depois de montado: os fluxos criados com
+    ``compiled`` partem de ``ResidualGraph.copy`` do modelo, copiando só
+    capacidades e fluxo em vez de remontar índice e CSR.
+    """
+
+    def __init__(self, vertex_ids, edges, max_graphs=8):
+        self.index = {}
+        for vid in vertex_ids:
+            self.index.setdefault(vid, len(self.index))
+        index = self.index
+        self.edges = {
+            key: (index.setdefault(u, len(index)), index.setdefault(v, len(index)), cap)
+            for key, u, v, cap in edges
+        }
+        self.total_capacity = sum(max(cap, 0) for _, _, cap in self.edges.values())
+        self.max_graphs = max_graphs
+        self._grafos = OrderedDict()
+        self._lock = Lock()
+
+    def graph(self, sources, sinks):
+        """``(grafo modelo, posições)`` para os terminais dados (índices). Não altere o modelo."""
+        chave = (tuple(sources), tuple(sinks))
+        with self._lock:
+            cached = self._grafos.get(chave)
+            if cached is not None:
+                self._grafos.move_to_end(chave)
+                return cached
+        cached = _terminal_graph(len(self.index), self.edges, sources, sinks)
+        with self._lock:
+            cached = self._grafos.setdefault(chave, cached)
+            while len(self._grafos) > self.max_graphs:
+                self._grafos.popitem(last=False)
+        return cached
+
+
+class CondensedNetwork:
+    """A rede de uma versão condensada para muitas consultas de fluxo máximo entre pares.
+
+    Rotas paralelas viram uma só (capacidades somadas) e cadeias de vértices
+    de passagem (uma única rota entrando, de u, e uma saindo, para w != u)
+    viram uma rota u -> w com a menor capacidade da cadeia, o que não muda o
+    fluxo máximo entre os vértices mantidos. Vértices pendurados (só uma rota
+    entrando e nenhuma saindo, como zonas na ponta de um hub, ou o contrário)
+    também saem do grafo. Um vértice contraído continua valendo como origem
+    ou destino: o fluxo sai (ou chega) pela cadeia até o primeiro vértice
+    mantido, limitado pela menor capacidade no caminho.
+
+    Cada par de vértices mantidos é resolvido uma vez no grafo condensado e
+    memorizado, então consultas da mesma região (zonas penduradas no mesmo
+    hub) dividem a resolução. Se toda rota tem a volta com a mesma
+    capacidade a rede é não direcionada (``symmetric``) e ``gomory_hu()``
+    monta a árvore de fluxos equivalentes de Gusfield com n - 1 fluxos
+    máximos; a partir daí qualquer par sai do menor peso no caminho da
+    árvore, sem resolver nada.
+    """
+
+    def __init__(self, vertex_ids, edges):
+        inicio = time.perf_counter()
+        self.index = {}
+        for vid in vertex_ids:
+            self.index.setdefault(vid, len(self.index))
+        index = self.index
+        saida, entrada = {}, {}
+        for _, u, v, cap in edges:
+            u, v = index.setdefault(u, len(index)), index.setdefault(v, len(index))
+            # Laços e rotas sem capacidade não carregam fluxo
+            if u == v or cap <= 0:
+                continue
+            saida.setdefault(u, {})
+            saida[u][v] = saida[u].get(v, 0) + cap
+            entrada.setdefault(v, {})
+            entrada[v][u] = entrada[v].get(u, 0) + cap
+        n = len(index)
+        self.symmetric = all(
+            saida.get(w, {}).get(v) == cap for v, vizinhos in saida.items() for w, cap in vizinhos.items()
+        )
+
+        # Vértices de passagem e pendurados, com seus vizinhos originais (vizinho, capacidade)
+        self._proximo = {}
+        self._anterior = {}
+        for v in range(n):
+            de, para = entrada.get(v) or {}, saida.get(v) or {}
+            if len(de) > 1 or len(para) > 1 or not de and not para or de.keys() == para.keys():
+                continue
+            if de:
+                self._anterior[v] = next(iter(de.items()))
+            if para:
+                self._proximo[v] = next(iter(para.items()))
+        # Um ciclo só de vértices de passagem não tem onde ancorar: um vértice
+        # de cada ciclo fica mantido
+        resolvidos = set()
+        for v in list(self._proximo):
+            caminho = set()
+            while v in self._proximo and v in self._anterior and v not in resolvidos and v not in caminho:
+                caminho.add(v)
+                v, _ = self._anterior[v]
+            if v in caminho:
+                del self._proximo[v], self._anterior[v]
+            resolvidos |= caminho
+
+        self.kept = [v for v in range(n) if v not in self._proximo and v not in self._anterior]
+        posicao = {v: i for i, v in enumerate(self.kept)}
+        self._posicao = posicao
+        condensadas = {}
+        for u in self.kept:
+            for v, cap in saida.get(u, {}).items():
+                # A cadeia inteira vira uma rota até o próximo vértice mantido
+                w, limite = self._subir(v, self._proximo, -1)
+                if w != u and w in posicao:
+                    chave = (posicao[u], posicao[w])
+                    condensadas[chave] = condensadas.get(chave, 0) + min(cap, limite)
+        self.graph = ResidualGraph(len(self.kept), [(u, v, cap) for (u, v), cap in condensadas.items()])
+        self._memo = {}
+        self._lock = Lock()
+        self._pai = None
+        self._peso = None
+        self._profundidade = None
+        self.solves = 0
+        metrics.phase_done("condense", inicio)
+
+    def _subir(self, v, passos, alvo):
+        """Segue a cadeia de ``v`` até um vértice mantido; devolve ``(vértice, limite)``.
+
+        Se passar por ``alvo`` no caminho devolve ``(None, limite até ele)``.
+        """
+        limite = INF
+        while v in passos:
+            v, cap = passos[v]
+            limite = min(limite, cap)
+            if v == alvo:
+                return None, limite
+        return v, limite
+
+    def max_flow(self, s, t, solver=None):
+        """Fluxo máximo de ``s`` a ``t`` (ids de vértices) na rede original."""
+        s, t = self.index.get(s), self.index.get(t)
+        if s is None or t is None or s == t:
+            return 0
+        s, limite_s = self._subir(s, self._proximo, t)
+        if s is None:
+            return limite_s
+        t, limite_t = self._subir(t, self._anterior, s)
+        if t is None:
+            return min(limite_s, limite_t)
+        # A cadeia termina num vértice pendurado: sem saída (ou sem entrada)
+        if s not in self._posicao or t not in self._posicao:
+            return 0
+        limite = min(limite_s, limite_t)
+        if s == t:
+            return limite
+        return min(limite, self._entre_mantidos(self._posicao[s], self._posicao[t], solver))
+
+    def _entre_mantidos(self, s, t, solver):
+        if self._pai is not None:
+            return self._na_arvore(s, t)
+        valor = self._memo.get((s, t))
+        if valor is None:
+            graph = self.graph.copy()
+            valor = max_flow(graph, s, t, solver)
+            with self._lock:
+                self._memo[(s, t)] = valor
+                self.solves += 1
+        return valor
+
+    def gomory_hu(self, solver=None):
+        """Monta a árvore de Gomory–Hu (Gusfield); só para redes não direcionadas."""
+        if not self.symmetric:
+            raise ValueError("A árvore de Gomory–Hu só vale para redes não direcionadas")
+        n = self.graph.n
+        pai = [0] * n
+        peso = [INF] * n
+        with metrics.phase("gomory_hu"):
+            for i in range(1, n):
+                graph = self.graph.copy()
+                peso[i] = max_flow(graph, i, pai[i], solver)
+                lado, _ = min_cut(graph, i)
+                for j in range(i + 1, n):
+                    if lado[j] and pai[j] == pai[i]:
+                        pai[j] = i
+        self.solves += n - 1
+        # pai[j] < j: a profundidade sai numa passada
+        profundidade = [0] * n
+        for j in range(1, n):
+            profundidade[j] = profundidade[pai[j]] + 1
+        self._pai, self._peso, self._profundidade = pai, peso, profundidade
+
+    def _na_arvore(self, s, t):
+        pai, peso, profundidade = self._pai, self._peso, self._profundidade
+        menor = INF
+        while s != t:
+            if profundidade[s] < profundidade[t]:
+                s, t = t, s
+            menor = min(menor, peso[s])
+            s = pai[s]
+        return menor
+
+    def stats(self):
+        return {
+            "vertices": len(self.index),
+            "vertices_mantidos": len(self.kept),
+            "vertices_contraidos": len(self.index) - len(self.kept),
+            "rotas_condensadas": self.graph.num_edges,
+            "nao_direcionada": self.symmetric,
+            "arvore_gomory_hu": self._pai is not None,
+            "pares_memorizados": len(self._memo),
+            "resolucoes": self.solves,
+        }
+
+
+class IncrementalMaxFlow:
+    """Fluxo máximo mantido em memória entre mutações da rede.
+
+    As arestas são identificadas por uma chave (o ``aresta_id``). Aumentar a
+    capacidade de uma aresta saturada só aumenta o fluxo já existente; reduzir
+    abaixo do fluxo atual cancela o excedente nos caminhos que passam por ela e
+    reaumenta. Inserir arestas ou vértices reconstrói o CSR, mas preserva o
+    fluxo de cada aresta.
+
+    ``flows`` permite partir de um fluxo já conhecido (ex.: de um snapshot),
+    por aresta; nesse caso o solver só completa o que faltar.
+
+    Com ``compiled`` (uma ``CompiledNetwork``) ``vertex_ids`` e ``edges`` são
+    ignorados e o grafo sai de uma cópia do modelo da rede compilada;
+    ``zeroed`` são as chaves das arestas que ficam com capacidade zero neste
+    fluxo (ex.: rotas bloqueadas).
+    """
+
+    def __init__(self, vertex_ids, edges, sources, sinks, solver=None, flows=None, compiled=None, zeroed=()):
+        self.graph = None
+        if compiled is not None:
+            self._compilado(compiled, sources, sinks, zeroed)
+        else:
+            self.index = {}
+            for vid in vertex_ids:
+                self._vertex(vid)
+            self.sources = [self._vertex(v) for v in sources]
+            self.sinks = [self._vertex(v) for v in sinks]
+            self.edges = {}
+            for key, u, v, cap in edges:
+                self.edges[key] = (self._vertex(u), self._vertex(v), cap)
+            self._build()
+        if flows and self._load_flows(flows):
+            self._augment()
+        else:
+            self._solve(solver)
+
+    def _solve(self, solver=None):
+        self.graph.reset()
+        max_flow(self.graph, self.source, self.sink, solver)
+        self._update_value()
+
+    def _vertex(self, vid):
+        return self.index.setdefault(vid, len(self.index))
+
+    def _compilado(self, compiled, sources, sinks, zeroed):
+        zeroed = set(zeroed)
+        self.index = dict(compiled.index)
+        self.sources = [self._vertex(v) for v in sources]
+        self.sinks = [self._vertex(v) for v in sinks]
+        self.edges = dict(compiled.edges)
+        for key in zeroed:
+            if key in self.edges:
+                self.edges[key] = self.edges[key][:2] + (0,)
+        n = len(compiled.index)
+        if len(self.index) != n:
+            # Terminal fora da rede compilada: o modelo não serve, monta do zero
+            self._build()
+            return
+        self.source = n
+        self.sink = n + 1
+        modelo, position = compiled.graph(self.sources, self.sinks)
+        self.graph = modelo.copy()
+        self.position = dict(position)
+        self.total_capacity = compiled.total_capacity
+        cap, edge_arc = self.graph.cap, self.graph.edge_arc
+        for key in zeroed:
+            i = self.position.get(key)
+            if i is not None:
+                self.total_capacity -= max(cap[edge_arc[i]], 0)
+                cap[edge_arc[i]] = 0
+
+    def _build(self):
+        n = len(self.index)
+        self.source = n
+        self.sink = n + 1
+        old_graph, old_position = self.graph, getattr(self, "position", {})
+        self.graph, self.position = _terminal_graph(n, self.edges, self.sources, self.sinks)
+        self.total_capacity = sum(max(cap, 0) for _, _, cap in self.edges.values())
+
+        if old_graph is not None:
+            flow, rev = self.graph.flow, self.graph.rev
+            for key, i in self.position.items():
+                if key in old_position:
+                    f = old_graph.edge_flow(old_position[key])
+                    a = self.graph.edge_arc[i]
+                    flow[a] = f
+                    flow[rev[a]] = -f
+
+    def _load_flows(self, flows):
+        """Carrega fluxos por aresta; devolve False se não formarem um fluxo válido."""
+        if set(self.sources) & set(self.sinks):
+            return False
+        graph = self.graph
+        flow, rev, head = graph.flow, graph.rev, graph.head
+        balance = [0] * graph.n
+        for key, f in flows.items():
+            i = self.position.get(key)
+            if i is None or isinstance(key, tuple):
+                continue
+            a = graph.edge_arc[i]
+            if not 0 <= f <= graph.cap[a]:
+                return False
+            flow[a] = f
+            flow[rev[a]] = -f
+            balance[head[rev[a]]] += f
+            balance[head[a]] -= f
+        # A super fonte/sumidouro cobrem o saldo de cada depósito e zona
+        for s in self.sources:
+            a = graph.edge_arc[self.position[("fonte", s)]]
+            flow[a] = balance[s]
+            flow[rev[a]] = -balance[s]
+            balance[s] = 0 if balance[s] >= 0 else balance[s]
+        for t in self.sinks:
+            a = graph.edge_arc[self.position[("sumidouro", t)]]
+            flow[a] = -balance[t]
+            flow[rev[a]] = balance[t]
+            balance[t] = 0 if balance[t] <= 0 else balance[t]
+        return not any(balance)
+
+    def fork(self):
+        """Cópia independente, já com o fluxo atual (ex.: para um cenário).
+
+        A estrutura do CSR (offsets, head, rev, edge_arc) nunca é alterada no
+        lugar, então é compartilhada; só capacidades e fluxos são copiados.
+        Mudanças estruturais na cópia reconstroem o grafo dela sem tocar no
+        original.
+        """
+        clone = copy.copy(self)
+        clone.graph = copy.copy(self.graph)
+        clone.graph.cap = array('q', self.graph.cap)
+        clone.graph.flow = array('q', self.graph.flow)
+        clone.index = dict(self.index)
+        clone.edges = dict(self.edges)
+        clone.position = dict(self.position)
+        clone.sources = list(self.sources)
+        clone.sinks = list(self.sinks)
+        return clone
+
+    def edge_flows(self):
+        """Fluxo atual de cada aresta, pela chave."""
+        graph = self.graph
+        return {
+            key: graph.flow[graph.edge_arc[i]]
+            for key, i in self.position.items()
+            if not isinstance(key, tuple)
+        }
+
+    def edge_usage(self):
+        """``(fluxo, folga)`` de cada aresta, pela chave."""
+        graph = self.graph
+        usage = {}
+        for key, i in self.position.items():
+            if not isinstance(key, tuple):
+                a = graph.edge_arc[i]
+                usage[key] = (graph.flow[a], graph.cap[a] - graph.flow[a])
+        return usage
+
+    def min_cut(self):
+        """Chaves das arestas do corte mínimo atual: os gargalos reais do fluxo."""
+        keys = {i: key for key, i in self.position.items() if not isinstance(key, tuple)}
+        _, cut = min_cut(self.graph, self.source)
+        return [keys[i] for i in cut if i in keys]
+
+    def _update_value(self):
+        offsets, flow = self.graph.offsets, self.graph.flow
+        self.value = sum(flow[a] for a in range(offsets[self.source], offsets[self.source + 1]))
+
+    def _augment(self):
+        with metrics.phase("augment"):
+            dinic(self.graph, self.source, self.sink)
+        self._update_value()
+
+    def _flow_path(self, start, targets, backward):
+        """Caminho (DFS) pelos arcos com fluxo, a partir de ``start``.
+
+        Para trás segue o fluxo que entra em cada vértice; para frente, o que sai.
+        """
+        offsets, head, rev, flow = self.graph.offsets, self.graph.head, self.graph.rev, self.graph.flow
+        parent = {start: -1}
+        stack = [start]
+        while stack:
+            u = stack.pop()
+            if u in targets and u != start:
+                arcs = []
+                v = u
+                while v != start:
+                    b = parent[v]
+                    arcs.append(b)
+                    v = head[rev[b]]
+                return arcs, u
+            for b in range(offsets[u], offsets[u + 1]):
+                v = head[b]
+                if v not in parent and (flow[b] < 0 if backward else flow[b] > 0):
+                    parent[v] = b
+                    stack.append(v)
+        return None, None
+
+    def _cancel(self, u, v, amount):
+        """Desfaz ``amount`` unidades que entravam em ``u`` e saíam de ``v``
+        depois que o arco u->v perdeu capacidade."""
+        rev, flow = self.graph.rev, self.graph.flow
+        surplus = deficit = amount
+        while surplus > 0:
+            arcs, end = self._flow_path(u, {self.source, v}, backward=True)
+            if arcs is None:
+                break
+            d = min(surplus, min(-flow[b] for b in arcs))
+            for b in arcs:
+                flow[b] += d
+                flow[rev[b]] -= d
+            surplus -= d
+            if end == v:
+                deficit -= d
+        while deficit > 0:
+            arcs, _ = self._flow_path(v, {self.sink}, backward=False)
+            if arcs is None:
+                break
+            d = min(deficit, min(flow[b] for b in arcs))
+            for b in arcs:
+                flow[b] -= d
+                flow[rev[b]] += d
+            deficit -= d
+
+    def set_capacity(self, key, u, v, capacity):
+        """Define a capacidade da aresta ``key`` (criando-a se for nova)."""
+        i = self.position.get(key)
+        if i is None:
+            self.edges[key] = (self._vertex(u), self._vertex(v), capacity)
+            self._build()
+            self._augment()
+            return self.value
+
+        graph = self.graph
+        a = graph.edge_arc[i]
+        old = graph.cap[a]
+        self.edges[key] = self.edges[key][:2] + (capacity,)
+        graph.cap[a] = capacity
+        self.total_capacity += max(capacity, 0) - max(old, 0)
+        if self.total_capacity >= graph.inf_capacity:
+            # O teto "infinito" da super fonte/sumidouro precisa continuar folgado
+            graph.inf_capacity = 2 * self.total_capacity + 1
+            for key_i, j in self.position.items():
+                if isinstance(key_i, tuple):
+                    graph.cap[graph.edge_arc[j]] = graph.inf_capacity
+
+        if capacity > old:
+            # Só uma aresta saturada pode estar num corte mínimo
+            if graph.flow[a] == old:
+                self._augment()
+        elif graph.flow[a] > capacity:
+            excess = graph.flow[a] - capacity
+            graph.flow[a] = capacity
+            graph.flow[graph.rev[a]] = -capacity
+            self._cancel(graph.head[graph.rev[a]], graph.head[a], excess)
+            self._augment()
+        return self.value
+
+    def remove_edge(self, key):
+        if key not in self.position or key not in self.edges:
+            return self.value
+        u, v, _ = self.edges[key]
+        self.set_capacity(key, u, v, 0)
+        # O arco zerado só sai do CSR na próxima reconstrução
+        del self.edges[key]
+        del self.position[key]
+        return self.value
+
+    def value_without(self, keys):
+        """Fluxo máximo com as arestas ``keys`` zeradas, partindo do fluxo atual.
+
+        Só o fluxo que passava pelas arestas é cancelado e reaumentado; ao
+        final capacidades, fluxos e valor voltam ao que eram, então o mesmo
+        objeto serve para avaliar várias remoções seguidas.
+        """
+        graph = self.graph
+        cap, flow, value = array('q', graph.cap), array('q', graph.flow), self.value
+        try:
+            for key in keys:
+                if key not in self.edges:
+                    continue
+                a = graph.edge_arc[self.position[key]]
+                excess = graph.flow[a]
+                graph.cap[a] = 0
+                if excess > 0:
+                    graph.flow[a] = 0
+                    graph.flow[graph.rev[a]] = 0
+                    self._cancel(graph.head[graph.rev[a]], graph.head[a], excess)
+            self._augment()
+            return self.value
+        finally:
+            graph.cap[:] = cap
+            graph.flow[:] = flow
+            self.value = value
+
+    def flow_paths(self, offset=0, limit=None):
+        """Decomposição do fluxo atual em ``(quantidade, caminho)``, a partir do ``offset``.
+
+        Os caminhos são pares de índices de vértices, sem a super fonte/sumidouro.
+        Com ``limit`` só são gerados os caminhos da página pedida.
+        """
+        graph, source, sink = self.graph, self.source, self.sink
+        paths = (
+            (amount, [(u, v) for u, v in _path_edges(graph, arcs) if u != source and v != sink])
+            for amount, arcs in iter_flow_paths(graph, source, sink)
+        )
+        stop = None if limit is None else offset + limit
+        with metrics.phase("paths"):
+            return list(islice((p for p in paths if p[1]), offset, stop))
+
+
+class MinCostFlow(IncrementalMaxFlow):
+    """Fluxo máximo de custo mínimo com a mesma interface de ``IncrementalMaxFlow``.
+
+    ``edges`` traz ``(chave, u, v, capacidade, custo)``. Corte mínimo, folgas
+    e decomposição funcionam igual, mas cada mutação re-resolve do zero:
+    aumentar o fluxo existente não preserva o custo mínimo.
+    """
+
+    def __init__(self, vertex_ids, edges, sources, sinks, flows=None):
+        edges = list(edges)
+        self.costs = {key: cost for key, _, _, _, cost in edges}
+        self.cost = 0
+        super().__init__(vertex_ids, [edge[:4] for edge in edges], sources, sinks, flows=flows)
+
+    def _build(self):
+        super()._build()
+        graph = self.graph
+        self.arc_cost = _zeros(len(graph.cap))
+        for key, i in self.position.items():
+            a = graph.edge_arc[i]
+            self.arc_cost[a] = self.costs.get(key, 0)
+            self.arc_cost[graph.rev[a]] = -self.arc_cost[a]
+
+    def _solve(self, solver=None):
+        self.graph.reset()
+        with metrics.phase("solve", solver="min_cost"):
+            self.value, self.cost = min_cost_max_flow(self.graph, self.arc_cost, self.source, self.sink)
+
+    def _augment(self):
+        self._solve()
+
+
+class TimeExpandedFlow:
+    """Volume máximo que chega às zonas dentro de um horizonte de ``horizon`` intervalos.
+
+    ``edges`` traz ``(chave, u, v, capacidade, transito)``: a capacidade vale
+    por intervalo e o que parte de ``u`` no intervalo θ chega a ``v`` em
+    θ + transito (só conta se chegar antes do fim do horizonte). ``holdover``
+    dá, por vértice, quanto pode ficar guardado de um intervalo para o
+    seguinte (INF: sem limite; ausentes não guardam nada) e ``windows``
+    restringe a alguns intervalos ``[inicio, fim)`` as partidas de algumas
+    arestas (turnos).
+
+    Sem janelas a rede é a mesma em todo intervalo e o ótimo é um fluxo
+    estático repetido no tempo (Ford–Fulkerson): fluxo de custo mínimo no
+    grafo compacto com o trânsito como custo, parando quando o caminho mais
+    curto não cabe mais no horizonte. Cada caminho de duração d é enviado
+    nas ``horizon - d`` partidas possíveis e guardar carga não aumenta o
+    volume. Com janelas o fluxo repetido (só nas partidas em que o caminho
+    inteiro está aberto) é o ponto de partida de um Dinic sobre a rede
+    expandida no tempo, que nunca é montada: os nós (v, θ) e seus arcos
+    saem das listas de adjacência do grafo compacto e só os fluxos por
+    (aresta, θ) e (vértice, θ) ficam em arrays planos. ``expand`` força um
+    dos dois métodos (None: expandida só se houver janelas).
+    """
+
+    def __init__(self, vertex_ids, edges, sources, sinks, horizon, holdover=None, windows=None, expand=None):
+        if horizon < 1:
+            raise ValueError("O horizonte precisa de ao menos um intervalo")
+        index = {}
+        for vid in vertex_ids:
+            index.setdefault(vid, len(index))
+        self.keys, self._u, self._v, self._cap, self._transito = [], [], [], [], []
+        for key, u, v, cap, transito in edges:
+            if transito < 0:
+                raise ValueError(f"Tempo de trânsito negativo na aresta {key}")
+            self.keys.append(key)
+            self._u.append(index.setdefault(u, len(index)))
+            self._v.append(index.setdefault(v, len(index)))
+            self._cap.append(cap)
+            self._transito.append(transito)
+        self.ids = list(index)
+        self.horizon = T = horizon
+        self.n = len(index)
+        self.sources = sorted({index[v] for v in sources if v in index})
+        # Zona que também é origem seria atendida sem passar pela rede
+        self.sinks = sorted({index[v] for v in sinks if v in index} - set(self.sources))
+        self.method = "time_expanded" if (windows if expand is None else expand) else "temporally_repeated"
+        self.rounds = 0
+
+        # Janelas por aresta: None = sempre aberta, senão 0/1 por intervalo de partida
+        self._janela = [None] * len(self.keys)
+        posicao = {key: i for i, key in enumerate(self.keys)}
+        for key, intervalos in (windows or {}).items():
+            i = posicao.get(key)
+            if i is None:
+                continue
+            aberta = bytearray(T)
+            for inicio, fim in intervalos:
+                inicio, fim = max(0, inicio), min(T, fim)
+                if inicio < fim:
+                    aberta[inicio:fim] = b"\x01" * (fim - inicio)
+            self._janela[i] = aberta
+
+        self.value = 0
+        self.static_rate = 0
+        self.deliveries = [0] * T
+        self.paths = []
+        self._volumes = {}
+        if not self.sources or not self.sinks:
+            return
+        self._repetido()
+        if self.method == "time_expanded":
+            self._expandido(holdover or {}, index)
+
+    def _repetido(self):
+        """Fluxo estático de custo mínimo e sua repetição ao longo do horizonte."""
+        n, T = self.n, self.horizon
+        S, Z = n, n + 1
+        lista = list(zip(self._u, self._v, self._cap))
+        lista += [(S, s, INF) for s in self.sources]
+        lista += [(z, Z, INF) for z in self.sinks]
+        graph = ResidualGraph(n + 2, lista)
+        custo = _zeros(len(graph.cap))
+        aresta_do_arco = {}
+        for i, transito in enumerate(self._transito):
+            a = graph.edge_arc[i]
+            custo[a] = transito
+            custo[graph.rev[a]] = -transito
+            aresta_do_arco[a] = i
+        with metrics.phase("solve", solver="time_expanded"):
+            self.static_rate, _ = min_cost_max_flow(graph, custo, S, Z, max_distance=T)
+        self.rounds = graph.rounds
+
+        # Os potenciais finais limitam a duração de todo caminho com fluxo ao
+        # último custo aumentado, então todos cabem no horizonte
+        chegadas = [0] * T
+        with metrics.phase("paths"):
+            for quantidade, arcos in iter_flow_paths(graph, S, Z):
+                sequencia = [aresta_do_arco[a] for a in arcos if a in aresta_do_arco]
+                duracao = sum(self._transito[i] for i in sequencia)
+                self.paths.append((quantidade, duracao, sequencia))
+                chegadas[duracao] += quantidade
+        acumulado = 0
+        for theta in range(T):
+            acumulado += chegadas[theta]
+            self.deliveries[theta] = acumulado
+        for quantidade, duracao, sequencia in self.paths:
+            volume = quantidade * (T - duracao)
+            self.value += volume
+            for i in sequencia:
+                anterior = self._volumes.get(i, (0, 0))
+                self._volumes[i] = (anterior[0] + volume, anterior[1] + quantidade)
+
+    # Rede expandida implícita: o nó (v, θ) é v * T + θ
+
+    def _expandido(self, holdover, index):
+        n, T = self.n, self.horizon
+        E = len(self.keys)
+        self._saida = [[] for _ in range(n)]
+        self._entrada = [[] for _ in range(n)]
+        for i in range(E):
+            self._saida[self._u[i]].append(i)
+            self._entrada[self._v[i]].append(i)
+        # Guarda "sem limite": mais do que tudo que a rede consegue mover no horizonte
+        ilimitado = sum(max(cap, 0) for cap in self._cap) * T + 1
+        self._guarda = [0] * n
+        for vid, cap in holdover.items():
+            v = index.get(vid)
+            if v is not None:
+                self._guarda[v] = ilimitado if cap == INF else cap
+        self._zona = bytearray(n)
+        for z in self.sinks:
+            self._zona[z] = 1
+        self._fe = _zeros(E * T)
+        self._fh = _zeros(n * T)
+
+        # Ponto de partida: o fluxo repetido nas partidas com o caminho todo aberto
+        inicio = time.perf_counter()
+        janela, fe = self._janela, self._fe
+        self.value = 0
+        for quantidade, duracao, sequencia in self.paths:
+            deslocamentos = []
+            t = 0
+            for i in sequencia:
+                deslocamentos.append(t)
+                t += self._transito[i]
+            for theta in range(T - duracao):
+                if all(janela[i] is None or janela[i][theta + d] for i, d in zip(sequencia, deslocamentos)):
+                    for i, d in zip(sequencia, deslocamentos):
+                        fe[i * T + theta + d] += quantidade
+                    self.value += quantidade
+        metrics.phase_done("warm_start", inicio, solver="time_expanded")
+
+        with metrics.phase("solve", solver="time_expanded"):
+            while True:
+                level, alvo = self._niveis()
+                if alvo < 0:
+                    break
+                self.rounds += 1
+                self.value += self._bloqueante(level, alvo)
+        metrics.solver_rounds("time_expanded", self.rounds)
+
+        self.paths = []
+        self._volumes = {}
+        for i in range(E):
+            fluxos = fe[i * T:(i + 1) * T]
+            if any(fluxos):
+                self._volumes[i] = (sum(fluxos), max(fluxos))
+        self.deliveries = self._entregas()
+
+    def _niveis(self):
+        """BFS por níveis a partir da super fonte; devolve ``(level, nível do sumidouro)``."""
+        T = self.horizon
+        saida, entrada, zona, guarda = self._saida, self._entrada, self._zona, self._guarda
+        eu, ev, cap, transito, janela = self._u, self._v, self._cap, self._transito, self._janela
+        fe, fh = self._fe, self._fh
+        level = [-1] * (self.n * T)
+        fronteira = []
+        for s in self.sources:
+            for x in range(s * T, (s + 1) * T):
+                level[x] = 1
+                fronteira.append(x)
+        profundidade = 1
+        while fronteira:
+            if any(zona[x // T] for x in fronteira):
+                return level, profundidade + 1
+            profundidade += 1
+            proxima = []
+            for x in fronteira:
+                v, theta = divmod(x, T)
+                for i in saida[v]:
+                    chegada = theta + transito[i]
+                    if chegada < T:
+                        c = cap[i] if janela[i] is None else cap[i] * janela[i][theta]
+                        if fe[i * T + theta] < c:
+                            y = ev[i] * T + chegada
+                            if level[y] < 0:
+                                level[y] = profundidade
+                                proxima.append(y)
+                for i in entrada[v]:
+                    partida = theta - transito[i]
+                    if partida >= 0 and fe[i * T + partida] > 0:
+                        y = eu[i] * T + partida
+                        if level[y] < 0:
+                            level[y] = profundidade
+                            proxima.append(y)
+                if theta + 1 < T and fh[x] < guarda[v] and level[x + 1] < 0:
+                    level[x + 1] = profundidade
+                    proxima.append(x + 1)
+                if theta > 0 and fh[x - 1] > 0 and level[x - 1] < 0:
+                    level[x - 1] = profundidade
+                    proxima.append(x - 1)
+            fronteira = proxima
+        return level, -1
+
+    def _arco(self, x, k):
+        """k-ésimo arco residual do nó ``x``: ``(destino, residual)``, ou ``(-1, 0)``.
+
+        Ordem dos arcos: arestas saindo, arestas chegando (volta), guardar
+        para o intervalo seguinte e devolver o que foi guardado no anterior.
+        """
+        T = self.horizon
+        v, theta = divmod(x, T)
+        saida = self._saida[v]
+        if k < len(saida):
+            i = saida[k]
+            chegada = theta + self._transito[i]
+            if chegada >= T:
+                return -1, 0
+            janela = self._janela[i]
+            c = self._cap[i] if janela is None else self._cap[i] * janela[theta]
+            return self._v[i] * T + chegada, c - self._fe[i * T + theta]
+        k -= len(saida)
+        entrada = self._entrada[v]
+        if k < len(entrada):
+            i = entrada[k]
+            partida = theta - self._transito[i]
+            if partida < 0:
+                return -1, 0
+            return self._u[i] * T + partida, self._fe[i * T + partida]
+        if k == len(entrada):
+            return (x + 1, self._guarda[v] - self._fh[x]) if theta + 1 < T else (-1, 0)
+        return (x - 1, self._fh[x - 1]) if theta > 0 else (-1, 0)
+
+    def _empurrar(self, x, k, f):
+        T = self.horizon
+        v, theta = divmod(x, T)
+        saida = self._saida[v]
+        if k < len(saida):
+            self._fe[saida[k] * T + theta] += f
+            return
+        k -= len(saida)
+        entrada = self._entrada[v]
+        if k < len(entrada):
+            i = entrada[k]
+            self._fe[i * T + theta - self._transito[i]] -= f
+        elif k == len(entrada):
+            self._fh[x] += f
+        else:
+            self._fh[x - 1] -= f
+
+    def _bloqueante(self, level, alvo):
+        """Fluxo bloqueante de Dinic (DFS com ponteiro de arco atual por nó)."""
+        T = self.horizon
+        saida, entrada, zona = self._saida, self._entrada, self._zona
+        atual = _zeros(self.n * T)
+        total = 0
+        for s in self.sources:
+            for raiz in range(s * T, (s + 1) * T):
+                while level[raiz] == 1:
+                    caminho = []
+                    x = raiz
+                    while not (level[x] == alvo - 1 and zona[x // T]):
+                        v = x // T
+                        grau = len(saida[v]) + len(entrada[v]) + 2
+                        k = atual[x]
+                        proximo = level[x] + 1
+                        while k < grau:
+                            y, r = self._arco(x, k)
+                            if r > 0 and level[y] == proximo:
+                                break
+                            k += 1
+                        atual[x] = k
+                        if k < grau:
+                            caminho.append((x, k))
+                            x = y
+                            continue
+                        # Sem saída nesta fase
+                        level[x] = -1
+                        if not caminho:
+                            break
+                        x, k = caminho.pop()
+                        atual[x] += 1
+                    if level[raiz] != 1:
+                        break
+                    f = min(self._arco(x, k)[1] for x, k in caminho)
+                    for x, k in caminho:
+                        self._empurrar(x, k, f)
+                    total += f
+        return total
+
+    def _entregas(self):
+        """O que entra no sumidouro por intervalo: o saldo de cada (zona, θ)."""
+        T = self.horizon
+        fe, fh = self._fe, self._fh
+        entregas = [0] * T
+        for z in self.sinks:
+            for i in self._entrada[z]:
+                transito = self._transito[i]
+                for partida in range(T - transito):
+                    entregas[partida + transito] += fe[i * T + partida]
+            for i in self._saida[z]:
+                for theta in range(T):
+                    entregas[theta] -= fe[i * T + theta]
+            for theta in range(T):
+                entregas[theta] -= fh[z * T + theta]
+                if theta > 0:
+                    entregas[theta] += fh[z * T + theta - 1]
+        return entregas
+
+    def edge_volumes(self):
+        """``{chave: (volume no horizonte, pico)}`` das arestas usadas.
+
+        O pico é o maior fluxo da aresta num intervalo; no fluxo repetido é a
+        taxa estática, que o limita.
+        """
+        return {self.keys[i]: volume for i, volume in self._volumes.items()}
+
+    def route_paths(self):
+        """Caminhos do fluxo repetido: ``(taxa, trânsito, partidas, chaves, vértices)``."""
+        T = self.horizon
+        return [
+            (quantidade, duracao, T - duracao, [self.keys[i] for i in sequencia],
+             [self.ids[self._u[sequencia[0]]]] + [self.ids[self._v[i]] for i in sequencia])
+            for quantidade, duracao, sequencia in self.paths
+        ]
@@ -0,0 +1,220 @@
+"""Atualizações da rede em tempo real por WebSocket.
+
+O ``LiveHub`` escuta as mutações do ``NetworkStore`` e só anota o que mudou.
+Um único laço junta as mutações de uma janela de ``COALESCE_INTERVAL``
+segundos, calcula o estado novo uma vez (o fluxo e o corte vêm do fluxo
+mantido, que as mutações já atualizaram) e serializa o diff uma vez; todos os
+clientes recebem o mesmo texto. Cada cliente tem uma fila curta: quem não
+acompanha perde os diffs pendentes e recebe um snapshot completo no lugar.
+Clientes novos também entram pelo snapshot do próximo lote.
+"""
+import asyncio
+import logging
+import os
+from threading import Lock
+
+import orjson
+
+COALESCE_INTERVAL = float(os.environ.get("DELIVERY_LIVE_INTERVAL", "0.25"))
+CLIENT_QUEUE = 8
+
+logger = logging.getLogger(__name__)
+
+
+class _Cliente:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.fila = asyncio.Queue(CLIENT_QUEUE)
+
+
+class LiveHub:
+    """Distribui diffs da rede para os clientes conectados.
+
+    ``calcular(arestas, vertices, completo)`` roda fora do event loop e
+    devolve o estado atual: ``versao``, ``bloqueadas``, ``max_flow``,
+    ``fluxos`` ({aresta_id: fluxo}), ``corte`` (aresta_ids) e as linhas de
+    ``arestas`` e ``vertices`` pedidas (todas com ``completo``), com None para
+    as removidas.
+    """
+
+    def __init__(self, calcular, interval=COALESCE_INTERVAL):
+        self.calcular = calcular
+        self.interval = interval
+        self.lotes = 0
+        self._clientes = set()
+        self._novos = set()
+        self._lock = Lock()
+        self._arestas = set()
+        self._vertices = set()
+        self._completo = False
+        self._ultimo = None
+        self._loop = None
+        self._sinal = None
+        self._task = None
+
+    # Mutações (chamado pelo store, em qualquer thread)
+
+    def notify(self, operacao, args, versao):
+        with self._lock:
+            if operacao in ("add_aresta", "add_vertice"):
+                alvo = self._arestas if operacao == "add_aresta" else self._vertices
+                alvo.add(args[0].aresta_id if operacao == "add_aresta" else args[0].vertice_id)
+            elif operacao in ("update_aresta", "remove_aresta"):
+                self._arestas.add(args[0])
+            elif operacao in ("update_vertice", "remove_vertice"):
+                self._vertices.add(args[0])
+            elif operacao != "set_bloqueio":
+                # Carga em lote, reset e afins: mais barato mandar tudo de novo
+                self._completo = True
+        self._acordar()
+
+    def _acordar(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._sinal.set)
+
+    # Laço de envio
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._sinal = asyncio.Event()
+        self._task = asyncio.create_task(self._laco())
+
+    def stop(self):
+        self._loop = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _laco(self):
+        while True:
+            await self._sinal.wait()
+            # Janela de coalescência: mutações que chegarem agora vão no mesmo lote
+            await asyncio.sleep(self.interval)
+            self._sinal.clear()
+            if not self._clientes:
+                with self._lock:
+                    self._arestas, self._vertices, self._completo = set(), set(), False
+                self._ultimo = None
+                continue
+            try:
+                await self._lote()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Tenta de novo no próximo lote, com um snapshot para todos
+                logger.exception("falha ao calcular atualização da rede")
+                with self._lock:
+                    self._completo = True
+                self._sinal.set()
+
+    async def _lote(self):
+        with self._lock:
+            arestas, vertices = self._arestas, self._vertices
+            completo = self._completo or self._ultimo is None
+            self._arestas, self._vertices, self._completo = set(), set(), False
+        novos, self._novos = self._novos, set()
+        estado = await self.calcular(arestas, vertices, completo or bool(novos))
+
+        mensagens = {}
+        if completo or novos:
+            mensagens["snapshot"] = orjson.dumps(self._snapshot(estado), option=orjson.OPT_NON_STR_KEYS).decode()
+        if not completo:
+            diff = self._diff(estado, arestas, vertices)
+            if diff is not None:
+                mensagens["diff"] = orjson.dumps(diff, option=orjson.OPT_NON_STR_KEYS).decode()
+        self._ultimo = estado
+        self.lotes += 1
+
+        for cliente in list(self._clientes):
+            tipo = "snapshot" if completo or cliente in novos else "diff"
+            if tipo in mensagens:
+                self._entregar(cliente, mensagens[tipo])
+
+    def _entregar(self, cliente, payload):
+        try:
+            cliente.fila.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Cliente lento: os diffs pendentes não servem mais, recomeça do snapshot
+            while not cliente.fila.empty():
+                cliente.fila.get_nowait()
+            self._novos.add(cliente)
+            self._sinal.set()
+
+    @staticmethod
+    def _snapshot(estado):
+        return {
+            "type": "snapshot",
+            "versao": estado["versao"],
+            "vertices": [v for v in estado["vertices"].values() if v is not None],
+            "arestas": [a for a in estado["arestas"].values() if a is not None],
+            "bloqueadas": estado["bloqueadas"],
+            "max_flow": estado["max_flow"],
+            "fluxos": estado["fluxos"],
+            "corte": sorted(estado["corte"]),
+        }
+
+    def _diff(self, estado, arestas, vertices):
+        ultimo = self._ultimo
+        diff = {"type": "diff", "versao": estado["versao"], "desde": ultimo["versao"]}
+        mudou = False
+        for campo, removidas_campo, ids in (
+            ("arestas", "arestas_removidas", arestas),
+            ("vertices", "vertices_removidos", vertices),
+        ):
+            linhas = estado[campo]
+            alteradas = [linhas[i] for i in ids if linhas.get(i) is not None]
+            removidas = sorted(i for i in ids if linhas.get(i) is None)
+            if alteradas:
+                diff[campo] = alteradas
+                mudou = True
+            if removidas:
+                diff[removidas_campo] = removidas
+                mudou = True
+        if estado["bloqueadas"] != ultimo["bloqueadas"]:
+            diff["bloqueadas"] = estado["bloqueadas"]
+            mudou = True
+        if estado["max_flow"] != ultimo["max_flow"]:
+            diff["max_flow"] = estado["max_flow"]
+            mudou = True
+        antes, agora = ultimo["fluxos"], estado["fluxos"]
+        fluxos = {i: f for i, f in agora.items() if antes.get(i) != f}
+        if fluxos:
+            diff["fluxos"] = fluxos
+            mudou = True
+        entrou = sorted(estado["corte"] - ultimo["corte"])
+        saiu = sorted(ultimo["corte"] - estado["corte"])
+        if entrou or saiu:
+            diff["corte_entrou"], diff["corte_saiu"] = entrou, saiu
+            mudou = True
+        return diff if mudou else None
+
+    # Clientes
+
+    async def serve(self, websocket):
+        """Atende um WebSocket já aceito até o cliente desconectar."""
+        cliente = _Cliente(websocket)
+        self._clientes.add(cliente)
+        self._novos.add(cliente)
+        self._sinal.set()
+        enviando = asyncio.create_task(self._enviar(cliente))
+        try:
+            while True:
+                mensagem = await websocket.receive()
+                if mensagem["type"] == "websocket.disconnect":
+                    break
+        finally:
+            self._clientes.discard(cliente)
+            self._novos.discard(cliente)
+            enviando.cancel()
+
+    @staticmethod
+    async def _enviar(cliente):
+        while True:
+            payload = await cliente.fila.get()
+            try:
+                await cliente.websocket.send_text(payload)
+            except Exception:
+                return
+
+    def stats(self):
+        return {"clientes": len(self._clientes), "lotes": self.lotes}
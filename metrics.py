@@ -0,0 +1,221 @@
+"""Instrumentação leve e exposição no formato texto do Prometheus.
+
+Histogramas acumulam latências por rótulo (endpoint, fase do solver...) com
+uma trava curta por observação; os gauges são funções lidas só na hora da
+coleta, então tamanho do grafo e taxas de cache não custam nada no caminho
+quente. As fases do solver são medidas por chamada inteira (montagem do
+grafo, resolução, decomposição, serialização), nunca dentro dos laços.
+
+Cálculos que rodam no pool de processos registram as fases no processo
+filho e não aparecem aqui; do lado da API eles contam na latência do
+endpoint.
+
+``Profiler`` é o perfil opcional de uma única requisição: cProfile ligado no
+event loop e nas threads de cálculo que rodarem em nome dela.
+"""
+import cProfile
+import io
+import pstats
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from threading import Lock
+
+# Segundos; cobre de uma leitura em cache a um relatório de rede grande
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Rodadas do solver (BFS, fases de Dinic, global relabels)
+ROUND_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+PROFILE_LINES = 30
+MAX_PROFILES = 16
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _rotulos(labels, **extra):
+    pares = sorted(labels) + sorted(extra.items())
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Registry:
+    """Histogramas e gauges por nome, renderizados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._histogramas = {}
+        self._ajuda = {}
+        self._buckets = {}
+        self._gauges = []
+        self._lock = Lock()
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._ajuda[name] = help
+        self._buckets[name] = buckets
+
+    def observe(self, name, value, **labels):
+        chave = (name, tuple(labels.items()))
+        with self._lock:
+            h = self._histogramas.get(chave)
+            if h is None:
+                h = self._histogramas[chave] = Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - inicio, **labels)
+
+    def gauge(self, name, help, read, type="gauge"):
+        """``read()`` devolve um número ou ``{(("rotulo", valor), ...): número}``."""
+        self._gauges.append((name, help, read, type))
+
+    def render(self):
+        linhas = []
+        with self._lock:
+            histogramas = sorted(
+                (name, labels, list(h.counts), h.sum, h.count)
+                for (name, labels), h in self._histogramas.items()
+            )
+        anterior = None
+        for name, labels, counts, soma, total in histogramas:
+            if name != anterior:
+                linhas.append(f"# HELP {name} {self._ajuda.get(name, name)}")
+                linhas.append(f"# TYPE {name} histogram")
+                anterior = name
+            acumulado = 0
+            for limite, n in zip(self._buckets.get(name, LATENCY_BUCKETS) + (float("inf"),), counts):
+                acumulado += n
+                linhas.append(f"{name}_bucket{_rotulos(labels, le=_numero(limite))} {acumulado}")
+            linhas.append(f"{name}_sum{_rotulos(labels)} {_numero(soma)}")
+            linhas.append(f"{name}_count{_rotulos(labels)} {total}")
+        for name, help, read, type in self._gauges:
+            linhas.append(f"# HELP {name} {help}")
+            linhas.append(f"# TYPE {name} {type}")
+            valor = read()
+            series = valor.items() if isinstance(valor, dict) else [((), valor)]
+            for labels, v in series:
+                linhas.append(f"{name}{_rotulos(labels)} {_numero(v)}")
+        return "\n".join(linhas) + "\n"
+
+
+registry = Registry()
+registry.histogram("delivery_http_request_duration_seconds", "Latência das requisições HTTP por rota")
+registry.histogram("delivery_solver_phase_seconds", "Tempo de cada fase dos cálculos de fluxo")
+registry.histogram("delivery_solver_rounds", "Rodadas por resolução de fluxo máximo", ROUND_BUCKETS)
+
+
+def phase(nome, **labels):
+    """``with phase("graph_build"):`` mede uma fase do cálculo de fluxo."""
+    return registry.timer("delivery_solver_phase_seconds", phase=nome, **labels)
+
+
+def phase_done(nome, inicio, **labels):
+    """Registra uma fase iniciada em ``inicio`` (``time.perf_counter()``)."""
+    registry.observe("delivery_solver_phase_seconds", time.perf_counter() - inicio, phase=nome, **labels)
+
+
+def solver_rounds(solver, rodadas):
+    registry.observe("delivery_solver_rounds", rodadas, solver=solver)
+
+
+# Perfil por requisição
+
+perfil_atual = ContextVar("perfil_atual", default=None)
+
+
+class Profiler:
+    """cProfile de uma requisição, somando o event loop e as threads de cálculo.
+
+    Só o trecho que roda no event loop enquanto a requisição está ativa e os
+    cálculos enviados por ``wrap`` entram no perfil; outras requisições
+    concorrentes no mesmo event loop também podem aparecer. Endpoints
+    síncronos rodam no threadpool do Starlette e ficam de fora, exceto pelo
+    que mandarem para ``ComputeExecutor``. Um perfil por vez: o cProfile é
+    um só por thread.
+    """
+
+    _ids = count(1)
+    ocupado = Lock()
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.loop = cProfile.Profile()
+        self._threads = []
+        self._lock = Lock()
+
+    def wrap(self, fn):
+        def perfilado(*args):
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                return fn(*args)
+            finally:
+                perfil.disable()
+                with self._lock:
+                    self._threads.append(perfil)
+        return perfilado
+
+    def _stats(self, stream=None):
+        stats = pstats.Stats(self.loop, stream=stream)
+        with self._lock:
+            for perfil in self._threads:
+                stats.add(perfil)
+        return stats
+
+    def summary(self, lines=PROFILE_LINES):
+        """Funções por tempo acumulado e por tempo próprio, no formato do pstats."""
+        saida = io.StringIO()
+        stats = self._stats(saida)
+        stats.sort_stats("cumulative").print_stats(lines)
+        stats.sort_stats("tottime").print_stats(lines)
+        return saida.getvalue()
+
+    def top(self, n=5):
+        """As ``n`` funções de maior tempo próprio, numa linha (para um cabeçalho)."""
+        linhas = sorted(self._stats().stats.items(), key=lambda item: -item[1][2])
+        return "; ".join(
+            f"{func}@{arquivo.rsplit('/', 1)[-1]}:{linha}={1000 * proprio:.1f}ms"
+            for (arquivo, linha, func), (_, _, proprio, _, _) in linhas[:n]
+        )
+
+
+class ProfileStore:
+    """Últimos resumos de perfil, por id."""
+
+    def __init__(self, maxsize=MAX_PROFILES):
+        self.maxsize = maxsize
+        self._resumos = OrderedDict()
+        self._lock = Lock()
+
+    def put(self, profiler):
+        with self._lock:
+            self._resumos[profiler.id] = profiler.summary()
+            while len(self._resumos) > self.maxsize:
+                self._resumos.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._resumos.get(profile_id)
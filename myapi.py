@@ -1,13 +1,36 @@
 from enum import IntEnum, Enum
-from typing import List, Optional
-from fastapi import FastAPI, Path, HTTPException, Query, Response, Request
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, Path, HTTPException, Query, Response, Request, WebSocket
 from pydantic import BaseModel, Field
-from collections import deque, defaultdict
+from collections import OrderedDict
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi import Body
+import asyncio
 import logging
+import orjson
+import os
+import time
+from threading import Lock
+from flow_engine import (
+    INF, LARGE_GRAPH_EDGES, CompiledNetwork, CondensedNetwork, IncrementalMaxFlow, MinCostFlow, MultiCommodityFlow,
+    TimeExpandedFlow,
+)
+from cache import ResultCache
+from network_store import NetworkStore
+import batch_flow
+import compute
+import bulk_io
+import metrics
+import resilience
+import shared_state
+from fast_response import VersionedResponses, json_response
+from live_updates import LiveHub
+from scenarios import ScenarioStore
+from snapshot import SnapshotManager
 from typing import List, Optional
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
@@ -34,49 +57,6 @@ api.add_middleware(
     expose_headers=["*"]
 )
 
-#Funções de fluxo máximo
-
-def build_graph(arestas):
-    graph = defaultdict(dict)
-    for aresta in arestas:
-        graph[aresta.origem_id][aresta.destino_id] = aresta.capacidade
-    return graph
-
-def bfs(graph, source, sink, parent):
-    visited = set()
-    queue = deque([source])
-    visited.add(source)
-    while queue:
-        u = queue.popleft()
-        for v, capacity in graph[u].items():
-            if v not in visited and capacity > 0:
-                parent[v] = u
-                if v == sink:
-                    return True
-                visited.add(v)
-                queue.append(v)
-    return False
-
-def edmonds_karp(graph, source, sink):
-    parent = {}
-    max_flow = 0
-    while bfs(graph, source, sink, parent):
-        path_flow = float('inf')
-        s = sink
-        while s != source:
-            path_flow = min(path_flow, graph[parent[s]][s])
-            s = parent[s]
-        max_flow += path_flow
-        v = sink
-        while v != source:
-            u = parent[v]
-            graph[u][v] -= path_flow
-            graph[v].setdefault(u, 0)
-            graph[v][u] += path_flow
-            v = parent[v]
-    return max_flow
-
-
 # Modelagem das Arestas e Vertices
 
 class Priority(IntEnum):
@@ -84,6 +64,19 @@ class Priority(IntEnum):
     MEDIUM = 2
     HIGH = 1
 
+class FlowSolver(str, Enum):
+    EDMONDS_KARP = "edmonds_karp"
+    DINIC = "dinic"
+    PUSH_RELABEL = "push_relabel"
+
+class FlowObjective(str, Enum):
+    MAX_FLOW = "max_flow"
+    MIN_COST = "min_cost"
+
+class ResilienceMode(str, Enum):
+    EDGES = "edges"
+    VERTICES = "vertices"
+
 class VerticeBase(BaseModel):
     name: str = Field(..., description="Nome do vertice")
     type: str = Field(..., description="Tipo do vertice (hub, storage, delivery_zone)")
@@ -116,20 +109,98 @@ class ArestaUpdate(ArestaBase):
     uso: Optional[int] = Field(None, description="Uso atual da aresta")
     priority: Optional[Priority] = Field(None, description="Prioridade da aresta")
 
+class VerticePage(BaseModel):
+    items: List[Vertice]
+    next_cursor: Optional[int] = Field(None, description="Passe como cursor para a próxima página (None na última)")
+
+class ArestaPage(BaseModel):
+    items: List[Aresta]
+    next_cursor: Optional[int] = Field(None, description="Passe como cursor para a próxima página (None na última)")
+
+
+
+# Caminhos de fluxo por página (a decomposição pode ter até E caminhos)
+FLOW_PATHS_PAGE = 100
+MAX_FLOW_PATHS_PAGE = 1000
 
+# Listagens de vértices e arestas por página (cursor = último id recebido)
+LIST_PAGE = 100
+MAX_LIST_PAGE = 1000
+# Rede expandida no tempo: (arestas + vértices) x intervalos cabe em memória até aqui
+MAX_HORIZON = 2000
+MAX_TIME_EXPANDED_CELLS = 20_000_000
+# Árvore de Gomory–Hu custa um fluxo máximo por vértice mantido
+GOMORY_HU_MAX_VERTICES = 2000
+# Tipos com nome alternativo nos dados antigos
+TIPOS_EQUIVALENTES = {"storage": ("Deposito",), "delivery_zone": ("ZonaEntrega",)}
 
 class NetworkAnalysisRequest(BaseModel):
     vertices: List[dict]
     rotas: List[dict]
     blocked_routes: List[str] = []
+    solver: Optional[FlowSolver] = None
+    objective: FlowObjective = FlowObjective.MAX_FLOW
+    paths_offset: int = Field(0, ge=0)
+    paths_limit: int = Field(FLOW_PATHS_PAGE, ge=1, le=MAX_FLOW_PATHS_PAGE)
 
 class NetworkAnalysisResponse(BaseModel):
     bottlenecks: List[dict]
     idle_capacity: List[dict]
     max_flow: int
-    flow_paths: List[List[tuple]]
+    custo_total: Optional[int] = None
+    flow_paths: List[dict]
+    flow_paths_next_offset: Optional[int] = None
+    edge_flows: List[dict] = []
     timestamp: str
 
+class FlowPair(BaseModel):
+    origem_id: int
+    destino_id: int
+    blocked: Optional[List[str]] = None
+
+class BatchFlowRequest(BaseModel):
+    pairs: List[FlowPair]
+    blocked: List[str] = []
+    solver: Optional[FlowSolver] = None
+
+class ResilienceRequest(BaseModel):
+    mode: ResilienceMode = ResilienceMode.EDGES
+    blocked: Optional[List[str]] = Field(None, description="Rotas bloqueadas no fluxo base (padrão: as da rede)")
+    solver: Optional[FlowSolver] = None
+    limit: int = Field(50, ge=1, le=1000, description="Quantos itens do ranking devolver")
+
+class ZoneDemand(BaseModel):
+    zona_id: int = Field(..., description="ID da zona de entrega")
+    demanda: int = Field(..., gt=0, description="Demanda da zona")
+    origens: Optional[List[int]] = Field(None, description="Depósitos que atendem a zona (padrão: todos)")
+
+class MultiCommodityRequest(BaseModel):
+    demands: List[ZoneDemand] = Field(..., min_length=1)
+    blocked: Optional[List[str]] = Field(None, description="Rotas bloqueadas (padrão: as da rede)")
+    epsilon: float = Field(0.2, ge=0.02, le=0.5, description="Precisão da aproximação (menor = mais lento)")
+
+class TimeExpandedRequest(BaseModel):
+    horizon: int = Field(..., ge=1, le=MAX_HORIZON, description="Número de intervalos de tempo do horizonte")
+    transit: Dict[int, int] = Field(default={}, description="Tempo de trânsito (em intervalos) por aresta_id")
+    default_transit: int = Field(1, ge=0, description="Trânsito das arestas fora de transit")
+    windows: Dict[int, List[Tuple[int, int]]] = Field(
+        default={}, description="Intervalos [início, fim) em que cada aresta aceita partidas (padrão: sempre)")
+    holdover: Dict[str, Optional[int]] = Field(
+        default={"storage": None, "hub": None},
+        description="Quanto cada vértice do tipo pode guardar de um intervalo para o outro (null = sem limite)")
+    blocked: Optional[List[str]] = Field(None, description="Rotas bloqueadas (padrão: as da rede)")
+    expand: Optional[bool] = Field(None, description="Força a rede expandida no tempo (padrão: só com janelas)")
+    paths_limit: int = Field(FLOW_PATHS_PAGE, ge=1, le=MAX_FLOW_PATHS_PAGE)
+
+class PrecomputeRequest(BaseModel):
+    gomory_hu: bool = Field(True, description="Monta a árvore de Gomory–Hu quando a rede é não direcionada")
+
+class ScenarioCreate(BaseModel):
+    name: str = Field(..., description="Nome do cenário")
+    blocked: List[str] = Field(default=[], description="Rotas (origem-destino) bloqueadas só no cenário")
+    unblocked: List[str] = Field(default=[], description="Rotas bloqueadas na rede que o cenário libera")
+    capacity_deltas: Dict[int, int] = Field(default={}, description="Variação de capacidade por aresta_id")
+
 class RouteOperationRequest(BaseModel):
     origem_id: int
     destino_id: int
@@ -164,197 +235,684 @@ arestas = [
 '''
 
 
-vertices: List[Vertice] = [
-    Vertice(vertice_id=0, name="Depósito Principal", type="storage"),
-    Vertice(vertice_id=1, name="Hub Central", type="hub"),
-    Vertice(vertice_id=2, name="Zona de Entrega 1", type="delivery_zone")
-]
-arestas: List[Aresta] = []
+def vertices_iniciais():
+    return [
+        Vertice(vertice_id=0, name="Depósito Principal", type="storage"),
+        Vertice(vertice_id=1, name="Hub Central", type="hub"),
+        Vertice(vertice_id=2, name="Zona de Entrega 1", type="delivery_zone")
+    ]
+
+store = NetworkStore()
+store.reset(vertices_iniciais())
+
+# Resultados de fluxo por versão da rede (store.versao muda a cada mutação)
+cache_resultados = ResultCache(maxsize=256)
+
+# Cenários "e se": sobreposições que nunca alteram o store
+cenarios = ScenarioStore()
+
+# Fluxos máximos mantidos incrementalmente, por (origens, destinos, bloqueios)
+MAX_FLUXOS_MANTIDOS = 16
+fluxos_mantidos: "OrderedDict[tuple, IncrementalMaxFlow]" = OrderedDict()
+
+# Cálculos rodam fora do event loop; mutações pegam a trava de escrita e os
+# solvers a de leitura, então sempre enxergam uma versão inteira da rede.
+rede_lock = compute.RWLock()
+computacao = compute.ComputeExecutor()
+# Leitores concorrentes podem criar fluxos mantidos ao mesmo tempo
+fluxos_lock = Lock()
+
+# Persistência opcional: snapshots periódicos mais log de mutações
+SNAPSHOT_DIR = os.environ.get("DELIVERY_SNAPSHOT_DIR")
+SNAPSHOT_INTERVAL = float(os.environ.get("DELIVERY_SNAPSHOT_INTERVAL", "300"))
+snapshots = SnapshotManager(SNAPSHOT_DIR, Vertice, Aresta) if SNAPSHOT_DIR else None
+
+# Estado compartilhado entre workers/processos (opcional), ex.: sqlite:///var/lib/delivery/rede.db
+estado_compartilhado = shared_state.open_state(os.environ.get("DELIVERY_SHARED_STATE"), Vertice, Aresta)
+SHARED_SYNC_INTERVAL = float(os.environ.get("DELIVERY_SHARED_SYNC_INTERVAL", "0.5"))
+if estado_compartilhado.shared and snapshots is not None:
+    raise RuntimeError("Use DELIVERY_SNAPSHOT_DIR ou DELIVERY_SHARED_STATE: o banco compartilhado já persiste a rede")
+
+def route_key(aresta):
+    return f"{aresta.origem_id}-{aresta.destino_id}"
+
+def arestas_do_fluxo(blocked):
+    return [
+        (a.aresta_id, a.origem_id, a.destino_id, 0 if route_key(a) in blocked else a.capacidade)
+        for a in store.arestas.values()
+    ]
+
+# Custo por unidade de fluxo no modo de custo mínimo: a prioridade da rota
+# (HIGH=1 ... LOW=3) domina e a ocupação atual (uso/capacidade) desempata
+PESO_PRIORIDADE = 10
+
+def custo_da_rota(capacidade, uso, priority):
+    ocupacao = min(uso or 0, capacidade) * (PESO_PRIORIDADE - 1) // capacidade if capacidade > 0 else 0
+    return int(priority) * PESO_PRIORIDADE + ocupacao
+
+def arestas_com_custo(blocked):
+    return [
+        (a.aresta_id, a.origem_id, a.destino_id,
+         0 if route_key(a) in blocked else a.capacidade,
+         custo_da_rota(a.capacidade, a.uso, a.priority))
+        for a in store.arestas.values()
+    ]
+
+def arestas_bloqueadas(blocked):
+    """aresta_ids das rotas ("origem-destino") bloqueadas."""
+    ids = []
+    for key in blocked:
+        origem = key.split("-", 1)[0]
+        if origem.isdigit():
+            ids.extend(a.aresta_id for a in store.arestas_saindo(int(origem)) if route_key(a) == key)
+    return ids
+
+# Rede compilada (índices e CSR modelo) da versão atual, base dos fluxos novos
+_rede_compilada = None
+compilada_lock = Lock()
+
+def rede_compilada():
+    """``CompiledNetwork`` da versão atual; chamar com a trava de leitura."""
+    global _rede_compilada
+    with compilada_lock:
+        if _rede_compilada is None or _rede_compilada[0] != store.versao:
+            _rede_compilada = (store.versao, CompiledNetwork(list(store.vertices), arestas_do_fluxo(())))
+        return _rede_compilada[1]
+
+# Rede condensada para consultas de pares repetidas (ligada por /network/precompute)
+pre_calculo = None
+_rede_condensada = None
+condensada_lock = Lock()
+
+def rede_condensada():
+    """``CondensedNetwork`` da versão atual, remontada a cada versão; chamar com a trava de leitura."""
+    global _rede_condensada
+    with condensada_lock:
+        if _rede_condensada is None or _rede_condensada[0] != store.versao:
+            rede = CondensedNetwork(list(store.vertices), arestas_do_fluxo(()))
+            # pre_calculo pode ter sido desligado depois que a consulta começou
+            arvore = (pre_calculo or {}).get("gomory_hu")
+            if arvore and rede.symmetric and len(rede.kept) <= GOMORY_HU_MAX_VERTICES:
+                rede.gomory_hu()
+            _rede_condensada = (store.versao, rede)
+        return _rede_condensada[1]
+
+def fluxo_mantido(sources, sinks, blocked, solver=None):
+    key = (tuple(sources), tuple(sinks), frozenset(blocked))
+    with fluxos_lock:
+        tracker = fluxos_mantidos.get(key)
+        if tracker is not None:
+            fluxos_mantidos.move_to_end(key)
+            return tracker
+    tracker = IncrementalMaxFlow(
+        None, None, sources, sinks, solver and solver.value,
+        compiled=rede_compilada(),
+        zeroed=arestas_bloqueadas(blocked),
+    )
+    with fluxos_lock:
+        tracker = fluxos_mantidos.setdefault(key, tracker)
+        if len(fluxos_mantidos) > MAX_FLUXOS_MANTIDOS:
+            fluxos_mantidos.popitem(last=False)
+    return tracker
+
+def fluxo_do_solver(sources, sinks, blocked, solver=None):
+    """O fluxo mantido ou, com um solver pedido, um fluxo novo resolvido por ele.
+
+    O fluxo mantido pode ter sido resolvido (e atualizado) por outro solver;
+    a decomposição em caminhos tem de vir do solver pedido.
+    """
+    if solver is None:
+        return fluxo_mantido(sources, sinks, blocked)
+    return IncrementalMaxFlow(
+        None, None, sources, sinks, solver.value,
+        compiled=rede_compilada(),
+        zeroed=arestas_bloqueadas(blocked),
+    )
+
+def propagar_aresta(aresta):
+    """Repassa a capacidade atual da aresta para os fluxos mantidos."""
+    for (_, _, blocked), tracker in fluxos_mantidos.items():
+        capacidade = 0 if route_key(aresta) in blocked else aresta.capacidade
+        tracker.set_capacity(aresta.aresta_id, aresta.origem_id, aresta.destino_id, capacidade)
+
+def remover_aresta_dos_fluxos(aresta_id):
+    for tracker in fluxos_mantidos.values():
+        tracker.remove_edge(aresta_id)
+
+def reindexar_bloqueio(key, antes, depois):
+    """Os fluxos que seguiam os bloqueios ``antes`` passam a seguir ``depois``.
+
+    Só as rotas ``key`` são recalculadas.
+    """
+    origem = key.split("-", 1)[0]
+    saindo = store.arestas_saindo(int(origem)) if origem.isdigit() else []
+    afetadas = [a for a in saindo if route_key(a) == key]
+    for chave in [k for k in fluxos_mantidos if k[2] == antes]:
+        tracker = fluxos_mantidos.pop(chave)
+        for a in afetadas:
+            capacidade = 0 if key in depois else a.capacidade
+            tracker.set_capacity(a.aresta_id, a.origem_id, a.destino_id, capacidade)
+        fluxos_mantidos[chave[:2] + (depois,)] = tracker
+
+def acompanhar_remota(operacao, args):
+    """Atualiza os fluxos mantidos com uma mutação de outro worker (já aplicada no store, args em JSON)."""
+    if operacao == "add_aresta":
+        aresta = store.get_aresta(args[0]["aresta_id"])
+        if aresta is not None:
+            propagar_aresta(aresta)
+    elif operacao == "update_aresta":
+        aresta = store.get_aresta(args[0])
+        if aresta is not None and args[1].get("capacidade") is not None:
+            propagar_aresta(aresta)
+    elif operacao == "remove_aresta":
+        remover_aresta_dos_fluxos(args[0])
+    elif operacao == "set_bloqueio":
+        key, bloqueada = args
+        depois = frozenset(store.bloqueadas)
+        reindexar_bloqueio(key, depois - {key} if bloqueada else depois | {key}, depois)
+    elif operacao != "update_vertice" or args[2] is not None:
+        # Vértices novos, removidos ou com outro tipo, cargas em lote, reset e
+        # a rede recarregada inteira
+        fluxos_mantidos.clear()
+        if operacao == "restore":
+            cache_resultados.clear()
+
+@contextmanager
+def escrita_rede():
+    """Trava de escrita da rede; com estado compartilhado, exclusiva entre todos os workers.
+
+    Ids novos são alocados aqui dentro, depois de alcançar o banco.
+    """
+    with rede_lock.write(), estado_compartilhado.transaction(store, acompanhar_remota):
+        yield
+
+def sincronizar_rede():
+    with rede_lock.write():
+        estado_compartilhado.sync(store, acompanhar_remota)
+
+async def sincronizar_se_preciso():
+    if estado_compartilhado.behind(store.versao):
+        await asyncio.to_thread(sincronizar_rede)
+
+async def sincronizacao_periodica():
+    # Sem requisições chegando, os clientes do WebSocket ainda recebem as
+    # mutações feitas nos outros workers
+    while True:
+        await asyncio.sleep(SHARED_SYNC_INTERVAL)
+        try:
+            await sincronizar_se_preciso()
+        except Exception:
+            logger.exception("falha ao sincronizar com o estado compartilhado")
+
+@api.on_event("startup")
+async def conectar_estado_compartilhado():
+    if not estado_compartilhado.shared:
+        return
+
+    def entrar():
+        with rede_lock.write():
+            estado_compartilhado.start(store, acompanhar_remota)
+
+    await asyncio.to_thread(entrar)
+    api.state.sync_task = asyncio.create_task(sincronizacao_periodica())
+
+@api.on_event("shutdown")
+async def desconectar_estado_compartilhado():
+    if not estado_compartilhado.shared:
+        return
+    api.state.sync_task.cancel()
+    estado_compartilhado.close()
+
+@api.middleware("http")
+async def sincronizar_requisicao(request: Request, call_next):
+    # Cada requisição enxerga ao menos as mutações já gravadas pelos outros workers
+    if estado_compartilhado.shared:
+        await sincronizar_se_preciso()
+    return await call_next(request)
+
+def salvar_snapshot():
+    with rede_lock.read():
+        with fluxos_lock:
+            mantidos = list(fluxos_mantidos.items())
+        fluxos = [(key, tracker.edge_flows()) for key, tracker in mantidos]
+        return snapshots.write(store, fluxos)
+
+def com_leitura(fn, *args):
+    with rede_lock.read():
+        return fn(*args)
+
+async def snapshot_periodico():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        if store.versao != snapshots.versao_snapshot:
+            await asyncio.to_thread(salvar_snapshot)
+
+@api.on_event("startup")
+async def carregar_snapshot():
+    if snapshots is None:
+        return
+    # Partida a quente: rede do snapshot mais o log, e os fluxos salvos sem recálculo
+    for (sources, sinks, blocked), flows in snapshots.load_latest(store):
+        fluxos_mantidos[(sources, sinks, blocked)] = IncrementalMaxFlow(
+            None, None, list(sources), list(sinks),
+            flows=flows,
+            compiled=rede_compilada(),
+            zeroed=arestas_bloqueadas(blocked),
+        )
+    snapshots.attach(store)
+    api.state.snapshot_task = asyncio.create_task(snapshot_periodico())
+
+@api.on_event("shutdown")
+async def gravar_snapshot_final():
+    if snapshots is None:
+        return
+    api.state.snapshot_task.cancel()
+    if store.versao != snapshots.versao_snapshot:
+        salvar_snapshot()
+
+# Respostas grandes já codificadas, por versão da rede
+respostas = VersionedResponses(epoch=estado_compartilhado.epoch or (snapshots and snapshots.epoch))
+
+# Atualizações em tempo real
+
+def estado_ao_vivo(arestas, vertices, completo):
+    """Estado enviado aos clientes do WebSocket: linhas pedidas, fluxo do relatório e corte."""
+    with rede_lock.read():
+        if completo:
+            arestas, vertices = store.arestas, store.vertices
+        bloqueadas = sorted(store.bloqueadas)
+        tracker = fluxo_mantido(
+            store.vertices_do_tipo("storage", "Deposito"),
+            store.vertices_do_tipo("delivery_zone", "ZonaEntrega"),
+            frozenset(bloqueadas),
+        )
+
+        def linha(colecao, row, i):
+            item = colecao.get(i)
+            return row(item) if item is not None else None
+
+        return {
+            "versao": store.versao,
+            "arestas": {i: linha(store.arestas, bulk_io.aresta_row, i) for i in arestas},
+            "vertices": {i: linha(store.vertices, bulk_io.vertice_row, i) for i in vertices},
+            "bloqueadas": bloqueadas,
+            "max_flow": tracker.value,
+            "fluxos": tracker.edge_flows(),
+            "corte": set(tracker.min_cut()),
+        }
+
+ao_vivo = LiveHub(lambda *args: computacao.run(estado_ao_vivo, *args))
+store.listeners.append(ao_vivo.notify)
+
+@api.on_event("startup")
+async def iniciar_ao_vivo():
+    ao_vivo.start()
+
+@api.on_event("shutdown")
+async def encerrar_ao_vivo():
+    ao_vivo.stop()
+
+@api.websocket("/ws/network")
+async def network_updates(websocket: WebSocket):
+    """Snapshot da rede na conexão e, depois, diffs agrupados a cada lote de mutações"""
+    await websocket.accept()
+    await ao_vivo.serve(websocket)
+
+@api.exception_handler(compute.Saturated)
+async def fila_cheia(request: Request, exc: compute.Saturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Muitos cálculos em andamento, tente novamente em instantes"},
+        headers={"Retry-After": "1"},
+    )
+
+@api.exception_handler(compute.ComputeTimeout)
+async def tempo_esgotado(request: Request, exc: compute.ComputeTimeout):
+    return JSONResponse(status_code=504, content={"detail": "O cálculo excedeu o tempo máximo"})
+
 #CRUD dos Vertices
 
 @api.get("/vertices/{vertice_id}", response_model=Vertice)
 def get_vertice(vertice_id: int = Path(..., description="O ID do vertice que deseja buscar")):
-    for vertice in vertices:
-        if vertice.vertice_id == vertice_id:
-            return vertice
-        
-    raise HTTPException(status_code=404, detail="Vertice não encontrado")
+    vertice = store.get_vertice(vertice_id)
+    if vertice is None:
+        raise HTTPException(status_code=404, detail="Vertice não encontrado")
+    return vertice
+
+@api.get("/vertices", response_model=VerticePage)
+def get_all_vertices(
+    cursor: Optional[int] = Query(None, description="Último vertice_id da página anterior"),
+    limit: int = Query(LIST_PAGE, ge=1, le=MAX_LIST_PAGE),
+    type: Optional[str] = Query(None, description="Só vértices deste tipo"),
+    first_n: Optional[int] = Query(None, ge=1, le=MAX_LIST_PAGE, description="Obsoleto: o mesmo que limit"),
+):
+    with rede_lock.read():
+        items, next_cursor = store.page_vertices(cursor, first_n or limit, type)
+    return {"items": items, "next_cursor": next_cursor}
 
-@api.get("/vertices", response_model=List[Vertice])
-def get_all_vertices(first_n: int = None):
-    if first_n:
-        return vertices[:first_n]
-    else:
-        return vertices
-    
 @api.post("/vertices", response_model=Vertice)
 def create_vertice(vertice: VerticeCreate):
-    new_vertice_id = max(v.vertice_id for v in vertices) + 1 if vertices else 0
-
-    new_vertice = Vertice(vertice_id=new_vertice_id, name=vertice.name, type=vertice.type)
+    with escrita_rede():
+        new_vertice = Vertice(vertice_id=store.next_vertice_id(), name=vertice.name, type=vertice.type)
 
-    vertices.append(new_vertice)
+        store.add_vertice(new_vertice)
+        fluxos_mantidos.clear()
 
     return new_vertice
 
 @api.put("/vertices/{vertice_id}", response_model=Vertice)
 def update_vertice(vertice_id: int, updated_vertice: VerticeUpdate):
-    for v in vertices:
-        if v.vertice_id == vertice_id:
-            if updated_vertice.name is not None:
-                v.name = updated_vertice.name
-            if updated_vertice.type is not None:
-                v.type = updated_vertice.type
-            
-            return v
-    raise HTTPException(status_code=404, detail="Vertice não encontrado")
-
-@api.delete("/vertices/{vertice_id}", response_model=List[Vertice])
+    with escrita_rede():
+        v = store.get_vertice(vertice_id)
+        if v is None:
+            raise HTTPException(status_code=404, detail="Vertice não encontrado")
+        if updated_vertice.type is not None and updated_vertice.type != v.type:
+            fluxos_mantidos.clear()
+        return store.update_vertice(vertice_id, updated_vertice.name, updated_vertice.type)
+
+@api.delete("/vertices/{vertice_id}")
 def delete_vertice(vertice_id: int):
-    global vertices
-    vertices = [v for v in vertices if v.vertice_id != vertice_id]
-    return vertices
+    with escrita_rede():
+        if store.remove_vertice(vertice_id) is None:
+            raise HTTPException(status_code=404, detail="Vertice não encontrado")
+        fluxos_mantidos.clear()
+        versao = store.versao
+    return {"success": True, "vertice_id": vertice_id, "versao": versao}
 
 #CRUD das Arestas
 
 @api.get("/arestas/{aresta_id}", response_model=Aresta)
 def get_aresta(aresta_id: int = Path(..., description="O ID da aresta que deseja buscar")):
-    for aresta in arestas:
-        if aresta.aresta_id == aresta_id:
-            return aresta
-        
-    raise HTTPException(status_code=404, detail="Aresta não encontrada")
+    aresta = store.get_aresta(aresta_id)
+    if aresta is None:
+        raise HTTPException(status_code=404, detail="Aresta não encontrada")
+    return aresta
+
+def pagina_de_arestas(cursor, limit, origem_id, destino_id, priority, min_capacidade, max_capacidade):
+    with rede_lock.read():
+        items, next_cursor = store.page_arestas(
+            cursor, limit, origem_id, destino_id, priority, min_capacidade, max_capacidade)
+    return {"items": items, "next_cursor": next_cursor}
+
+@api.get("/arestas", response_model=ArestaPage)
+def get_all_arestas(
+    cursor: Optional[int] = Query(None, description="Último aresta_id da página anterior"),
+    limit: int = Query(LIST_PAGE, ge=1, le=MAX_LIST_PAGE),
+    origem_id: Optional[int] = Query(None, description="Só arestas saindo deste vértice"),
+    destino_id: Optional[int] = Query(None, description="Só arestas chegando neste vértice"),
+    priority: Optional[Priority] = Query(None, description="Só arestas desta prioridade"),
+    min_capacidade: Optional[int] = Query(None, description="Capacidade mínima (inclusive)"),
+    max_capacidade: Optional[int] = Query(None, description="Capacidade máxima (inclusive)"),
+    first_n: Optional[int] = Query(None, ge=1, le=MAX_LIST_PAGE, description="Obsoleto: o mesmo que limit"),
+):
+    return pagina_de_arestas(
+        cursor, first_n or limit, origem_id, destino_id, priority, min_capacidade, max_capacidade)
 
-@api.get("/arestas", response_model=List[Aresta])
-def get_all_arestas(first_n: int = None):
-    if first_n:
-        return arestas[:first_n]
-    else:
-        return arestas
-    
 @api.post("/arestas", response_model=Aresta)
 def create_aresta(aresta: ArestaCreate):
-    new_aresta_id = max(v.aresta_id for v in arestas) + 1 if arestas else 0
-
-    new_aresta = Aresta(
-        aresta_id=new_aresta_id,
-        origem_id=aresta.origem_id,
-        destino_id=aresta.destino_id,
-        capacidade=aresta.capacidade,
-        uso=aresta.uso,
-        priority=aresta.priority)
+    with escrita_rede():
+        new_aresta = Aresta(
+            aresta_id=store.next_aresta_id(),
+            origem_id=aresta.origem_id,
+            destino_id=aresta.destino_id,
+            capacidade=aresta.capacidade,
+            uso=aresta.uso,
+            priority=aresta.priority)
 
-    arestas.append(new_aresta)
+        store.add_aresta(new_aresta)
+        propagar_aresta(new_aresta)
 
     return new_aresta
 
 @api.put("/arestas/{aresta_id}", response_model=Aresta)
 def update_aresta(aresta_id: int, updated_aresta: ArestaUpdate):
-    for a in arestas:
-        if a.aresta_id == aresta_id:
-            if updated_aresta.capacidade is not None:
-                a.capacidade = updated_aresta.capacidade
-            if updated_aresta.uso is not None:
-                a.uso = updated_aresta.uso
-            if updated_aresta.priority is not None:
-                a.priority = updated_aresta.priority
-            
-            return a
-    raise HTTPException(status_code=404, detail="Aresta não encontrada")
-
-@api.delete("/arestas/{aresta_id}", response_model=List[Aresta])
+    with escrita_rede():
+        a = store.update_aresta(
+            aresta_id,
+            capacidade=updated_aresta.capacidade,
+            uso=updated_aresta.uso,
+            priority=updated_aresta.priority,
+        )
+        if a is None:
+            raise HTTPException(status_code=404, detail="Aresta não encontrada")
+        if updated_aresta.capacidade is not None:
+            propagar_aresta(a)
+        return a
+
+@api.delete("/arestas/{aresta_id}")
 def delete_aresta(aresta_id: int):
-    global arestas
-    arestas = [a for a in arestas if a.aresta_id != aresta_id]
-    return arestas
+    with escrita_rede():
+        if store.remove_aresta(aresta_id) is None:
+            raise HTTPException(status_code=404, detail="Aresta não encontrada")
+        remover_aresta_dos_fluxos(aresta_id)
+        versao = store.versao
+    return {"success": True, "aresta_id": aresta_id, "versao": versao}
+
+@api.get("/network/arestas", response_model=ArestaPage)
+def list_arestas(
+    cursor: Optional[int] = Query(None, description="Último aresta_id da página anterior"),
+    limit: int = Query(LIST_PAGE, ge=1, le=MAX_LIST_PAGE),
+    origem_id: Optional[int] = Query(None, description="Só arestas saindo deste vértice"),
+    destino_id: Optional[int] = Query(None, description="Só arestas chegando neste vértice"),
+    priority: Optional[Priority] = Query(None, description="Só arestas desta prioridade"),
+    min_capacidade: Optional[int] = Query(None, description="Capacidade mínima (inclusive)"),
+    max_capacidade: Optional[int] = Query(None, description="Capacidade máxima (inclusive)"),
+):
+    return pagina_de_arestas(
+        cursor, limit, origem_id, destino_id, priority, min_capacidade, max_capacidade)
+
+def fluxo_maximo_consistente(origem_id, destino_id, solver):
+    with rede_lock.read():
+        return store.versao, fluxo_mantido([origem_id], [destino_id], (), solver).value
+
+def fluxo_condensado_consistente(origem_id, destino_id, solver):
+    with rede_lock.read():
+        return store.versao, rede_condensada().max_flow(origem_id, destino_id, solver and solver.value)
 
-@api.get("/network/arestas", response_model=List[Aresta])
-async def list_arestas():
-    return arestas
+def fluxo_custo_minimo_consistente(origem_id, destino_id):
+    with rede_lock.read():
+        fluxo = MinCostFlow(list(store.vertices), arestas_com_custo(()), [origem_id], [destino_id])
+        return store.versao, {"fluxo_maximo": fluxo.value, "custo": fluxo.cost}
 
 @api.get("/fluxo_maximo")
-def calcular_fluxo_maximo(
+async def calcular_fluxo_maximo(
     origem_id: int = Query(..., description="ID do vértice de origem"),
-    destino_id: int = Query(..., description="ID do vértice de destino")
+    destino_id: int = Query(..., description="ID do vértice de destino"),
+    solver: Optional[FlowSolver] = Query(None, description="Algoritmo de fluxo máximo (automático se omitido)"),
+    objective: FlowObjective = Query(FlowObjective.MAX_FLOW, description="min_cost prefere rotas de maior prioridade e menos ocupadas")
 ):
-    # Cria uma cópia do grafo para não alterar o original
-    import copy
-    graph = build_graph(arestas)
-    graph_copy = copy.deepcopy(graph)
-    max_flow = edmonds_karp(graph_copy, origem_id, destino_id)
-    return {"fluxo_maximo": max_flow}
+    if origem_id == destino_id:
+        return {"fluxo_maximo": 0}
+    if objective == FlowObjective.MIN_COST:
+        result = cache_resultados.get(("fluxo_custo_minimo", store.versao, origem_id, destino_id))
+        if result is None:
+            versao, result = await computacao.run(fluxo_custo_minimo_consistente, origem_id, destino_id)
+            cache_resultados.put(("fluxo_custo_minimo", versao, origem_id, destino_id), result)
+        return result
+
+    result = cache_resultados.get(("fluxo_maximo", store.versao, origem_id, destino_id))
+    if result is not None:
+        return result
+
+    mantido = ((origem_id,), (destino_id,), frozenset()) in fluxos_mantidos
+    if pre_calculo is not None and not mantido:
+        # Pares da mesma região caem na mesma resolução (ou na árvore de Gomory–Hu)
+        versao, valor = await computacao.run(fluxo_condensado_consistente, origem_id, destino_id, solver)
+    elif mantido or len(store.arestas) < LARGE_GRAPH_EDGES:
+        versao, valor = await computacao.run(fluxo_maximo_consistente, origem_id, destino_id, solver)
+    else:
+        # Rede grande e sem fluxo mantido: resolve num processo, sobre a cópia imutável da versão
+        base = await computacao.run(com_leitura, batch_flow.base_graph, store)
+        [(_, valor)] = await computacao.run(
+            batch_flow.solve_chunk, base.versao, base.blob,
+            [(0, origem_id, destino_id, ())], solver and solver.value,
+            process=True,
+        )
+        versao = base.versao
+    result = {"fluxo_maximo": valor}
+    cache_resultados.put(("fluxo_maximo", versao, origem_id, destino_id), result)
+    return result
+
+def pre_calcular():
+    inicio = time.perf_counter()
+    with rede_lock.read():
+        rede = rede_condensada()
+        return {
+            "versao": store.versao,
+            **rede.stats(),
+            "tempo_ms": round(1000 * (time.perf_counter() - inicio), 1),
+        }
 
+@api.post("/network/precompute")
+async def precompute(request: PrecomputeRequest = Body(default=PrecomputeRequest())):
+    """Condensa a rede (e monta a árvore de Gomory–Hu, se não direcionada) para consultas de pares repetidas.
+
+    Fica ligado: depois de uma mutação a rede é condensada de novo na
+    próxima consulta a /fluxo_maximo.
+    """
+    global pre_calculo, _rede_condensada
+    with condensada_lock:
+        if pre_calculo != request.model_dump():
+            pre_calculo, _rede_condensada = request.model_dump(), None
+    # A árvore pode levar mais que o tempo padrão de um cálculo
+    return await computacao.run(pre_calcular, timeout=max(computacao.timeout, 300))
+
+@api.delete("/network/precompute")
+def disable_precompute():
+    """Volta a resolver cada par no grafo completo"""
+    global pre_calculo, _rede_condensada
+    with condensada_lock:
+        pre_calculo, _rede_condensada = None, None
+    return {"success": True}
+
+@api.post("/fluxo_maximo/batch")
+async def calcular_fluxo_maximo_batch(request: BatchFlowRequest):
+    """Fluxo máximo de vários pares, em NDJSON, na ordem em que cada um fica pronto"""
+    base = await computacao.run(com_leitura, batch_flow.base_graph, store)
+    versao = base.versao
+    solver = request.solver and request.solver.value
+
+    prontos = []
+    pendentes = []
+    chaves = {}
+    for i, par in enumerate(request.pairs):
+        blocked = frozenset(request.blocked if par.blocked is None else par.blocked)
+        key = ("fluxo_maximo", versao, par.origem_id, par.destino_id)
+        if blocked:
+            key += (blocked,)
+        chaves[i] = key
+        result = cache_resultados.get(key)
+        if result is not None:
+            prontos.append((i, result["fluxo_maximo"]))
+        else:
+            pendentes.append((i, par.origem_id, par.destino_id, tuple(blocked)))
+
+    def linhas(resultados):
+        for i, valor in resultados:
+            par = request.pairs[i]
+            yield orjson.dumps({
+                "index": i,
+                "origem_id": par.origem_id,
+                "destino_id": par.destino_id,
+                "fluxo_maximo": valor,
+            }) + b"\n"
+
+    # O primeiro bloco sai antes da resposta: fila cheia ou tempo esgotado
+    # ainda viram 429/504 em vez de um stream cortado
+    blocos = batch_flow.solve_batch(computacao, base, pendentes, solver)
+    primeiro = await anext(blocos, None)
+
+    async def stream():
+        if prontos:
+            yield b"".join(linhas(prontos))
+        if primeiro is None:
+            return
+        resultados = primeiro
+        while resultados is not None:
+            for i, valor in resultados:
+                cache_resultados.put(chaves[i], {"fluxo_maximo": valor})
+            yield b"".join(linhas(resultados))
+            resultados = await anext(blocos, None)
+
+    return StreamingResponse(stream(), media_type=bulk_io.NDJSON_MEDIA_TYPE)
+
+@api.on_event("shutdown")
+def encerrar_pool():
+    computacao.shutdown()
+    batch_flow.shutdown()
 
 
+@api.post("/network/analyze", response_model=NetworkAnalysisResponse)
+async def analyze_network(request: NetworkAnalysisRequest):
+    return await computacao.run(analisar_rede, request)
 
+def pagina_de_caminhos(tracker, offset, limit):
+    """Uma página da decomposição do fluxo, com o offset da próxima (se houver)."""
+    caminhos = tracker.flow_paths(offset, limit + 1)
+    return {
+        "flow_paths": [{"fluxo": fluxo, "caminho": caminho} for fluxo, caminho in caminhos[:limit]],
+        "flow_paths_next_offset": offset + limit if len(caminhos) > limit else None,
+    }
 
-@api.post("/network/analyze", response_model=NetworkAnalysisResponse)
-def analyze_network(request: NetworkAnalysisRequest):
+def analisar_rede(request):
     # Implementação similar à função generateReport do React
-    bottlenecks = []
-    idle_capacity = []
-    
-    # Processar gargalos e capacidade ociosa
-    for rota in request.rotas:
-        key = f"{rota['origem']}-{rota['destino']}"
-        if rota['capacidade'] > 10 and key not in request.blocked_routes:
-            bottlenecks.append(rota)
-        if rota['capacidade'] < 7 and key not in request.blocked_routes:
-            idle_capacity.append(rota)
-    
-    # Converter para formato do Edmonds-Karp
-    vertex_ids = {v['id']: idx for idx, v in enumerate(request.vertices)}
-    num_nodes = len(request.vertices)
-    edges = [
-        (vertex_ids[r['origem']], vertex_ids[r['destino']], r['capacidade'])
-        for r in request.rotas
-    ]
-    sources = [
-        vertex_ids[v['id']] for v in request.vertices 
-        if v['tipo'] == 'Deposito'
+    blocked = set(request.blocked_routes)
+    vertices = [v['id'] for v in request.vertices]
+    arestas = [
+        (i, r['origem'], r['destino'],
+         0 if f"{r['origem']}-{r['destino']}" in blocked else r['capacidade'])
+        for i, r in enumerate(request.rotas)
     ]
-    sinks = [
-        vertex_ids[v['id']] for v in request.vertices 
-        if v['tipo'] == 'ZonaEntrega'
-    ]
-    
-    # Calcular fluxo máximo (implementação similar à do React)
-    max_flow, flow_paths = calculate_max_flow(num_nodes, edges, sources, sinks)
-    
+    sources = [v['id'] for v in request.vertices if v['tipo'] == 'Deposito']
+    sinks = [v['id'] for v in request.vertices if v['tipo'] == 'ZonaEntrega']
+    if request.objective == FlowObjective.MIN_COST:
+        custos = [
+            custo_da_rota(r['capacidade'], r.get('uso', 0), r.get('priority', Priority.LOW))
+            for r in request.rotas
+        ]
+        tracker = MinCostFlow(vertices, [a + (c,) for a, c in zip(arestas, custos)], sources, sinks)
+    else:
+        tracker = IncrementalMaxFlow(vertices, arestas, sources, sinks, request.solver and request.solver.value)
+
+    # Gargalos são as rotas do corte mínimo; ociosas, as que sobram folga
+    uso = tracker.edge_usage()
+    rotas = [{**r, "fluxo": uso[i][0], "folga": uso[i][1]} for i, r in enumerate(request.rotas)]
+    bottlenecks = [rotas[i] for i in tracker.min_cut()]
+    idle_capacity = sorted((r for r in rotas if r["folga"] > 0), key=lambda r: -r["folga"])
+
     return {
         "bottlenecks": bottlenecks,
         "idle_capacity": idle_capacity,
-        "max_flow": max_flow,
-        "flow_paths": flow_paths,
+        "max_flow": tracker.value,
+        "custo_total": getattr(tracker, "cost", None),
+        **pagina_de_caminhos(tracker, request.paths_offset, request.paths_limit),
+        "edge_flows": rotas,
         "timestamp": datetime.now().isoformat()
     }
 
-arestas: List[Aresta] = []
-
 @api.post("/network/add-route")
-async def add_route(request: RouteOperationRequest, response: Response):
+def add_route(request: RouteOperationRequest, response: Response):
     # Adicione manualmente os cabeçalhos CORS
     response.headers["Access-Control-Allow-Origin"] = "http://localhost:3000"
     response.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
     response.headers["Access-Control-Allow-Headers"] = "Content-Type"
     
     try:
-        global arestas  # ← Isso permite modificar a variável global
-        
-        # Se não houver arestas, comece com ID 1
-        new_aresta_id = max(a.aresta_id for a in arestas) + 1 if arestas else 1
-        
-        new_aresta = Aresta(
-            aresta_id=new_aresta_id,
-            origem_id=request.origem_id,
-            destino_id=request.destino_id,
-            capacidade=request.capacidade,
-            uso=request.uso,
-            priority=Priority.LOW
-        )
+        with escrita_rede():
+            new_aresta_id = store.next_aresta_id()
         
-        arestas.append(new_aresta)
+            new_aresta = Aresta(
+                aresta_id=new_aresta_id,
+                origem_id=request.origem_id,
+                destino_id=request.destino_id,
+                capacidade=request.capacidade,
+                uso=request.uso,
+                priority=Priority.LOW
+            )
         
+            store.add_aresta(new_aresta)
+            propagar_aresta(new_aresta)
+
         return {
             "success": True,
             "new_route": {
@@ -374,27 +932,34 @@ async def add_route(request: RouteOperationRequest, response: Response):
 def toggle_block_route(origem: str, destino: str):
     # Implementação similar à função toggleBlock do React
     key = f"{origem}-{destino}"
-    # Lógica para alternar bloqueio
-    return {"success": True, "blocked": key}
+    with escrita_rede():
+        antes = frozenset(store.bloqueadas)
+        store.toggle_bloqueio(key)
+        depois = frozenset(store.bloqueadas)
+        # Os fluxos que seguem os bloqueios atuais só recalculam as rotas afetadas
+        reindexar_bloqueio(key, antes, depois)
+
+    return {"success": True, "blocked": key, "bloqueada": key in depois}
 
 @api.post("/network/increase-demand")
-async def increase_demand(node_id: str = Query(..., description="ID do nó para aumentar demanda")):
+def increase_demand(node_id: str = Query(..., description="ID do nó para aumentar demanda")):
     try:
         logger.info(f"Recebida requisição para aumentar demanda no nó: {node_id}")
-        logger.info(f"Tipo do node_id: {type(node_id)}")
-        logger.info(f"Todas arestas: {arestas}")
         # Converter para string para garantir compatibilidade
         node_id_str = str(node_id)
         
         # Encontrar todas as arestas que chegam neste nó
         updated_edges = []
-        for aresta in arestas:
-            if str(aresta.destino_id) == node_id_str:
-                aresta.capacidade += 5
-                updated_edges.append({
-                    "aresta_id": aresta.aresta_id,
-                    "nova_capacidade": aresta.capacidade
-                })
+        with escrita_rede():
+            chegando = store.arestas_chegando(int(node_id_str)) if node_id_str.lstrip("-").isdigit() else []
+            for aresta in chegando:
+                if str(aresta.destino_id) == node_id_str:
+                    store.update_aresta(aresta.aresta_id, capacidade=aresta.capacidade + 5)
+                    propagar_aresta(aresta)
+                    updated_edges.append({
+                        "aresta_id": aresta.aresta_id,
+                        "nova_capacidade": aresta.capacidade
+                    })
         
         if not updated_edges:
             raise HTTPException(
@@ -416,247 +981,617 @@ async def increase_demand(node_id: str = Query(..., description="ID do nó para
 
 @api.post("/network/reset")
 def reset_network():
-    global vertices, arestas
-    
-    # Mantém apenas os vértices básicos
-    vertices = [
-        Vertice(vertice_id=0, name="Depósito Principal", type="storage"),
-        Vertice(vertice_id=1, name="Hub Central", type="hub"),
-        Vertice(vertice_id=2, name="Zona de Entrega 1", type="delivery_zone")
-    ]
-    
-    # Limpa todas as rotas
-    arestas = []
+    # Mantém apenas os vértices básicos e limpa todas as rotas
+    with escrita_rede():
+        store.reset(vertices_iniciais())
+        fluxos_mantidos.clear()
     
     return {
         "success": True,
         "message": "Rede resetada para estado inicial",
-        "vertices": vertices,
-        "arestas": arestas
+        "vertices": store.list_vertices(),
+        "arestas": store.list_arestas()
     }
 
 
 @api.post("/relatorio-automatico")
-def relatorio_automatico(
+async def relatorio_automatico(
+    request: Request,
     data: dict = Body(default={})
 ):
-    blocked = data.get("blocked", [])
-    # Gargalos e capacidade ociosa
-    bottlenecks = [a for a in arestas if a.capacidade > 10 and f"{a.origem_id}-{a.destino_id}" not in blocked]
-    idle_capacity = [a for a in arestas if a.capacidade < 7 and f"{a.origem_id}-{a.destino_id}" not in blocked]
-
-    # Fluxo máximo (usando Edmonds-Karp entre depósitos e zonas de entrega)
-    vertices_storage = [v.vertice_id for v in vertices if v.type in ("storage", "Deposito")]
-    vertices_delivery = [v.vertice_id for v in vertices if v.type in ("delivery_zone", "ZonaEntrega")]
-    if not vertices_storage or not vertices_delivery:
-        max_flow = 0
-        flow_paths = []
+    blocked = data.get("blocked", sorted(store.bloqueadas))
+    try:
+        solver = FlowSolver(data["solver"]) if data.get("solver") else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Solver inválido: {data['solver']}")
+    try:
+        objective = FlowObjective(data.get("objective", FlowObjective.MAX_FLOW))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Objetivo inválido: {data['objective']}")
+    offset = data.get("paths_offset", 0)
+    limit = data.get("paths_limit", FLOW_PATHS_PAGE)
+    if not (isinstance(offset, int) and offset >= 0 and isinstance(limit, int) and 1 <= limit <= MAX_FLOW_PATHS_PAGE):
+        raise HTTPException(
+            status_code=400,
+            detail=f"paths_offset deve ser >= 0 e paths_limit entre 1 e {MAX_FLOW_PATHS_PAGE}",
+        )
+    key = (frozenset(blocked), objective, solver, offset, limit)
+    report = cache_resultados.get(("relatorio", store.versao) + key)
+    if report is None:
+        versao, report = await computacao.run(relatorio_consistente, blocked, solver, offset, limit, objective)
+        cache_resultados.put(("relatorio", versao) + key, report)
+
+    return json_response(request, {**report, "timestamp": datetime.now().isoformat()})
+
+def relatorio_consistente(blocked, solver=None, offset=0, limit=FLOW_PATHS_PAGE, objective=FlowObjective.MAX_FLOW):
+    with rede_lock.read():
+        return store.versao, gerar_relatorio(blocked, solver, offset, limit, objective)
+
+def gerar_relatorio(blocked, solver=None, offset=0, limit=FLOW_PATHS_PAGE, objective=FlowObjective.MAX_FLOW):
+    # Fluxo máximo entre depósitos e zonas de entrega
+    vertices_storage = store.vertices_do_tipo("storage", "Deposito")
+    vertices_delivery = store.vertices_do_tipo("delivery_zone", "ZonaEntrega")
+    if objective == FlowObjective.MIN_COST:
+        # O custo depende de prioridade e uso, então não há fluxo mantido: o
+        # resultado fica no cache da versão
+        tracker = MinCostFlow(list(store.vertices), arestas_com_custo(blocked), vertices_storage, vertices_delivery)
     else:
-        id_to_idx = {v.vertice_id: idx for idx, v in enumerate(vertices)}
-        num_nodes = len(vertices)
-        edges = [
-            (id_to_idx[a.origem_id], id_to_idx[a.destino_id], a.capacidade)
-            for a in arestas if f"{a.origem_id}-{a.destino_id}" not in blocked
-        ]
-        sources = [id_to_idx[i] for i in vertices_storage]
-        sinks = [id_to_idx[i] for i in vertices_delivery]
-
-        # Edmonds-Karp adaptado
-        from collections import deque
-        def ek(n, edges, sources, sinks):
-            super_source = n
-            super_sink = n + 1
-            capacity = [[0] * (n + 2) for _ in range(n + 2)]
-            for u, v, cap in edges:
-                capacity[u][v] += cap
-            for s in sources:
-                capacity[super_source][s] = float('inf')
-            for t in sinks:
-                capacity[t][super_sink] = float('inf')
-            parent = [-1] * (n + 2)
-            max_flow = 0
-            paths = []
-            def bfs():
-                nonlocal parent
-                parent = [-1] * (n + 2)
-                queue = deque([super_source])
-                parent[super_source] = -2
-                flow = [0] * (n + 2)
-                flow[super_source] = float('inf')
-                while queue:
-                    u = queue.popleft()
-                    for v in range(n + 2):
-                        if parent[v] == -1 and capacity[u][v] > 0:
-                            parent[v] = u
-                            flow[v] = min(flow[u], capacity[u][v])
-                            if v == super_sink:
-                                return flow[super_sink]
-                            queue.append(v)
-                return 0
-            path_flow = bfs()
-            while path_flow:
-                max_flow += path_flow
-                # Recupera caminho
-                v = super_sink
-                path = []
-                while v != super_source:
-                    u = parent[v]
-                    path.append((u, v))
-                    v = u
-                path.reverse()
-                real_path = [p for p in path if p[0] != super_source and p[1] != super_sink]
-                if real_path:
-                    paths.append(real_path)
-                # Atualiza capacidades
-                v = super_sink
-                while v != super_source:
-                    u = parent[v]
-                    capacity[u][v] -= path_flow
-                    capacity[v][u] += path_flow
-                    v = u
-                path_flow = bfs()
-            return max_flow, paths
-        max_flow, flow_paths = ek(num_nodes, edges, sources, sinks)
+        tracker = fluxo_do_solver(vertices_storage, vertices_delivery, blocked, solver)
+    return relatorio_do_fluxo(tracker, offset, limit)
+
+def relatorio_do_fluxo(tracker, offset=0, limit=FLOW_PATHS_PAGE, capacidade_do_fluxo=False):
+    """Gargalos, ociosidade e caminhos de um fluxo já resolvido.
+
+    Com ``capacidade_do_fluxo`` a capacidade exibida é a do grafo do fluxo (a
+    de um cenário), não a do store.
+    """
+    max_flow = tracker.value
+
+    def nome(vertice_id):
+        vertice = store.get_vertice(vertice_id)
+        return vertice.name if vertice is not None else vertice_id
+
+    # Gargalos são as arestas saturadas do corte mínimo; capacidade ociosa é a
+    # folga que sobra nas demais depois do fluxo máximo
+    uso = tracker.edge_usage()
+    rotas = {
+        a.aresta_id: {
+            **bulk_io.aresta_row(a),
+            **({"capacidade": sum(uso[a.aresta_id])} if capacidade_do_fluxo else {}),
+            "origem": nome(a.origem_id),
+            "destino": nome(a.destino_id),
+            "fluxo": uso[a.aresta_id][0],
+            "folga": uso[a.aresta_id][1],
+        }
+        for a in store.arestas.values()
+    }
+    bottlenecks = [rotas[aresta_id] for aresta_id in tracker.min_cut()]
+    idle_capacity = sorted((r for r in rotas.values() if r["folga"] > 0), key=lambda r: -r["folga"])
 
     return {
-        "bottlenecks": [
-            {
-                **a.dict(),
-                "origem": next((v.name for v in vertices if v.vertice_id == a.origem_id), a.origem_id),
-                "destino": next((v.name for v in vertices if v.vertice_id == a.destino_id), a.destino_id),
-            }
-            for a in bottlenecks
-        ],
-        "idle_capacity": [
-            {
-                **a.dict(),
-                "origem": next((v.name for v in vertices if v.vertice_id == a.origem_id), a.origem_id),
-                "destino": next((v.name for v in vertices if v.vertice_id == a.destino_id), a.destino_id),
-            }
-            for a in idle_capacity
-        ],
+        "bottlenecks": bottlenecks,
+        "idle_capacity": idle_capacity,
         "max_flow": int(max_flow),
-        "flow_paths": flow_paths or [],
-        "timestamp": datetime.now().isoformat()
+        "custo_total": getattr(tracker, "cost", None),
+        **pagina_de_caminhos(tracker, offset, limit),
+        "edge_flows": [
+            {"aresta_id": aresta_id, "fluxo": fluxo, "folga": folga}
+            for aresta_id, (fluxo, folga) in uso.items()
+        ],
     }
 
-def calculate_max_flow(num_nodes, edges, sources, sinks):
-    # Implementação similar às funções maxFlow... do React
-    super_source = num_nodes
-    super_sink = num_nodes + 1
-    g = Graph(num_nodes + 2)
-    
-    for u, v, cap in edges:
-        g.add_edge(u, v, cap)
-    
-    for s in sources:
-        g.add_edge(super_source, s, float('inf'))
-    
-    for t in sinks:
-        g.add_edge(t, super_sink, float('inf'))
-    
-    max_flow = g.edmonds_karp(super_source, super_sink)
-    paths = g.get_flow_paths(super_source, super_sink)
-    
-    return max_flow, paths
+# Demanda por zona (multi-commodity)
+
+def fluxo_multicommodity_consistente(demands, blocked, epsilon):
+    with rede_lock.read():
+        depositos = store.vertices_do_tipo("storage", "Deposito")
+        faltando = [d.zona_id for d in demands if store.get_vertice(d.zona_id) is None]
+        if faltando:
+            return store.versao, faltando, None
+        resultado = MultiCommodityFlow(
+            list(store.vertices),
+            arestas_do_fluxo(blocked),
+            [(d.zona_id, d.demanda, depositos if d.origens is None else d.origens) for d in demands],
+            epsilon,
+        )
+        return store.versao, [], resultado
+
+@api.post("/network/multicommodity")
+async def fluxo_multicommodity(request: MultiCommodityRequest, http_request: Request):
+    """Quanto da demanda de cada zona pode ser atendido ao mesmo tempo, com as rotas compartilhadas"""
+    blocked = frozenset(store.bloqueadas if request.blocked is None else request.blocked)
+    demandas = tuple(
+        (d.zona_id, d.demanda, None if d.origens is None else tuple(sorted(set(d.origens))))
+        for d in request.demands
+    )
+    key = ("multicommodity", blocked, demandas, request.epsilon)
+    report = cache_resultados.get(key + (store.versao,))
+    if report is None:
+        versao, faltando, resultado = await computacao.run(
+            fluxo_multicommodity_consistente, request.demands, blocked, request.epsilon
+        )
+        if faltando:
+            raise HTTPException(status_code=404, detail=f"Zonas não encontradas: {faltando}")
+
+        def nome(vertice_id):
+            vertice = store.get_vertice(vertice_id)
+            return vertice.name if vertice is not None else vertice_id
+
+        def arredondar(valor):
+            return None if valor == float("inf") else round(valor, 4)
+
+        ratio, superior = resultado.ratio, resultado.upper_bound
+        report = {
+            # ratio >= 1: todas as demandas cabem juntas; o limite superior
+            # abaixo de 1 prova que não cabem
+            "fracao_atendida": arredondar(ratio),
+            "limite_superior": arredondar(superior),
+            "viavel": True if ratio >= 1 else (False if superior < 1 else None),
+            "epsilon": request.epsilon,
+            "zonas": [
+                {
+                    "zona_id": d.zona_id,
+                    "nome": nome(d.zona_id),
+                    "demanda": d.demanda,
+                    "roteado": round(roteado, 4),
+                    "atendimento": round(min(1.0, roteado / d.demanda), 4),
+                }
+                for d, roteado in zip(request.demands, resultado.routed)
+            ],
+            "edge_flows": [
+                {"aresta_id": aresta_id, "fluxo": round(fluxo, 4)}
+                for aresta_id, fluxo in resultado.edge_flows().items()
+                if fluxo > 0
+            ],
+        }
+        cache_resultados.put(key + (versao,), report)
+    return json_response(http_request, {**report, "timestamp": datetime.now().isoformat()})
+
+# Volume entregue dentro de um horizonte (rede expandida no tempo)
+
+def fluxo_no_tempo_consistente(request, blocked):
+    with rede_lock.read():
+        guarda = {}
+        for tipo, capacidade in request.holdover.items():
+            for vid in store.vertices_do_tipo(tipo, *TIPOS_EQUIVALENTES.get(tipo, ())):
+                guarda[vid] = INF if capacidade is None else capacidade
+        resultado = TimeExpandedFlow(
+            list(store.vertices),
+            [edge + (request.transit.get(edge[0], request.default_transit),) for edge in arestas_do_fluxo(blocked)],
+            store.vertices_do_tipo("storage", "Deposito"),
+            store.vertices_do_tipo("delivery_zone", "ZonaEntrega"),
+            request.horizon,
+            holdover=guarda,
+            windows=request.windows,
+            expand=request.expand,
+        )
+        return store.versao, resultado
+
+@api.post("/network/time-expanded")
+async def fluxo_no_tempo(request: TimeExpandedRequest, http_request: Request):
+    """Volume máximo que chega às zonas de entrega dentro do horizonte, com trânsito, turnos e armazenagem"""
+    if any(t < 0 for t in request.transit.values()):
+        raise HTTPException(status_code=400, detail="Tempo de trânsito não pode ser negativo")
+    if any(c is not None and c < 0 for c in request.holdover.values()):
+        raise HTTPException(status_code=400, detail="Capacidade de armazenagem não pode ser negativa")
+    expandida = request.expand if request.expand is not None else bool(request.windows)
+    if expandida and (len(store.arestas) + len(store.vertices)) * request.horizon > MAX_TIME_EXPANDED_CELLS:
+        raise HTTPException(status_code=400, detail="Rede expandida grande demais: use um horizonte menor")
+    blocked = frozenset(store.bloqueadas if request.blocked is None else request.blocked)
+    key = (
+        "tempo", blocked, request.horizon, request.default_transit,
+        tuple(sorted(request.transit.items())),
+        tuple(sorted((k, tuple(v)) for k, v in request.windows.items())),
+        tuple(sorted(request.holdover.items(), key=lambda item: item[0])),
+        request.expand, request.paths_limit,
+    )
+    report = cache_resultados.get(key + (store.versao,))
+    if report is None:
+        versao, resultado = await computacao.run(fluxo_no_tempo_consistente, request, blocked)
+        report = {
+            "horizonte": request.horizon,
+            "metodo": resultado.method,
+            "volume_total": resultado.value,
+            # Fluxo por intervalo do fluxo estático repetido (limite sem janelas)
+            "taxa_estatica": resultado.static_rate,
+            "entregas_por_intervalo": resultado.deliveries,
+            "rodadas": resultado.rounds,
+            "arestas": [
+                {"aresta_id": aresta_id, "volume": volume, "pico": pico}
+                for aresta_id, (volume, pico) in resultado.edge_volumes().items()
+            ],
+            # Só no fluxo repetido: na rede expandida as rotas mudam a cada intervalo
+            "caminhos": [
+                {
+                    "taxa": taxa,
+                    "transito": transito,
+                    "partidas": partidas,
+                    "volume": taxa * partidas,
+                    "aresta_ids": aresta_ids,
+                    "vertices": vertices,
+                }
+                for taxa, transito, partidas, aresta_ids, vertices in resultado.route_paths()[:request.paths_limit]
+            ],
+        }
+        cache_resultados.put(key + (versao,), report)
+    return json_response(http_request, {**report, "timestamp": datetime.now().isoformat()})
+
+# Resiliência N-1
+
+def preparar_resiliencia(mode, blocked, solver):
+    """Cópia do fluxo base e candidatos da varredura, numa versão consistente da rede."""
+    with rede_lock.read():
+        tracker = fluxo_mantido(
+            store.vertices_do_tipo("storage", "Deposito"),
+            store.vertices_do_tipo("delivery_zone", "ZonaEntrega"),
+            blocked,
+            solver,
+        ).fork()
+        if mode == ResilienceMode.VERTICES:
+            grupos = resilience.candidatos_vertices(tracker)
+            total = len(store.vertices)
+        else:
+            grupos = resilience.candidatos_arestas(tracker)
+            total = len(store.arestas)
+        return store.versao, tracker, grupos, total
+
+def descrever_criticidade(mode, linha):
+    linha = dict(linha)
+    rotulo = linha.pop("id")
+    if mode == ResilienceMode.VERTICES:
+        vertice = store.get_vertice(rotulo)
+        return {"vertice_id": rotulo, "nome": vertice.name if vertice is not None else rotulo, **linha}
+    aresta = store.get_aresta(rotulo)
+    if aresta is None:
+        return {"aresta_id": rotulo, **linha}
+    origem, destino = store.get_vertice(aresta.origem_id), store.get_vertice(aresta.destino_id)
+    return {
+        "aresta_id": aresta.aresta_id,
+        "origem_id": aresta.origem_id,
+        "destino_id": aresta.destino_id,
+        "origem": origem.name if origem is not None else aresta.origem_id,
+        "destino": destino.name if destino is not None else aresta.destino_id,
+        "capacidade": aresta.capacidade,
+        **linha,
+    }
+
+@api.post("/network/resilience")
+async def resiliencia(request: ResilienceRequest, http_request: Request):
+    """Ranking de criticidade: fluxo máximo sem cada rota (ou vértice), uma falha por vez"""
+    blocked = frozenset(store.bloqueadas if request.blocked is None else request.blocked)
+    key = ("resiliencia", request.mode, blocked)
+    report = cache_resultados.get(key + (store.versao,))
+    if report is None:
+        versao, tracker, grupos, total = await computacao.run(preparar_resiliencia, request.mode, blocked, request.solver)
+        resultados = await resilience.sweep(computacao, tracker, (versao, request.mode, blocked), grupos)
+        report = {
+            "max_flow": tracker.value,
+            "mode": request.mode.value,
+            "avaliados": len(grupos),
+            "ignorados": total - len(grupos),
+            "ranking": [
+                descrever_criticidade(request.mode, linha)
+                for linha in resilience.ranking(tracker.value, resultados)
+            ],
+        }
+        cache_resultados.put(key + (versao,), report)
+    return json_response(http_request, {
+        **report,
+        "ranking": report["ranking"][:request.limit],
+        "timestamp": datetime.now().isoformat(),
+    })
+
+# Cenários "e se"
+
+def fluxo_do_cenario(cenario, sources, sinks, solver=None, base=None):
+    """Fluxo no cenário: parte do fluxo mantido da rede base e só reaplica o que o cenário muda.
+
+    ``base`` são as rotas bloqueadas de partida, como no endpoint ao vivo
+    equivalente (por padrão as bloqueadas da rede, como no relatório).
+    """
+    base = frozenset(store.bloqueadas if base is None else base)
+    tracker = fluxo_do_solver(sources, sinks, base, solver)
+    if solver is None:
+        tracker = tracker.fork()
+    bloqueios = cenario.bloqueios(base)
+    for a in cenario.arestas_alteradas(store):
+        tracker.set_capacity(a.aresta_id, a.origem_id, a.destino_id, cenario.capacidade(a, bloqueios))
+    return tracker
+
+def cenario_ou_404(name):
+    cenario = cenarios.get(name)
+    if cenario is None:
+        raise HTTPException(status_code=404, detail="Cenário não encontrado")
+    return cenario
+
+def alterar_cenario(name, alterar):
+    try:
+        return cenarios.update(name, alterar)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Cenário não encontrado")
+
+@api.post("/scenarios")
+def create_scenario(request: ScenarioCreate):
+    try:
+        cenario = cenarios.create(request.name, request.blocked, request.unblocked, request.capacity_deltas)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OverflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return cenario.to_dict()
+
+@api.get("/scenarios")
+def list_scenarios():
+    return [c.to_dict() for c in cenarios.list()]
+
+@api.get("/scenarios/{name}")
+def get_scenario(name: str):
+    return cenario_ou_404(name).to_dict()
+
+@api.delete("/scenarios/{name}")
+def delete_scenario(name: str):
+    if cenarios.remove(name) is None:
+        raise HTTPException(status_code=404, detail="Cenário não encontrado")
+    return {"success": True, "name": name}
+
+@api.post("/scenarios/{name}/toggle-block")
+def toggle_block_scenario(name: str, origem: str, destino: str):
+    key = f"{origem}-{destino}"
+    base = frozenset(store.bloqueadas)
+    bloqueada = alterar_cenario(name, lambda c: c.toggle_bloqueio(key, base))
+    return {"success": True, "scenario": name, "blocked": key, "bloqueada": bloqueada}
+
+@api.post("/scenarios/{name}/increase-demand")
+def increase_demand_scenario(name: str, node_id: int = Query(..., description="ID do nó para aumentar demanda")):
+    chegando = store.arestas_chegando(node_id)
+    if not chegando:
+        raise HTTPException(status_code=404, detail=f"Nenhuma rota encontrada para o nó {node_id}")
+
+    def aumentar(cenario):
+        for a in chegando:
+            cenario.add_delta(a.aresta_id, 5)
+        return cenario.to_dict()
+
+    return {"success": True, "scenario": alterar_cenario(name, aumentar)}
+
+def fluxo_maximo_cenario_consistente(cenario, origem_id, destino_id, solver):
+    with rede_lock.read():
+        # Como /fluxo_maximo, que resolve sem as rotas bloqueadas da rede
+        return store.versao, fluxo_do_cenario(cenario, [origem_id], [destino_id], solver, base=()).value
+
+@api.get("/scenarios/{name}/fluxo_maximo")
+async def calcular_fluxo_maximo_cenario(
+    name: str,
+    origem_id: int = Query(..., description="ID do vértice de origem"),
+    destino_id: int = Query(..., description="ID do vértice de destino"),
+    solver: Optional[FlowSolver] = Query(None, description="Algoritmo de fluxo máximo (automático se omitido)")
+):
+    cenario = cenario_ou_404(name)
+    if origem_id == destino_id:
+        return {"scenario": name, "fluxo_maximo": 0}
+    key = ("cenario", cenario.id, cenario.revisao, origem_id, destino_id)
+    result = cache_resultados.get(key + (store.versao,))
+    if result is None:
+        versao, valor = await computacao.run(fluxo_maximo_cenario_consistente, cenario, origem_id, destino_id, solver)
+        result = {"scenario": name, "fluxo_maximo": valor}
+        cache_resultados.put(key + (versao,), result)
+    return result
+
+def relatorio_cenario_consistente(cenario, solver, offset, limit):
+    with rede_lock.read():
+        tracker = fluxo_do_cenario(
+            cenario,
+            store.vertices_do_tipo("storage", "Deposito"),
+            store.vertices_do_tipo("delivery_zone", "ZonaEntrega"),
+            solver,
+        )
+        return store.versao, relatorio_do_fluxo(tracker, offset, limit, capacidade_do_fluxo=True)
+
+@api.post("/scenarios/{name}/relatorio")
+async def relatorio_cenario(
+    request: Request,
+    name: str,
+    solver: Optional[FlowSolver] = Query(None, description="Algoritmo de fluxo máximo (automático se omitido)"),
+    paths_offset: int = Query(0, ge=0),
+    paths_limit: int = Query(FLOW_PATHS_PAGE, ge=1, le=MAX_FLOW_PATHS_PAGE),
+):
+    """Relatório automático (gargalos, ociosidade, caminhos) no cenário"""
+    cenario = cenario_ou_404(name)
+    key = ("relatorio_cenario", cenario.id, cenario.revisao, solver, paths_offset, paths_limit)
+    report = cache_resultados.get(key + (store.versao,))
+    if report is None:
+        versao, report = await computacao.run(relatorio_cenario_consistente, cenario, solver, paths_offset, paths_limit)
+        cache_resultados.put(key + (versao,), report)
+    return json_response(request, {**report, "scenario": name, "timestamp": datetime.now().isoformat()})
+
+@api.post("/network/import")
+async def import_network(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson ou binary (padrão: pelo Content-Type)")
+):
+    """Carrega vértices e arestas em lote; nada é inserido se alguma linha for inválida"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "binary" if content_type.startswith(bulk_io.BINARY_MEDIA_TYPE) else "ndjson"
 
+    loader = bulk_io.BulkLoader(Vertice, Aresta, store)
+    try:
+        if format == "binary":
+            for row in bulk_io.read_binary(await request.body()):
+                loader.add(row)
+        elif format == "ndjson":
+            async for row in bulk_io.iter_ndjson(request.stream()):
+                loader.add(row)
+        else:
+            raise ValueError(f"formato desconhecido: {format}")
+        novos_vertices, novas_arestas = loader.finish()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Erro na importação: {e}")
+
+    def aplicar():
+        with escrita_rede():
+            loader.assign_ids()
+            store.bulk_load(novos_vertices, novas_arestas)
+            fluxos_mantidos.clear()
+
+    # Com 504 a carga ainda termina de ser aplicada: a escrita não é interrompida
+    await computacao.run(aplicar, timeout=max(computacao.timeout, 300))
+
+    return {
+        "success": True,
+        "vertices": len(novos_vertices),
+        "arestas": len(novas_arestas),
+    }
+
+@api.get("/network/export")
+def export_network(
+    format: str = Query("ndjson", description="ndjson ou binary")
+):
+    """Exporta a rede atual em streaming, sem montar o CurrentStateResponse"""
+    with rede_lock.read():
+        vertices = store.list_vertices()
+        arestas = store.list_arestas()
+    if format == "binary":
+        return StreamingResponse(bulk_io.iter_binary(vertices, arestas), media_type=bulk_io.BINARY_MEDIA_TYPE)
+    if format == "ndjson":
+        return StreamingResponse(bulk_io.iter_ndjson_export(vertices, arestas), media_type=bulk_io.NDJSON_MEDIA_TYPE)
+    raise HTTPException(status_code=400, detail=f"Formato desconhecido: {format}")
+
+@api.post("/network/snapshot")
+def create_snapshot():
+    """Grava um snapshot da rede agora"""
+    if snapshots is None:
+        raise HTTPException(status_code=400, detail="Persistência desativada (defina DELIVERY_SNAPSHOT_DIR)")
+    path = salvar_snapshot()
+    return {"success": True, "versao": snapshots.versao_snapshot, "arquivo": os.path.basename(path)}
+
+@api.get("/network/cache")
+def cache_stats():
+    """Contadores do cache de resultados de fluxo e da fila de cálculos"""
+    return {
+        "versao": store.versao,
+        **cache_resultados.stats(),
+        "compute": computacao.stats(),
+        "ao_vivo": ao_vivo.stats(),
+        "respostas": respostas.stats(),
+        "estado_compartilhado": estado_compartilhado.stats(),
+        "pre_calculo": _rede_condensada[1].stats() if pre_calculo is not None and _rede_condensada else None,
+    }
+
+
+# Métricas
+
+# Perfil por requisição (cabeçalho X-Profile) só com DELIVERY_PROFILING=1
+PROFILING = os.environ.get("DELIVERY_PROFILING") == "1"
+perfis = metrics.ProfileStore()
+
+@api.middleware("http")
+async def medir_requisicao(request: Request, call_next):
+    perfil = None
+    if PROFILING and request.headers.get("x-profile") and metrics.Profiler.ocupado.acquire(blocking=False):
+        perfil = metrics.Profiler()
+        metrics.perfil_atual.set(perfil)
+        perfil.loop.enable()
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        if perfil is not None:
+            perfil.loop.disable()
+            metrics.Profiler.ocupado.release()
+        # O template da rota (não o caminho) mantém poucas séries por endpoint
+        rota = request.scope.get("route")
+        metrics.registry.observe(
+            "delivery_http_request_duration_seconds",
+            time.perf_counter() - inicio,
+            method=request.method,
+            route=rota.path if rota is not None else "desconhecida",
+            status=status,
+        )
+    if perfil is not None:
+        perfis.put(perfil)
+        response.headers["X-Profile-Id"] = str(perfil.id)
+        response.headers["X-Profile-Top"] = perfil.top().encode("ascii", "replace").decode()
+    return response
+
+def _por_cache(**valores):
+    return {(("cache", nome),): valor for nome, valor in valores.items()}
+
+metrics.registry.gauge("delivery_network_vertices", "Vértices na rede", lambda: len(store.vertices))
+metrics.registry.gauge("delivery_network_arestas", "Arestas na rede", lambda: len(store.arestas))
+metrics.registry.gauge("delivery_network_bloqueadas", "Rotas bloqueadas", lambda: len(store.bloqueadas))
+metrics.registry.gauge("delivery_network_versao", "Versão atual da rede", lambda: store.versao)
+metrics.registry.gauge("delivery_fluxos_mantidos", "Fluxos máximos mantidos em memória", lambda: len(fluxos_mantidos))
+metrics.registry.gauge("delivery_cenarios", "Cenários ativos", lambda: len(cenarios.list()))
+metrics.registry.gauge(
+    "delivery_cache_hits_total", "Acertos de cache",
+    lambda: _por_cache(resultados=cache_resultados.hits, respostas=respostas.hits), type="counter")
+metrics.registry.gauge(
+    "delivery_cache_misses_total", "Falhas de cache",
+    lambda: _por_cache(resultados=cache_resultados.misses), type="counter")
+metrics.registry.gauge(
+    "delivery_cache_hit_ratio", "Taxa de acerto do cache de resultados",
+    lambda: _por_cache(resultados=cache_resultados.stats()["hit_rate"]))
+metrics.registry.gauge(
+    "delivery_not_modified_total", "Respostas 304 por ETag", lambda: respostas.not_modified, type="counter")
+metrics.registry.gauge("delivery_compute_pending", "Cálculos na fila ou rodando", lambda: computacao.pending)
+metrics.registry.gauge(
+    "delivery_compute_rejected_total", "Cálculos recusados com a fila cheia", lambda: computacao.rejected, type="counter")
+metrics.registry.gauge(
+    "delivery_compute_timeouts_total", "Cálculos que estouraram o tempo máximo", lambda: computacao.timeouts, type="counter")
+metrics.registry.gauge("delivery_live_clients", "Clientes conectados no WebSocket", lambda: ao_vivo.stats()["clientes"])
+metrics.registry.gauge(
+    "delivery_shared_replayed_total", "Mutações de outros workers reaplicadas",
+    lambda: estado_compartilhado.stats().get("replayed", 0), type="counter")
+metrics.registry.gauge(
+    "delivery_shared_reloads_total", "Vezes que a rede inteira foi recarregada do estado compartilhado",
+    lambda: estado_compartilhado.stats().get("reloads", 0), type="counter")
+
+@api.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas no formato texto do Prometheus"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@api.get("/metrics/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: int):
+    """Resumo completo de um perfil pedido com o cabeçalho X-Profile"""
+    resumo = perfis.get(profile_id)
+    if resumo is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return PlainTextResponse(resumo)
 
 @api.get("/network/current-state", response_model=CurrentStateResponse)
-def get_current_state():
+def get_current_state(request: Request):
     """Endpoint para fornecer o estado atual da rede"""
-    # Use os dados globais atuais
-    response = {
+    # Os dados do store já foram validados na entrada: vão direto para orjson,
+    # com ETag pela versão da rede
+    return respostas.respond(request, "current-state", store.versao, estado_atual)
+
+def estado_atual():
+    with rede_lock.read():
+        versao = store.versao
+        vertices = [bulk_io.vertice_row(v) for v in store.vertices.values()]
+        arestas = [bulk_io.aresta_row(a) for a in store.arestas.values()]
+    return versao, {
         "vertices": vertices,
         "arestas": arestas,
         "grafo": {
             "vertices": [
-                {"id": v.vertice_id, "nome": v.name, "tipo": v.type}
+                {"id": v["vertice_id"], "nome": v["name"], "tipo": v["type"]}
                 for v in vertices
             ],
             "rotas": [
                 {
-                    "origem": a.origem_id,
-                    "destino": a.destino_id,
-                    "capacidade": a.capacidade,
-                    "aresta_id": a.aresta_id,      
-                    "uso": a.uso,                  
-                    "priority": a.priority 
+                    "origem": a["origem_id"],
+                    "destino": a["destino_id"],
+                    "capacidade": a["capacidade"],
+                    "aresta_id": a["aresta_id"],
+                    "uso": a["uso"],
+                    "priority": a["priority"],
                 }
                 for a in arestas
             ]
         }
     }
-    return response
-
-
-
-class Graph:
-    # Implementação similar à classe Graph do React
-    def __init__(self, n):
-        self.n = n
-        self.capacity = [[0] * n for _ in range(n)]
-        self.adj = [[] for _ in range(n)]
-    
-    def add_edge(self, u, v, cap):
-        self.capacity[u][v] += cap
-        self.adj[u].append(v)
-        self.adj[v].append(u)
-    
-    def bfs(self, s, t, parent):
-        visited = [False] * self.n
-        queue = deque([s])
-        visited[s] = True
-        parent[s] = -1
-        
-        while queue:
-            u = queue.popleft()
-            for v in self.adj[u]:
-                if not visited[v] and self.capacity[u][v] > 0:
-                    visited[v] = True
-                    parent[v] = u
-                    if v == t:
-                        return True
-                    queue.append(v)
-        return False
-    
-    def edmonds_karp(self, s, t):
-        parent = [-1] * self.n
-        max_flow = 0
-        
-        while self.bfs(s, t, parent):
-            path_flow = float('inf')
-            v = t
-            while v != s:
-                u = parent[v]
-                path_flow = min(path_flow, self.capacity[u][v])
-                v = u
-            
-            v = t
-            while v != s:
-                u = parent[v]
-                self.capacity[u][v] -= path_flow
-                self.capacity[v][u] += path_flow
-                v = u
-            
-            max_flow += path_flow
-        
-        return max_flow
-    
-    def get_flow_paths(self, s, t):
-        paths = []
-        parent = [-1] * self.n
-        while self.bfs(s, t, parent):
-            path = []
-            v = t
-            while v != s:
-                u = parent[v]
-                path.insert(0, (u, v))
-                v = u
-            paths.append(path)
-            path_flow = float('inf')
-            for u, v in path:
-                path_flow = min(path_flow, self.capacity[u][v])
-            for u, v in path:
-                self.capacity[u][v] -= path_flow
-                self.capacity[v][u] += path_flow
-        return paths
\ No newline at end of file
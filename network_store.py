@@ -0,0 +1,324 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import islice
+
+
+def _inserir(ordenada, item):
+    if not ordenada or ordenada[-1] < item:
+        ordenada.append(item)
+    else:
+        insort(ordenada, item)
+
+
+def _remover(ordenada, item):
+    i = bisect_left(ordenada, item)
+    if i < len(ordenada) and ordenada[i] == item:
+        del ordenada[i]
+
+
+def _pagina(candidatos, cursor, limit, filtro):
+    """Até ``limit`` ids de ``candidatos`` (ordenados) maiores que ``cursor`` e aceitos por ``filtro``.
+
+    Devolve ``(ids, proximo_cursor)``; o cursor é None na última página.
+    """
+    inicio = 0 if cursor is None else bisect_right(candidatos, cursor)
+    ids = []
+    for posicao in range(inicio, len(candidatos)):
+        i = candidatos[posicao]
+        if filtro(i):
+            if len(ids) == limit:
+                return ids, ids[-1]
+            ids.append(i)
+    return ids, None
+
+
+class NetworkStore:
+    """Estado da rede indexado por id.
+
+    Vértices e arestas ficam em dicionários (ordem de inserção preservada),
+    com índices secundários de arestas por origem, por destino e por
+    prioridade e de vértices por tipo, todos como listas de ids ordenadas,
+    prontas para a listagem paginada. Há ainda os ids em ordem e as arestas
+    por capacidade, também como listas ordenadas. Os ids são
+    alocados de forma monotônica e nunca são reaproveitados.
+    Toda mutação incrementa ``versao`` e é repassada aos ``listeners`` como
+    ``(operacao, argumentos, versao)``, o que permite registrar um log de mutações.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.vertices = {}
+        self.arestas = {}
+        self.bloqueadas = set()
+        self.versao = 0
+        self._saindo = defaultdict(list)
+        self._chegando = defaultdict(list)
+        self._por_tipo = defaultdict(list)
+        self._ordem_vertices = []
+        self._ordem_arestas = []
+        self._por_prioridade = defaultdict(list)
+        self._por_capacidade = []
+        # Ids de uma faixa de capacidade em ordem, reaproveitados entre páginas
+        self._faixa = None
+        self._proximo_vertice = 0
+        self._proximo_aresta = 1
+
+    def _mutou(self, operacao, *args):
+        self.versao += 1
+        for listener in self.listeners:
+            listener(operacao, args, self.versao)
+
+    # Vértices
+
+    def next_vertice_id(self):
+        vertice_id = self._proximo_vertice
+        self._proximo_vertice += 1
+        return vertice_id
+
+    def _indexar_vertice(self, vertice, ordenar=True):
+        antigo = self.vertices.get(vertice.vertice_id)
+        if ordenar:
+            if antigo is not None:
+                _remover(self._por_tipo[antigo.type], antigo.vertice_id)
+            else:
+                _inserir(self._ordem_vertices, vertice.vertice_id)
+            _inserir(self._por_tipo[vertice.type], vertice.vertice_id)
+        self.vertices[vertice.vertice_id] = vertice
+        self._proximo_vertice = max(self._proximo_vertice, vertice.vertice_id + 1)
+
+    def add_vertice(self, vertice):
+        self._indexar_vertice(vertice)
+        self._mutou("add_vertice", vertice)
+        return vertice
+
+    def get_vertice(self, vertice_id):
+        return self.vertices.get(vertice_id)
+
+    def update_vertice(self, vertice_id, name=None, type=None):
+        vertice = self.vertices.get(vertice_id)
+        if vertice is None:
+            return None
+        if name is not None:
+            vertice.name = name
+        if type is not None and type != vertice.type:
+            _remover(self._por_tipo[vertice.type], vertice_id)
+            vertice.type = type
+            _inserir(self._por_tipo[type], vertice_id)
+        self._mutou("update_vertice", vertice_id, name, type)
+        return vertice
+
+    def remove_vertice(self, vertice_id):
+        vertice = self.vertices.pop(vertice_id, None)
+        if vertice is not None:
+            _remover(self._por_tipo[vertice.type], vertice_id)
+            _remover(self._ordem_vertices, vertice_id)
+            self._mutou("remove_vertice", vertice_id)
+        return vertice
+
+    def vertices_do_tipo(self, *tipos):
+        return [vid for tipo in tipos for vid in self._por_tipo.get(tipo, ())]
+
+    def list_vertices(self, first_n=None):
+        if first_n:
+            return list(islice(self.vertices.values(), first_n))
+        return list(self.vertices.values())
+
+    def page_vertices(self, cursor=None, limit=100, type=None):
+        """Página de vértices em ordem de id, depois de ``cursor``, opcionalmente de um tipo."""
+        if type is not None:
+            ids, proximo = _pagina(self._por_tipo.get(type, []), cursor, limit, lambda i: True)
+        else:
+            ids, proximo = _pagina(self._ordem_vertices, cursor, limit, lambda i: True)
+        return [self.vertices[i] for i in ids], proximo
+
+    # Arestas
+
+    def next_aresta_id(self):
+        aresta_id = self._proximo_aresta
+        self._proximo_aresta += 1
+        return aresta_id
+
+    def _indexar_aresta(self, aresta, ordenar=True):
+        antiga = self.arestas.get(aresta.aresta_id)
+        if antiga is not None:
+            self._desindexar_aresta(antiga, ordenar)
+        elif ordenar:
+            _inserir(self._ordem_arestas, aresta.aresta_id)
+        self.arestas[aresta.aresta_id] = aresta
+        if ordenar:
+            _inserir(self._saindo[aresta.origem_id], aresta.aresta_id)
+            _inserir(self._chegando[aresta.destino_id], aresta.aresta_id)
+            _inserir(self._por_prioridade[int(aresta.priority)], aresta.aresta_id)
+            _inserir(self._por_capacidade, (aresta.capacidade, aresta.aresta_id))
+        self._proximo_aresta = max(self._proximo_aresta, aresta.aresta_id + 1)
+
+    def _desindexar_aresta(self, aresta, ordenar=True):
+        if ordenar:
+            _remover(self._saindo[aresta.origem_id], aresta.aresta_id)
+            _remover(self._chegando[aresta.destino_id], aresta.aresta_id)
+            _remover(self._por_prioridade[int(aresta.priority)], aresta.aresta_id)
+            _remover(self._por_capacidade, (aresta.capacidade, aresta.aresta_id))
+
+    def _reordenar(self):
+        # Cargas em lote indexam sem ordenar (insort seria quadrático) e reconstroem no fim
+        self._ordem_vertices = sorted(self.vertices)
+        self._ordem_arestas = sorted(self.arestas)
+        self._por_tipo = defaultdict(list)
+        for vertice_id in self._ordem_vertices:
+            self._por_tipo[self.vertices[vertice_id].type].append(vertice_id)
+        self._saindo = defaultdict(list)
+        self._chegando = defaultdict(list)
+        self._por_prioridade = defaultdict(list)
+        for aresta_id in self._ordem_arestas:
+            aresta = self.arestas[aresta_id]
+            self._saindo[aresta.origem_id].append(aresta_id)
+            self._chegando[aresta.destino_id].append(aresta_id)
+            self._por_prioridade[int(aresta.priority)].append(aresta_id)
+        self._por_capacidade = sorted((a.capacidade, a.aresta_id) for a in self.arestas.values())
+
+    def add_aresta(self, aresta):
+        self._indexar_aresta(aresta)
+        self._mutou("add_aresta", aresta)
+        return aresta
+
+    def get_aresta(self, aresta_id):
+        return self.arestas.get(aresta_id)
+
+    def update_aresta(self, aresta_id, **campos):
+        aresta = self.arestas.get(aresta_id)
+        if aresta is None:
+            return None
+        self._desindexar_aresta(aresta)
+        for campo, valor in campos.items():
+            if valor is not None:
+                setattr(aresta, campo, valor)
+        self._indexar_aresta(aresta)
+        self._mutou("update_aresta", aresta_id, campos)
+        return aresta
+
+    def remove_aresta(self, aresta_id):
+        aresta = self.arestas.pop(aresta_id, None)
+        if aresta is not None:
+            self._desindexar_aresta(aresta)
+            _remover(self._ordem_arestas, aresta_id)
+            self._mutou("remove_aresta", aresta_id)
+        return aresta
+
+    def arestas_saindo(self, vertice_id):
+        return [self.arestas[i] for i in self._saindo.get(vertice_id, ())]
+
+    def arestas_chegando(self, vertice_id):
+        return [self.arestas[i] for i in self._chegando.get(vertice_id, ())]
+
+    def list_arestas(self, first_n=None):
+        if first_n:
+            return list(islice(self.arestas.values(), first_n))
+        return list(self.arestas.values())
+
+    def page_arestas(self, cursor=None, limit=100, origem_id=None, destino_id=None,
+                     priority=None, min_capacidade=None, max_capacidade=None):
+        """Página de arestas em ordem de id, depois de ``cursor``, com filtros.
+
+        Os candidatos vêm do índice mais seletivo entre os filtros pedidos
+        (origem, destino, prioridade ou faixa de capacidade); os demais
+        filtros são conferidos aresta a aresta.
+        """
+        fontes = [(len(self._ordem_arestas), lambda: self._ordem_arestas)]
+        if origem_id is not None:
+            saindo = self._saindo.get(origem_id, [])
+            fontes.append((len(saindo), lambda: saindo))
+        if destino_id is not None:
+            chegando = self._chegando.get(destino_id, [])
+            fontes.append((len(chegando), lambda: chegando))
+        if priority is not None:
+            prioridade = self._por_prioridade.get(int(priority), [])
+            fontes.append((len(prioridade), lambda: prioridade))
+        if min_capacidade is not None or max_capacidade is not None:
+            inicio = 0 if min_capacidade is None else bisect_left(self._por_capacidade, (min_capacidade,))
+            fim = (len(self._por_capacidade) if max_capacidade is None
+                   else bisect_left(self._por_capacidade, (max_capacidade + 1,)))
+            fontes.append((max(fim - inicio, 0), lambda: self._ids_da_faixa(min_capacidade, max_capacidade, inicio, fim)))
+        _, candidatos = min(fontes, key=lambda fonte: fonte[0])
+
+        def filtro(i):
+            a = self.arestas[i]
+            return (
+                (origem_id is None or a.origem_id == origem_id)
+                and (destino_id is None or a.destino_id == destino_id)
+                and (priority is None or int(a.priority) == int(priority))
+                and (min_capacidade is None or a.capacidade >= min_capacidade)
+                and (max_capacidade is None or a.capacidade <= max_capacidade)
+            )
+
+        ids, proximo = _pagina(candidatos(), cursor, limit, filtro)
+        return [self.arestas[i] for i in ids], proximo
+
+    def _ids_da_faixa(self, min_capacidade, max_capacidade, inicio, fim):
+        # A faixa vem ordenada por capacidade; em ordem de id ela é montada
+        # uma vez por versão e filtros, não a cada página
+        chave = (self.versao, min_capacidade, max_capacidade)
+        if self._faixa is None or self._faixa[0] != chave:
+            self._faixa = (chave, sorted(i for _, i in self._por_capacidade[inicio:fim]))
+        return self._faixa[1]
+
+    def bulk_load(self, vertices, arestas):
+        """Insere (ou substitui, pelo id) vários vértices e arestas numa só mutação."""
+        for vertice in vertices:
+            self._indexar_vertice(vertice, ordenar=False)
+        for aresta in arestas:
+            self._indexar_aresta(aresta, ordenar=False)
+        self._reordenar()
+        self._mutou("bulk_load", vertices, arestas)
+
+    # Bloqueios
+
+    def set_bloqueio(self, key, bloqueada):
+        if bloqueada:
+            self.bloqueadas.add(key)
+        else:
+            self.bloqueadas.discard(key)
+        self._mutou("set_bloqueio", key, bloqueada)
+        return bloqueada
+
+    def toggle_bloqueio(self, key):
+        """Alterna o bloqueio da rota ``key`` e diz se ela ficou bloqueada."""
+        return self.set_bloqueio(key, key not in self.bloqueadas)
+
+    def proximos_ids(self):
+        """``(proximo_vertice, proximo_aresta)``: os ids que serão alocados a seguir."""
+        return self._proximo_vertice, self._proximo_aresta
+
+    def restore(self, versao, vertices, arestas, bloqueadas=(), proximos=None, notificar=False):
+        """Substitui todo o estado (ex.: ao carregar um snapshot).
+
+        ``proximos`` (de ``proximos_ids``) evita reaproveitar ids de itens já
+        removidos. Os listeners só recebem a operação ``"restore"``, sem
+        mudar a versão, com ``notificar``.
+        """
+        listeners = self.listeners
+        self.__init__()
+        self.listeners = listeners
+        for vertice in vertices:
+            self._indexar_vertice(vertice, ordenar=False)
+        for aresta in arestas:
+            self._indexar_aresta(aresta, ordenar=False)
+        self._reordenar()
+        self.bloqueadas = set(bloqueadas)
+        self.versao = versao
+        if proximos is not None:
+            self._proximo_vertice = max(self._proximo_vertice, proximos[0])
+            self._proximo_aresta = max(self._proximo_aresta, proximos[1])
+        if notificar:
+            for listener in self.listeners:
+                listener("restore", (), versao)
+
+    def reset(self, vertices=()):
+        # Os contadores de id sobrevivem ao reset: ids removidos não voltam
+        versao, listeners, proximos = self.versao, self.listeners, self.proximos_ids()
+        self.__init__()
+        self.versao, self.listeners = versao, listeners
+        self._proximo_vertice, self._proximo_aresta = proximos
+        for vertice in vertices:
+            self._indexar_vertice(vertice, ordenar=False)
+        self._reordenar()
+        self._mutou("reset", vertices)
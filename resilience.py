@@ -0,0 +1,91 @@
+"""Varredura N-1: quanto fluxo a rede perde sem cada rota (ou vértice).
+
+Só entram na varredura as arestas (ou vértices) por onde passa fluxo no
+resultado base: sem elas o fluxo atual continua válido, então a perda é zero
+e nada precisa ser resolvido. Cada candidato parte do fluxo base
+(``IncrementalMaxFlow.value_without``), cancelando e reaumentando só o que
+passava por ele. Os candidatos são divididos em blocos resolvidos no pool de
+processos de ``batch_flow``; cada processo desserializa o fluxo base uma única
+vez por chave.
+"""
+import pickle
+
+import batch_flow
+
+# Abaixo disso (candidatos x arestas) a varredura roda numa thread
+INLINE_WORK = batch_flow.INLINE_WORK
+
+_fluxos = {}
+
+
+def candidatos_arestas(tracker):
+    """``(chave, (chave,))`` de cada aresta com fluxo no resultado base."""
+    return [(key, (key,)) for key, fluxo in tracker.edge_flows().items() if fluxo > 0]
+
+
+def candidatos_vertices(tracker):
+    """``(vertice_id, chaves das arestas incidentes)`` de cada vértice com fluxo."""
+    ids = {i: vid for vid, i in tracker.index.items()}
+    fluxos = tracker.edge_flows()
+    incidentes = {}
+    for key, (u, v, _) in tracker.edges.items():
+        incidentes.setdefault(u, []).append(key)
+        incidentes.setdefault(v, []).append(key)
+    return [
+        (ids[i], tuple(keys))
+        for i, keys in incidentes.items()
+        if any(fluxos.get(key, 0) > 0 for key in keys)
+    ]
+
+
+def _avaliar(tracker, grupos):
+    return [(rotulo, tracker.value_without(keys)) for rotulo, keys in grupos]
+
+
+def sweep_chunk(chave, blob, grupos, fluxos=_fluxos):
+    """Resolve um bloco de ``(rotulo, chaves)`` dentro dos processos do pool.
+
+    O fluxo base desserializado fica em ``fluxos`` enquanto a chave
+    (versão da rede, terminais e bloqueios) for a mesma.
+    """
+    tracker = fluxos.get(chave)
+    if tracker is None:
+        fluxos.clear()
+        tracker = fluxos[chave] = pickle.loads(blob)
+    return _avaliar(tracker, grupos)
+
+
+async def sweep(calculos, tracker, chave, grupos):
+    """``(rotulo, fluxo restante)`` de cada grupo de arestas removido.
+
+    ``tracker`` precisa ser uma cópia (``fork``) que ninguém mais altera. Os
+    blocos passam por ``calculos`` (um ``compute.ComputeExecutor``).
+    """
+    if not grupos:
+        return []
+    if len(grupos) * max(tracker.graph.num_edges, 1) < INLINE_WORK:
+        return await calculos.run(_avaliar, tracker, grupos)
+
+    blob = await calculos.run(pickle.dumps, tracker, pickle.HIGHEST_PROTOCOL)
+    blocos = batch_flow.WORKERS * batch_flow.CHUNKS_PER_WORKER
+    tamanho = -(-len(grupos) // blocos)
+    chamadas = [(chave, blob, grupos[i:i + tamanho]) for i in range(0, len(grupos), tamanho)]
+    resultados = []
+    async for bloco in calculos.map(sweep_chunk, chamadas, process=True):
+        resultados.extend(bloco)
+    return resultados
+
+
+def ranking(base, resultados, limit=None):
+    """Candidatos ordenados pela perda de fluxo, da maior para a menor."""
+    linhas = [
+        {
+            "id": rotulo,
+            "fluxo_restante": restante,
+            "perda": base - restante,
+            "perda_percentual": round(100 * (base - restante) / base, 2) if base else 0.0,
+        }
+        for rotulo, restante in resultados
+    ]
+    linhas.sort(key=lambda linha: (-linha["perda"], str(linha["id"])))
+    return linhas[:limit] if limit is not None else linhas
@@ -0,0 +1,122 @@
+"""Cenários "e se" sobre a rede viva.
+
+Um cenário não copia a rede: ele só registra quais rotas bloqueia ou libera e
+quanto soma à capacidade de cada aresta. As consultas partem do fluxo mantido
+da rede base (``IncrementalMaxFlow.fork``) e reaplicam apenas as arestas que o
+cenário altera, então vários cenários convivem sem tocar no estado real.
+"""
+from itertools import count
+from threading import Lock
+
+_ids = count(1)
+
+
+def _route_key(aresta):
+    return f"{aresta.origem_id}-{aresta.destino_id}"
+
+
+class Scenario:
+    """Sobreposição de bloqueios e deltas de capacidade sobre a rede base."""
+
+    def __init__(self, name, bloqueadas=(), liberadas=(), deltas=None):
+        self.id = next(_ids)
+        self.name = name
+        self.bloqueadas = set(bloqueadas)
+        self.liberadas = set(liberadas) - self.bloqueadas
+        self.deltas = dict(deltas or {})
+        # Muda a cada alteração; junto com ``id`` identifica resultados em cache
+        self.revisao = 0
+
+    def bloqueios(self, base):
+        """Rotas bloqueadas no cenário, dado o conjunto bloqueado da rede base."""
+        return (set(base) | self.bloqueadas) - self.liberadas
+
+    def toggle_bloqueio(self, key, base):
+        if key in self.bloqueios(base):
+            self.bloqueadas.discard(key)
+            if key in base:
+                self.liberadas.add(key)
+            bloqueada = False
+        else:
+            self.liberadas.discard(key)
+            if key not in base:
+                self.bloqueadas.add(key)
+            bloqueada = True
+        self.revisao += 1
+        return bloqueada
+
+    def add_delta(self, aresta_id, delta):
+        self.deltas[aresta_id] = self.deltas.get(aresta_id, 0) + delta
+        self.revisao += 1
+
+    def capacidade(self, aresta, bloqueios):
+        """Capacidade efetiva da aresta no cenário."""
+        if _route_key(aresta) in bloqueios:
+            return 0
+        return max(0, aresta.capacidade + self.deltas.get(aresta.aresta_id, 0))
+
+    def arestas_alteradas(self, store):
+        """Arestas do store cuja capacidade no cenário pode diferir da base."""
+        ids = set(self.deltas)
+        for key in self.bloqueadas | self.liberadas:
+            origem = key.split("-", 1)[0]
+            if origem.isdigit():
+                ids.update(a.aresta_id for a in store.arestas_saindo(int(origem)) if _route_key(a) == key)
+        return [store.arestas[i] for i in ids if i in store.arestas]
+
+    def copy(self):
+        clone = Scenario.__new__(Scenario)
+        clone.__dict__.update(self.__dict__)
+        clone.bloqueadas = set(self.bloqueadas)
+        clone.liberadas = set(self.liberadas)
+        clone.deltas = dict(self.deltas)
+        return clone
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "revisao": self.revisao,
+            "blocked": sorted(self.bloqueadas),
+            "unblocked": sorted(self.liberadas),
+            "capacity_deltas": self.deltas,
+        }
+
+
+class ScenarioStore:
+    """Cenários por nome. As alterações passam por aqui, sob uma trava."""
+
+    def __init__(self, max_scenarios=64):
+        self.max_scenarios = max_scenarios
+        self._cenarios = {}
+        self._lock = Lock()
+
+    def create(self, name, bloqueadas=(), liberadas=(), deltas=None):
+        with self._lock:
+            if name in self._cenarios:
+                raise ValueError(f"cenário já existe: {name}")
+            if len(self._cenarios) >= self.max_scenarios:
+                raise OverflowError(f"limite de {self.max_scenarios} cenários atingido")
+            cenario = self._cenarios[name] = Scenario(name, bloqueadas, liberadas, deltas)
+            return cenario.copy()
+
+    def get(self, name):
+        """Cópia do cenário (ou None), segura para usar fora da trava."""
+        with self._lock:
+            cenario = self._cenarios.get(name)
+            return cenario.copy() if cenario is not None else None
+
+    def list(self):
+        with self._lock:
+            return [c.copy() for c in self._cenarios.values()]
+
+    def remove(self, name):
+        with self._lock:
+            return self._cenarios.pop(name, None)
+
+    def update(self, name, alterar):
+        """Aplica ``alterar(cenario)`` sob a trava e devolve o resultado."""
+        with self._lock:
+            cenario = self._cenarios.get(name)
+            if cenario is None:
+                raise KeyError(name)
+            return alterar(cenario)
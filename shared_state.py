@@ -0,0 +1,283 @@
+"""Estado da rede compartilhado entre processos (vários workers do uvicorn).
+
+Cada worker continua com o seu ``NetworkStore`` em memória, com os índices
+e os fluxos mantidos; o que é compartilhado é a sequência de mutações. No
+backend SQLite (um arquivo local em modo WAL, sem serviço externo) toda
+escrita roda numa transação ``BEGIN IMMEDIATE``, que serializa os
+escritores de todos os processos: o worker primeiro reaplica as mutações
+que ainda não viu, depois aplica a sua e a grava no log com a versão
+resultante. As versões do log são contíguas, então ``store.versao`` é a
+mesma em todos os workers para o mesmo estado, e caches e ETags por versão
+continuam valendo.
+
+Antes de cada requisição o worker confere se o banco mudou (``PRAGMA
+data_version``, sem ler as tabelas) e, havendo versão nova, reaplica o que
+falta pelos próprios métodos do store: os listeners (WebSocket, log) veem as
+mutações dos outros workers como se fossem locais. Quando o log cresce ele é
+compactado num estado base; um worker que ficou atrás da base recarrega a
+rede inteira.
+"""
+import os
+import secrets
+import sqlite3
+from contextlib import contextmanager
+from threading import Lock
+
+import orjson
+
+import bulk_io
+from snapshot import MutationCodec
+
+# Segundos esperando outro processo terminar a escrita dele
+BUSY_TIMEOUT = float(os.environ.get("DELIVERY_SHARED_BUSY_TIMEOUT", "30"))
+# Mutações no log antes de compactar num estado base
+COMPACT_EVERY = int(os.environ.get("DELIVERY_SHARED_COMPACT_EVERY", "10000"))
+# Operações que reescrevem boa parte da rede: mais barato compactar logo
+_OPERACOES_GRANDES = ("bulk_load", "reset")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS mutacoes (versao INTEGER PRIMARY KEY, entrada BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS base ("
+    " id INTEGER PRIMARY KEY CHECK (id = 1), versao INTEGER NOT NULL,"
+    " proximo_vertice INTEGER NOT NULL, proximo_aresta INTEGER NOT NULL,"
+    " rede BLOB NOT NULL, bloqueadas BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS epoca (id INTEGER PRIMARY KEY CHECK (id = 1), valor TEXT NOT NULL)",
+)
+
+
+class LocalState:
+    """Padrão: só este processo altera a rede e não há nada para sincronizar."""
+
+    shared = False
+    epoch = None
+
+    def start(self, store, acompanhar):
+        pass
+
+    @contextmanager
+    def transaction(self, store, acompanhar):
+        yield
+
+    def behind(self, versao):
+        return False
+
+    def sync(self, store, acompanhar):
+        pass
+
+    def stats(self):
+        return {"backend": "local"}
+
+    def close(self):
+        pass
+
+
+class SQLiteState:
+    """Log de mutações num banco SQLite em modo WAL, compartilhado pelos workers.
+
+    ``acompanhar(operacao, args)`` é chamado depois de cada mutação vinda do
+    banco (já aplicada no store), com os argumentos em JSON; ``"restore"``
+    indica que a rede inteira foi recarregada.
+    """
+
+    shared = True
+
+    def __init__(self, path, codec, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.codec = codec
+        self.compact_every = compact_every
+        self.replayed = 0
+        self.commits = 0
+        self.compactions = 0
+        self.reloads = 0
+        self._db = self._conectar()
+        self._leitura = self._conectar()
+        self._lock = Lock()
+        self._leitura_lock = Lock()
+        self._data_version = None
+        self._versao_vista = 0
+        self._versao_base = 0
+        self._gravando = None
+        self._grande = False
+        self._recarregar = True
+        self.epoch = self._epoca()
+
+    def _conectar(self):
+        # isolation_level=None: as transações são abertas explicitamente
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _epoca(self):
+        # Igual em todos os workers e enquanto o banco existir, como as versões
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for comando in _SCHEMA:
+                    self._db.execute(comando)
+                self._db.execute("INSERT OR IGNORE INTO epoca VALUES (1, ?)", (secrets.token_hex(4),))
+                (epoca,) = self._db.execute("SELECT valor FROM epoca").fetchone()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return epoca
+
+    def start(self, store, acompanhar):
+        """Entra no estado compartilhado; chamar com a trava de escrita local.
+
+        Num banco novo a rede atual deste worker vira a base; senão a rede
+        local é trocada pela do banco.
+        """
+        store.listeners.append(self._registrar)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for comando in _SCHEMA:
+                    self._db.execute(comando)
+                if self._db.execute("SELECT versao FROM base").fetchone() is None:
+                    self._gravar_base(store)
+                    self._recarregar = False
+                else:
+                    self._alcancar(store, acompanhar)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # Escrita
+
+    def _registrar(self, operacao, args, versao):
+        # Mutações reaplicadas do banco acontecem fora de uma transação
+        if self._gravando is not None:
+            self._gravando.append((versao, self.codec.encode(operacao, args, versao)))
+            self._grande = self._grande or operacao in _OPERACOES_GRANDES
+
+    @contextmanager
+    def transaction(self, store, acompanhar):
+        """Escrita exclusiva entre todos os processos; chamar com a trava de escrita local.
+
+        As mutações feitas no ``store`` dentro do bloco vão para o log mesmo
+        que o bloco termine com exceção: o store local já mudou. Ids novos
+        (``next_vertice_id``/``next_aresta_id``) só podem ser alocados dentro
+        do bloco: antes dele o store ainda não viu as mutações dos outros
+        workers, e um ``restore`` recria os contadores.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._alcancar(store, acompanhar)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._gravando, self._grande = [], False
+            try:
+                yield
+            finally:
+                linhas, self._gravando = self._gravando, None
+                try:
+                    if linhas:
+                        self._db.executemany("INSERT INTO mutacoes (versao, entrada) VALUES (?, ?)", linhas)
+                        if self._grande or store.versao - self._versao_base >= self.compact_every:
+                            self._gravar_base(store)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    # O store local tem mutações que não foram para o banco
+                    self._recarregar = True
+                    raise
+                if linhas:
+                    self.commits += 1
+                    self._versao_vista = max(self._versao_vista, store.versao)
+
+    def _gravar_base(self, store):
+        rede = b"".join(bulk_io.iter_binary(store.list_vertices(), store.list_arestas()))
+        self._db.execute(
+            "INSERT OR REPLACE INTO base VALUES (1, ?, ?, ?, ?, ?)",
+            (store.versao, *store.proximos_ids(), rede, orjson.dumps(sorted(store.bloqueadas))),
+        )
+        self._db.execute("DELETE FROM mutacoes WHERE versao <= ?", (store.versao,))
+        self._versao_base = store.versao
+        self.compactions += 1
+
+    # Leitura
+
+    def behind(self, versao):
+        """Se o banco tem uma versão mais nova que ``versao``; quase de graça se nada mudou."""
+        with self._leitura_lock:
+            data_version = self._leitura.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                (maior,) = self._leitura.execute(
+                    "SELECT max(versao) FROM (SELECT max(versao) AS versao FROM mutacoes"
+                    " UNION ALL SELECT versao FROM base)"
+                ).fetchone()
+                self._versao_vista = max(self._versao_vista, maior or 0)
+        return self._recarregar or self._versao_vista > versao
+
+    def sync(self, store, acompanhar):
+        """Traz o ``store`` até a última versão do banco; chamar com a trava de escrita local."""
+        with self._lock:
+            # Uma transação de leitura: base e log da mesma versão do banco
+            self._db.execute("BEGIN")
+            try:
+                self._alcancar(store, acompanhar)
+            finally:
+                self._db.execute("COMMIT")
+
+    def _alcancar(self, store, acompanhar):
+        base = self._db.execute("SELECT * FROM base").fetchone()
+        if base is not None:
+            _, versao, proximo_vertice, proximo_aresta, rede, bloqueadas = base
+            self._versao_base = versao
+            if self._recarregar or store.versao < versao:
+                vertices, arestas = self.codec.models(list(bulk_io.read_binary(rede)))
+                store.restore(
+                    versao, vertices, arestas, orjson.loads(bloqueadas),
+                    proximos=(proximo_vertice, proximo_aresta), notificar=True,
+                )
+                self.reloads += 1
+                acompanhar("restore", ())
+        self._recarregar = False
+        for (entrada,) in self._db.execute(
+            "SELECT entrada FROM mutacoes WHERE versao > ? ORDER BY versao", (store.versao,)
+        ):
+            entrada = orjson.loads(entrada)
+            self.codec.apply(store, entrada)
+            acompanhar(entrada["op"], entrada["args"])
+            self.replayed += 1
+        self._versao_vista = max(self._versao_vista, store.versao)
+
+    def stats(self):
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "versao_base": self._versao_base,
+            "replayed": self.replayed,
+            "commits": self.commits,
+            "compactions": self.compactions,
+            "reloads": self.reloads,
+        }
+
+    def close(self):
+        with self._lock, self._leitura_lock:
+            self._db.close()
+            self._leitura.close()
+
+
+BACKENDS = {"sqlite": SQLiteState}
+
+
+def open_state(url, vertice_model, aresta_model):
+    """Backend de ``DELIVERY_SHARED_STATE``: vazio é só local; ``sqlite://<caminho>`` usa um banco.
+
+    Ex.: ``sqlite:///var/lib/delivery/rede.db`` (caminho absoluto) ou
+    ``sqlite://rede.db`` (relativo ao diretório de trabalho).
+    """
+    if not url:
+        return LocalState()
+    esquema, separador, caminho = url.partition("://")
+    backend = BACKENDS.get(esquema)
+    if backend is None or not separador or not caminho:
+        raise ValueError(f"Estado compartilhado desconhecido: {url}")
+    return backend(caminho, MutationCodec(vertice_model, aresta_model))
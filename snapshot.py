@@ -0,0 +1,292 @@
+"""Persistência da rede: snapshots binários mais um log de mutações.
+
+Um snapshot guarda o estado completo do ``NetworkStore`` (no formato colunar
+de ``bulk_io``), os próximos ids a alocar, as rotas bloqueadas e o fluxo por
+aresta dos fluxos mantidos.
+Na partida o snapshot mais recente é mapeado em memória e decodificado direto
+do ``mmap``. As mutações feitas depois dele ficam num log NDJSON só de
+acréscimo, reaplicado em ordem de versão.
+"""
+import glob
+import mmap
+import os
+import secrets
+import struct
+from threading import Lock
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+import bulk_io
+
+MAGIC = b"DOPTSNAP"
+FORMAT_VERSION = 2
+# Formato 1: sem os próximos ids no cabeçalho
+FORMATOS_LIDOS = (1, 2)
+
+_HEADER = struct.Struct("<8sIQ")
+_PROXIMOS = struct.Struct("<qq")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_LEN = struct.Struct("<H")
+
+
+def _strings(values):
+    parts = [_U32.pack(len(values))]
+    for value in values:
+        raw = value.encode("utf-8")
+        parts.append(_LEN.pack(len(raw)) + raw)
+    return b"".join(parts)
+
+
+def _read_strings(data, pos):
+    (count,) = _U32.unpack_from(data, pos)
+    pos += _U32.size
+    values = []
+    for _ in range(count):
+        (size,) = _LEN.unpack_from(data, pos)
+        pos += _LEN.size
+        values.append(bytes(data[pos:pos + size]).decode("utf-8"))
+        pos += size
+    return values, pos
+
+
+def _ints(values):
+    return _U32.pack(len(values)) + bulk_io.pack_column("q", values)
+
+
+def _read_ints(data, pos):
+    (count,) = _U32.unpack_from(data, pos)
+    col, pos = bulk_io.unpack_column("q", data, pos + _U32.size, count)
+    return list(col), pos
+
+
+def _jsonable(arg):
+    if hasattr(arg, "origem_id"):
+        return bulk_io.aresta_row(arg)
+    if hasattr(arg, "vertice_id"):
+        return bulk_io.vertice_row(arg)
+    if isinstance(arg, (list, tuple)):
+        return [_jsonable(a) for a in arg]
+    return arg
+
+
+class MutationCodec:
+    """Mutações do ``NetworkStore`` como JSON (``{"v", "op", "args"}``) e de volta.
+
+    Usado pelo log de mutações dos snapshots e pelo estado compartilhado
+    entre workers (``shared_state``).
+    """
+
+    def __init__(self, vertice_model, aresta_model):
+        self.vertice_model = vertice_model
+        self.aresta_model = aresta_model
+        self.vertices = TypeAdapter(List[vertice_model])
+        self.arestas = TypeAdapter(List[aresta_model])
+
+    @staticmethod
+    def encode(operacao, args, versao):
+        return orjson.dumps({"v": versao, "op": operacao, "args": _jsonable(args)})
+
+    def models(self, rows):
+        """Linhas de ``bulk_io`` para ``(vertices, arestas)``."""
+        vertices = self.vertices.validate_python([r for r in rows if "vertice_id" in r])
+        arestas = self.arestas.validate_python([r for r in rows if "aresta_id" in r])
+        return vertices, arestas
+
+    def apply(self, store, entrada):
+        """Reaplica uma mutação no ``store``, que fica na versão dela."""
+        op, args = entrada["op"], entrada["args"]
+        if op in ("add_vertice", "add_aresta"):
+            adapter = self.arestas if op == "add_aresta" else self.vertices
+            getattr(store, op)(adapter.validate_python(args)[0])
+        elif op == "update_aresta":
+            aresta_id, campos = args
+            atual = store.get_aresta(aresta_id)
+            if atual is not None:
+                row = {**bulk_io.aresta_row(atual), **{k: v for k, v in campos.items() if v is not None}}
+                store.add_aresta(self.aresta_model.model_validate(row))
+        elif op == "bulk_load":
+            store.bulk_load(self.vertices.validate_python(args[0]), self.arestas.validate_python(args[1]))
+        elif op == "reset":
+            store.reset(self.vertices.validate_python(args[0]))
+        else:
+            getattr(store, op)(*args)
+        store.versao = entrada["v"]
+
+
+class SnapshotManager:
+    """Escreve e carrega snapshots e mantém o log de mutações em ``directory``."""
+
+    def __init__(self, directory, vertice_model, aresta_model, keep=3):
+        self.directory = directory
+        self.keep = keep
+        self.codec = MutationCodec(vertice_model, aresta_model)
+        self.versao_snapshot = None
+        self._lock = Lock()
+        self._escrita = Lock()
+        self._log = None
+        os.makedirs(directory, exist_ok=True)
+        self.epoch = self._epoca()
+
+    def _epoca(self):
+        # Identifica este diretório: as versões só continuam enquanto ele existir
+        path = os.path.join(self.directory, "epoca")
+        try:
+            with open(path, "x") as f:
+                epoca = secrets.token_hex(4)
+                f.write(epoca)
+                return epoca
+        except FileExistsError:
+            with open(path) as f:
+                return f.read().strip()
+
+    def _path(self, prefixo, versao, extensao):
+        return os.path.join(self.directory, f"{prefixo}-{versao:012d}.{extensao}")
+
+    def _arquivos(self, prefixo, extensao):
+        return sorted(glob.glob(os.path.join(self.directory, f"{prefixo}-*.{extensao}")))
+
+    @staticmethod
+    def _versao_do_arquivo(path):
+        return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+    # Log de mutações
+
+    def attach(self, store):
+        """Passa a registrar no log toda mutação do ``store``."""
+        self._abrir_log(store.versao)
+        store.listeners.append(self._registrar)
+
+    def _abrir_log(self, versao):
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._path("mutacoes", versao, "ndjson"), "ab")
+
+    def _registrar(self, operacao, args, versao):
+        linha = self.codec.encode(operacao, args, versao)
+        with self._lock:
+            self._log.write(linha + b"\n")
+            self._log.flush()
+
+    # Snapshots
+
+    def write(self, store, fluxos=()):
+        """Grava um snapshot do ``store`` e dos fluxos mantidos.
+
+        ``fluxos`` é uma sequência de ``((origens, destinos, bloqueadas), fluxo_por_aresta)``.
+        """
+        with self._escrita:
+            versao = store.versao
+            vertices = store.list_vertices()
+            arestas = store.list_arestas()
+            bloqueadas = sorted(store.bloqueadas)
+
+            rede = b"".join(bulk_io.iter_binary(vertices, arestas))
+            path = self._path("snapshot", versao, "bin")
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, versao))
+                f.write(_PROXIMOS.pack(*store.proximos_ids()))
+                f.write(_U64.pack(len(rede)))
+                f.write(rede)
+                f.write(_strings(bloqueadas))
+                fluxos = list(fluxos)
+                f.write(_U32.pack(len(fluxos)))
+                for (origens, destinos, bloqueios), por_aresta in fluxos:
+                    chaves = list(por_aresta)
+                    f.write(_ints(list(origens)))
+                    f.write(_ints(list(destinos)))
+                    f.write(_strings(sorted(bloqueios)))
+                    f.write(_ints(chaves))
+                    f.write(bulk_io.pack_column("q", [por_aresta[k] for k in chaves]))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+            # Mutações com versão maior que a do snapshot vão para um log novo
+            with self._lock:
+                self.versao_snapshot = versao
+                if self._log is not None:
+                    self._abrir_log(versao)
+            self._podar()
+            return path
+
+    def _podar(self):
+        snapshots = self._arquivos("snapshot", "bin")
+        for path in snapshots[:-self.keep]:
+            os.remove(path)
+        # Os logs depois do snapshot mais antigo mantido ficam: se os mais
+        # novos estiverem corrompidos, a carga volta a ele e reaplica tudo
+        mais_antigo = self._versao_do_arquivo(snapshots[-self.keep:][0])
+        for path in self._arquivos("mutacoes", "ndjson"):
+            if self._versao_do_arquivo(path) < mais_antigo:
+                os.remove(path)
+
+    def _ler(self, path):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as data:
+                magic, formato, versao = _HEADER.unpack_from(data, 0)
+                if magic != MAGIC or formato not in FORMATOS_LIDOS:
+                    raise ValueError(f"snapshot inválido: {path}")
+                pos = _HEADER.size
+                proximos = None
+                if formato >= 2:
+                    proximos = _PROXIMOS.unpack_from(data, pos)
+                    pos += _PROXIMOS.size
+                (tamanho,) = _U64.unpack_from(data, pos)
+                pos += _U64.size
+                rows = list(bulk_io.read_binary(data[pos:pos + tamanho]))
+                pos += tamanho
+                bloqueadas, pos = _read_strings(data, pos)
+
+                (quantos,) = _U32.unpack_from(data, pos)
+                pos += _U32.size
+                fluxos = []
+                for _ in range(quantos):
+                    origens, pos = _read_ints(data, pos)
+                    destinos, pos = _read_ints(data, pos)
+                    bloqueios, pos = _read_strings(data, pos)
+                    chaves, pos = _read_ints(data, pos)
+                    valores, pos = bulk_io.unpack_column("q", data, pos, len(chaves))
+                    fluxos.append((
+                        (tuple(origens), tuple(destinos), frozenset(bloqueios)),
+                        dict(zip(chaves, valores)),
+                    ))
+
+        vertices, arestas = self.codec.models(rows)
+        return versao, proximos, vertices, arestas, bloqueadas, fluxos
+
+    def load_latest(self, store):
+        """Restaura o snapshot mais recente e reaplica o log depois dele.
+
+        Devolve os fluxos mantidos salvos no snapshot, ou uma lista vazia se
+        houve mutações depois dele (o fluxo salvo já não corresponde à rede).
+        """
+        fluxos = []
+        versao_base = 0
+        for path in reversed(self._arquivos("snapshot", "bin")):
+            try:
+                versao, proximos, vertices, arestas, bloqueadas, fluxos = self._ler(path)
+            except (ValueError, struct.error):
+                continue
+            store.restore(versao, vertices, arestas, bloqueadas, proximos=proximos)
+            self.versao_snapshot = versao_base = versao
+            break
+
+        entradas = []
+        for path in self._arquivos("mutacoes", "ndjson"):
+            with open(path, "rb") as f:
+                for linha in f:
+                    try:
+                        entrada = orjson.loads(linha)
+                    except orjson.JSONDecodeError:
+                        # Última linha truncada por uma queda no meio da escrita
+                        continue
+                    if entrada["v"] > versao_base:
+                        entradas.append(entrada)
+        entradas.sort(key=lambda e: e["v"])
+        for entrada in entradas:
+            self.codec.apply(store, entrada)
+        return [] if entradas else fluxos
@@ -1,4 +1,4 @@
-import React, { useEffect, useMemo, useState } from 'react';
+import React, { useEffect, useMemo, useRef, useState } from 'react';
 import { MapContainer, TileLayer, Polyline, Marker, Popup } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
@@ -183,6 +183,29 @@ const COORDS = {
   2: { lat: -9.6450, lng: -35.7050 }, // Zona de Entrega 1
 };
 
+// Monta o grafo a partir das linhas de vértices e arestas recebidas pelo WebSocket
+const montarGrafo = (vertices, arestas) => {
+  const g = new Grafo();
+  vertices.forEach(v => {
+    let vertice;
+    switch (v.type) {
+      case 'storage': vertice = new Deposito(v.vertice_id, v.name); break;
+      case 'hub': vertice = new Hub(v.vertice_id, v.name); break;
+      case 'delivery_zone': vertice = new ZonaEntrega(v.vertice_id, v.name); break;
+      default: vertice = new Vertice(v.vertice_id, v.name);
+    }
+    g.adicionarVertice(vertice);
+  });
+  arestas.forEach(a => {
+    const origem = g.vertices.get(a.origem_id);
+    const destino = g.vertices.get(a.destino_id);
+    if (origem && destino) {
+      g.adicionarRota(new Rota(origem, destino, a.capacidade, a.uso || 0, a.aresta_id, a.priority));
+    }
+  });
+  return g;
+};
+
 export default function App() {
   const [grafo, setGrafo] = useState(new Grafo());
   const [blocked, setBlocked] = useState([]);
@@ -192,6 +215,8 @@ export default function App() {
   const [newRoute, setNewRoute] = useState({ from: '', to: '', capacity: 0, uso: 0 });
   const [editRota, setEditRota] = useState({});
   const [selectedEditRota, setSelectedEditRota] = useState('');
+  const [liveFlow, setLiveFlow] = useState(null);
+  const liveRows = useRef({ vertices: new Map(), arestas: new Map() });
 
   const toggleBlock = async (from, to) => {
     if (loading) return;
@@ -558,6 +583,48 @@ const fetchCurrentState = async () => {
     loadInitialData();
   }, []);
 
+  // Atualizações em tempo real: snapshot na conexão e depois só os diffs
+  useEffect(() => {
+    let socket;
+    let retry;
+    const conectar = () => {
+      socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/network`);
+      socket.onmessage = (event) => {
+        const msg = JSON.parse(event.data);
+        const rows = liveRows.current;
+        if (msg.type === 'snapshot') {
+          rows.vertices = new Map(msg.vertices.map(v => [v.vertice_id, v]));
+          rows.arestas = new Map(msg.arestas.map(a => [a.aresta_id, a]));
+          rows.fluxos = msg.fluxos;
+          rows.corte = new Set(msg.corte);
+        } else {
+          (msg.vertices || []).forEach(v => rows.vertices.set(v.vertice_id, v));
+          (msg.vertices_removidos || []).forEach(id => rows.vertices.delete(id));
+          (msg.arestas || []).forEach(a => rows.arestas.set(a.aresta_id, a));
+          (msg.arestas_removidas || []).forEach(id => { rows.arestas.delete(id); delete rows.fluxos[id]; });
+          Object.assign(rows.fluxos, msg.fluxos || {});
+          (msg.corte_entrou || []).forEach(id => rows.corte.add(id));
+          (msg.corte_saiu || []).forEach(id => rows.corte.delete(id));
+        }
+        if (msg.bloqueadas) setBlocked(msg.bloqueadas);
+        if (msg.type === 'snapshot' || msg.vertices || msg.arestas || msg.vertices_removidos || msg.arestas_removidas) {
+          setGrafo(montarGrafo(Array.from(rows.vertices.values()), Array.from(rows.arestas.values())));
+        }
+        setLiveFlow(prev => ({
+          maxFlow: msg.max_flow !== undefined ? msg.max_flow : prev && prev.maxFlow,
+          gargalos: rows.corte.size,
+        }));
+      };
+      socket.onclose = () => { retry = setTimeout(conectar, 3000); };
+    };
+    conectar();
+    return () => {
+      clearTimeout(retry);
+      socket.onclose = null;
+      socket.close();
+    };
+  }, []);
+
   // Função para teste de stress
   const runStressTest = () => {
     setLoading(true);
@@ -810,13 +877,18 @@ const fetchCurrentState = async () => {
       <Card>
         <CardContent>
           <h3 className="text-lg font-semibold mb-2">Relatório Automático</h3>
+          {liveFlow && (
+            <p>
+              <strong>Fluxo Máximo (ao vivo):</strong> {liveFlow.maxFlow} ({liveFlow.gargalos} rotas no corte mínimo)
+            </p>
+          )}
           {report ? (
             <div>
               <p>
                 <strong>Data:</strong> {report.timestamp}
               </p>
               <p>
-                <strong>Gargalos (Capacidade > 10):</strong>
+                <strong>Gargalos (corte mínimo):</strong>
               </p>
               <ul>
                 {(report.bottlenecks || []).map((rota, idx) => (
@@ -833,7 +905,7 @@ const fetchCurrentState = async () => {
                 {(report.bottlenecks || []).length === 0 && <li>Nenhum gargalo detectado.</li>}
               </ul>
               <p>
-                <strong>Capacidade Ociosa (Capacidade &lt; 7):</strong>
+                <strong>Capacidade Ociosa (folga no fluxo máximo):</strong>
               </p>
               <ul>
                 {(report.idleCapacity || []).map((rota, idx) => (
@@ -858,7 +930,7 @@ const fetchCurrentState = async () => {
               <ul>
                 {(report.flowPaths || []).map((path, idx) => (
                   <li key={idx}>
-                    Caminho {idx + 1}: {path.map(([u, v]) => {
+                    Caminho {idx + 1} ({path.fluxo} un.): {path.caminho.map(([u, v]) => {
                       const nodeU = Array.from(grafo.vertices.values())[u];
                       const nodeV = Array.from(grafo.vertices.values())[v];
                       return `${nodeU?.nome || u} -> ${nodeV?.nome || v}`;